@@ -0,0 +1,101 @@
+"""
+Benchmark: loading scraped SKU rows, pandas to_sql vs db.bulk_write.
+
+    cd server && python benchmarks/bench_bulk_load.py [--rows 100000] [--skus 4] [--database-url URL]
+
+Without --database-url a throwaway SQLite file is used; pass a Postgres URL
+to time the COPY path (the benchmark empties goods/skus/sku_prices there).
+The same normalized goods / skus / sku_prices records are written through
+df.to_sql(chunksize=500), the way merges used to load, and through
+db.bulk_write; then a full catalog.merge_goods_rows of the flat rows into
+empty tables is timed as well.
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+CATALOG_TABLES = ["sku_prices", "skus", "goods_summary", "goods"]
+
+
+def clear_tables(db, text):
+    with db.get_connection() as conn:
+        for table in CATALOG_TABLES:
+            conn.execute(text(f"DELETE FROM {table}"))
+        conn.commit()
+
+
+def normalized_records(catalog, rows):
+    goods, skus, prices = [], [], []
+    for goods_id, group in catalog.group_rows_by_id(rows).items():
+        goods_record, sku_records, price_records = catalog.split_goods_rows(goods_id, group)
+        goods.append(goods_record)
+        skus.extend(sku_records)
+        prices.extend(price_records)
+    return goods, skus, prices
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=100000, help="SKU rows to load")
+    parser.add_argument("--skus", type=int, default=4, help="SKUs per goods")
+    parser.add_argument("--database-url", default=None)
+    args = parser.parse_args()
+
+    if args.database_url:
+        os.environ["DATABASE_URL"] = args.database_url
+    else:
+        os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tempfile.mkdtemp(), "bench.db")
+
+    # db builds its engine from DATABASE_URL at import time
+    import pandas as pd
+    from sqlalchemy import text
+    import db
+    import catalog
+    from bench_goods_assembler import make_rows
+
+    db.init_tables()
+    rows = make_rows(args.rows // args.skus, args.skus)
+    goods, skus, prices = normalized_records(catalog, rows)
+    sku_cols = ["编号", "goods_id", "position", "SKU"] + catalog.SKU_INT_FIELDS + catalog.SKU_PRICE_FIELDS
+    goods_cols = ["ID", "id_num"] + catalog.GOODS_FIELDS
+    price_cols = ["sku", "tenancy_days", "rent"]
+    print(f"{db.engine.dialect.name}: {len(goods)} goods, {len(skus)} SKUs, {len(prices)} rents")
+
+    clear_tables(db, text)
+    start = time.perf_counter()
+    with db.get_connection() as conn:
+        pd.DataFrame(goods, columns=goods_cols).to_sql("goods", conn, if_exists="append", index=False, chunksize=500)
+        pd.DataFrame(skus, columns=sku_cols).to_sql("skus", conn, if_exists="append", index=False, chunksize=500)
+        pd.DataFrame(prices, columns=price_cols).to_sql("sku_prices", conn, if_exists="append", index=False, chunksize=500)
+        conn.commit()
+    to_sql_s = time.perf_counter() - start
+
+    clear_tables(db, text)
+    start = time.perf_counter()
+    with db.get_connection() as conn:
+        db.bulk_write(conn, "goods", goods_cols, goods)
+        db.bulk_write(conn, "skus", sku_cols, skus)
+        db.bulk_write(conn, "sku_prices", price_cols, prices)
+        conn.commit()
+    bulk_s = time.perf_counter() - start
+
+    clear_tables(db, text)
+    start = time.perf_counter()
+    with db.get_connection() as conn:
+        stats = catalog.merge_goods_rows(conn, rows)
+        conn.commit()
+    merge_s = time.perf_counter() - start
+
+    print(f"{'path':<34} {'seconds':>8} {'rows/s':>10}")
+    for name, seconds in [("df.to_sql(chunksize=500)", to_sql_s), ("db.bulk_write", bulk_s)]:
+        print(f"{name:<34} {seconds:>8.2f} {len(skus) / seconds:>10,.0f}")
+    print(f"{'merge_goods_rows (parse+hash+load)':<34} {merge_s:>8.2f} {len(rows) / merge_s:>10,.0f}  {stats}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+Micro-benchmark: /goods group assembly, streaming assembler vs the old pandas path.
+
+    cd server && python benchmarks/bench_goods_assembler.py [--skus 4] [--repeat 3]
+
+Rows are synthetic flat rows shaped like catalog.iter_flat_rows output, so
+only the assembly step is timed (no database).
+"""
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pandas as pd
+import catalog
+
+SIZES = [50, 500, 10000]
+RENT_DAYS = [1, 3, 7, 15, 30]
+
+
+def make_rows(goods_count, skus_per_goods):
+    rows = []
+    for g in range(goods_count):
+        goods_id = str(100000 + g)
+        for p in range(skus_per_goods):
+            row = {
+                "ID": goods_id, "商品名称": f"商品 {g}", "短标题": "", "是否同步支付宝": "是",
+                "最近提交时间": "2024-01-01 10:00", "商品图片": "https://img.example/x.png",
+                "1级分类": "数码", "2级分类": "相机", "3级分类": "运动相机",
+                "SKU": f"规格 {p}", "编号": f"{goods_id}-{p}", "库存": str(p * 3),
+            }
+            for days in RENT_DAYS:
+                row[catalog.rent_column(days)] = f"{days * 1.5:.2f}"
+            for col in catalog.SKU_PRICE_FIELDS:
+                row[col] = "999.00"
+            row["merchant"] = "M1"
+            row["支付宝编码"] = ""
+            rows.append(row)
+    return rows
+
+
+def pandas_groups(rows, ids):
+    # The get_goods assembly as it was before the streaming assembler
+    df = pd.DataFrame(rows)
+    df = df.fillna("")
+    if df.empty:
+        return []
+    df["ID"] = df["ID"].astype(str)
+    groups_map = {}
+    for goods_id, group_df in df.groupby("ID"):
+        first_row = group_df.iloc[0].to_dict()
+        inventory_series = pd.to_numeric(group_df.get("库存", pd.Series([], dtype="object")), errors="coerce").fillna(0)
+        total_inventory = int(inventory_series.sum()) if not inventory_series.empty else 0
+        group_data = {"ID": goods_id}
+        for col in catalog.GOODS_GROUP_FIELDS:
+            group_data[col] = first_row.get(col, "")
+        group_data["库存"] = total_inventory
+        group_data["skus"] = group_df.to_dict(orient="records")
+        groups_map[goods_id] = group_data
+    return [groups_map[gid] for gid in ids if gid in groups_map]
+
+
+def best_of(fn, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--skus", type=int, default=4, help="SKUs per goods")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'goods':>8} {'rows':>8} {'pandas ms':>11} {'stream ms':>11} {'speedup':>8}")
+    for size in SIZES:
+        rows = make_rows(size, args.skus)
+        ids = list(dict.fromkeys(row["ID"] for row in rows))
+        if pandas_groups(rows, ids) != catalog.assemble_goods_groups(rows, ids):
+            raise SystemExit(f"Assembler output differs from pandas path at {size} goods")
+        pandas_s = best_of(lambda: pandas_groups(rows, ids), args.repeat)
+        stream_s = best_of(lambda: catalog.assemble_goods_groups(rows, ids), args.repeat)
+        print(f"{size:>8} {len(rows):>8} {pandas_s * 1000:>11.2f} {stream_s * 1000:>11.2f} {pandas_s / stream_s:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
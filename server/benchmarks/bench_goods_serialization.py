@@ -0,0 +1,75 @@
+"""
+Benchmark: serializing a 10k-goods /goods payload and its size on the wire.
+
+    cd server && python benchmarks/bench_goods_serialization.py [--goods 10000] [--skus 4] [--repeat 3]
+
+Compares FastAPI's default path (jsonable_encoder + json.dumps) with
+serialization.dumps (orjson when installed), then gzip / brotli sizes and
+compression times at the levels compression.CompressionMiddleware uses.
+"""
+import os
+import sys
+import gzip
+import json
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fastapi.encoders import jsonable_encoder
+import catalog
+import compression
+import serialization
+from bench_goods_assembler import make_rows
+
+
+def default_fastapi_dumps(content):
+    # What FastAPI does for a plain dict return value
+    return json.dumps(jsonable_encoder(content), ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")).encode("utf-8")
+
+
+def timed(fn, repeat):
+    best = None
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--goods", type=int, default=10000)
+    parser.add_argument("--skus", type=int, default=4, help="SKUs per goods")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    rows = make_rows(args.goods, args.skus)
+    ids = list(dict.fromkeys(row["ID"] for row in rows))
+    payload = {"data": catalog.assemble_goods_groups(rows, ids), "total": len(ids), "page": 1, "limit": len(ids), "total_pages": 1, "next_cursor": None}
+
+    backend = "orjson" if serialization.orjson is not None else "json (orjson not installed)"
+    print(f"{args.goods} goods, {len(rows)} SKU rows; fast path: {backend}")
+    print(f"{'serializer':<28} {'ms':>9} {'bytes':>12}")
+    default_s, default_body = timed(lambda: default_fastapi_dumps(payload), args.repeat)
+    fast_s, fast_body = timed(lambda: serialization.dumps(payload), args.repeat)
+    if json.loads(default_body) != json.loads(fast_body):
+        raise SystemExit("Serializers disagree on the payload")
+    print(f"{'jsonable_encoder + json':<28} {default_s * 1000:>9.1f} {len(default_body):>12,}")
+    print(f"{'serialization.dumps':<28} {fast_s * 1000:>9.1f} {len(fast_body):>12,}")
+
+    print(f"\n{'encoding':<28} {'ms':>9} {'bytes':>12} {'ratio':>7}")
+    gzip_s, gzip_body = timed(lambda: gzip.compress(fast_body, compresslevel=compression.GZIP_LEVEL), args.repeat)
+    print(f"{'gzip -' + str(compression.GZIP_LEVEL):<28} {gzip_s * 1000:>9.1f} {len(gzip_body):>12,} {len(fast_body) / len(gzip_body):>6.1f}x")
+    if compression.brotli is not None:
+        br_s, br_body = timed(lambda: compression.brotli.compress(fast_body, quality=compression.BROTLI_QUALITY), args.repeat)
+        print(f"{'brotli q' + str(compression.BROTLI_QUALITY):<28} {br_s * 1000:>9.1f} {len(br_body):>12,} {len(fast_body) / len(br_body):>6.1f}x")
+    else:
+        print("brotli not installed, skipped")
+
+
+if __name__ == "__main__":
+    main()
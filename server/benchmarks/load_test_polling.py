@@ -0,0 +1,92 @@
+"""
+Load test: the web UI's polling traffic while exports run.
+
+    cd server && uvicorn main:app --port 8000 &
+    python benchmarks/load_test_polling.py [--base-url http://127.0.0.1:8000] [--clients 50] [--duration 30]
+
+Each simulated client polls /task-status, /goods, /config and /rent-curves
+every --interval seconds (as the dashboard does); --exporters loops keep
+/export-excel and the all_data /goods reads busy meanwhile (start the server
+with GOODS_CACHE_SIZE=0 so those are not answered from the response cache).
+Prints per-endpoint request counts, errors and p50/p95/p99 latency.
+"""
+import time
+import random
+import asyncio
+import argparse
+from collections import defaultdict
+
+import httpx
+
+POLL_PATHS = ["/task-status", "/goods?page=1&limit=20", "/config", "/rent-curves"]
+HEAVY_PATHS = ["/export-excel", "/goods?all_data=true", "/goods?all_data=true&with_skus=true"]
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+async def request(client, path, latencies, errors):
+    start = time.perf_counter()
+    try:
+        response = await client.get(path)
+        await response.aread()
+        if response.status_code >= 400:
+            errors[path] += 1
+    except httpx.HTTPError:
+        errors[path] += 1
+    latencies[path].append((time.perf_counter() - start) * 1000)
+
+
+async def poller(client, deadline, interval, latencies, errors):
+    # Spread clients out so they don't all fire on the same tick
+    await asyncio.sleep(random.uniform(0, interval))
+    while time.monotonic() < deadline:
+        tick = time.monotonic()
+        await asyncio.gather(*(request(client, path, latencies, errors) for path in POLL_PATHS))
+        await asyncio.sleep(max(0.0, interval - (time.monotonic() - tick)))
+
+
+async def exporter(client, deadline, heavy_paths, latencies, errors):
+    while time.monotonic() < deadline:
+        for path in heavy_paths:
+            await request(client, path, latencies, errors)
+
+
+async def run(args):
+    latencies = defaultdict(list)
+    errors = defaultdict(int)
+    limits = httpx.Limits(max_connections=args.clients * len(POLL_PATHS) + args.exporters)
+    deadline = time.monotonic() + args.duration
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=args.timeout, limits=limits) as client:
+        tasks = [poller(client, deadline, args.interval, latencies, errors) for _ in range(args.clients)]
+        tasks += [exporter(client, deadline, args.heavy, latencies, errors) for _ in range(args.exporters)]
+        await asyncio.gather(*tasks)
+
+    print(f"{args.clients} pollers every {args.interval}s, {args.exporters} export loops, {args.duration}s against {args.base_url}")
+    print(f"{'endpoint':<40} {'count':>7} {'errors':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for path in POLL_PATHS + args.heavy:
+        values = latencies.get(path, [])
+        print(f"{path:<40} {len(values):>7} {errors.get(path, 0):>7} {percentile(values, 50):>9.1f} {percentile(values, 95):>9.1f} {percentile(values, 99):>9.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--clients", type=int, default=50, help="concurrent polling clients")
+    parser.add_argument("--interval", type=float, default=2.0, help="seconds between polls per client")
+    parser.add_argument("--exporters", type=int, default=2, help="concurrent export/all_data loops")
+    parser.add_argument("--heavy", action="append", help=f"path the export loops request (repeatable, default {HEAVY_PATHS})")
+    parser.add_argument("--duration", type=float, default=30.0)
+    parser.add_argument("--timeout", type=float, default=60.0)
+    args = parser.parse_args()
+    args.heavy = args.heavy or HEAVY_PATHS
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
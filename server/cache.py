@@ -0,0 +1,134 @@
+import os
+import time
+import uuid
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+from sqlalchemy import text
+
+GOODS_CACHE_SIZE = int(os.getenv("GOODS_CACHE_SIZE", "256"))
+GOODS_CACHE_TTL = float(os.getenv("GOODS_CACHE_TTL", "60"))
+
+# Data version counters live in the database (db.DATA_VERSIONS_TABLE), one row per
+# name, bumped inside the transaction of every write to the data they name. Every
+# worker process reads the same counter, and any other writer (a merge in another
+# worker, a manual import) only has to bump the row for caches and ETags to follow.
+# The row's token is drawn when the row is created, so a recreated database never
+# repeats an old version string.
+VERSIONS_TABLE = "data_versions"
+
+def read_version(conn, name: str) -> str:
+    """Current version string of name ("0" before its first write)."""
+    row = conn.execute(text(f"SELECT token, version FROM {VERSIONS_TABLE} WHERE name = :name"), {"name": name}).fetchone()
+    return f"{row[0]}.{row[1]}" if row else "0"
+
+def bump_version(conn, name: str):
+    # Part of the caller's write transaction: readers see the new version exactly when they see the data
+    conn.execute(text(f"""
+        INSERT INTO {VERSIONS_TABLE} (name, version, token) VALUES (:name, 1, :token)
+        ON CONFLICT (name) DO UPDATE SET version = {VERSIONS_TABLE}.version + 1
+    """), {"name": name, "token": uuid.uuid4().hex[:12]})
+
+def file_version(path: str) -> str:
+    """Version of data kept in a file (shared by every worker): its mtime and size."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return "0"
+    return f"{st.st_mtime_ns:x}.{st.st_size}"
+
+def etag(name: str, version: str, *parts: Any) -> str:
+    """Strong ETag for a response that depends only on the named data at version and the given request parts."""
+    digest = hashlib.sha1(repr(parts).encode("utf-8")).hexdigest()[:16]
+    return f"\"{name}-{version}-{digest}\""
+
+def etag_matches(if_none_match: Optional[str], tag: str) -> bool:
+    # If-None-Match uses the weak comparison: W/ prefixes are ignored
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*":
+            return True
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == tag:
+            return True
+    return False
+
+
+class VersionedLRUCache:
+    """
+    Thread-safe LRU of computed results. Each entry remembers the data
+    version it was computed under and its age; a lookup under another
+    version (the caller reads the current one with read_version) or past
+    the TTL is a miss, so writers only need to bump the version instead of
+    knowing which keys they affect.
+    """
+
+    def __init__(self, version_name: str, max_size: int = 256, ttl: float = 60.0):
+        self.version_name = version_name
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.last_version = None
+
+    def get(self, key: Hashable, version: str) -> Optional[Any]:
+        now = time.monotonic()
+        with self._lock:
+            self.last_version = version
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, entry_version, stored_at = entry
+            if entry_version != version or now - stored_at > self.ttl:
+                del self._entries[key]
+                self.evictions += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: Any, version: str):
+        # version is the one read *before* computing value, so a write that
+        # lands meanwhile leaves the entry already stale
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (value, version, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "data_version": self.last_version
+            }
+
+
+CATALOG_VERSION = "catalog"
+CURVES_VERSION = "rent_curves"
+CONFIG_VERSION = "config"
+
+goods_cache = VersionedLRUCache(CATALOG_VERSION, max_size=GOODS_CACHE_SIZE, ttl=GOODS_CACHE_TTL)
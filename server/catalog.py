@@ -0,0 +1,925 @@
+import io
+import re
+import json
+import base64
+import hashlib
+import itertools
+import logging
+import threading
+from datetime import datetime
+from typing import List, Dict, Any, Optional, Tuple, Iterable, Iterator
+from sqlalchemy import text
+import db
+import cache
+import search_index
+
+# Goods-level fields, stored once per ID in the goods table
+GOODS_FIELDS = ["商品名称", "短标题", "1级分类", "2级分类", "3级分类", "merchant", "是否同步支付宝", "最近提交时间", "商品图片", "支付宝编码"]
+# Typed SKU fields, stored in the skus table
+SKU_INT_FIELDS = ["库存"]
+SKU_PRICE_FIELDS = ["市场价", "押金", "购买价", "采购价"]
+SKU_FIXED_FIELDS = ["编号", "SKU"] + SKU_INT_FIELDS + SKU_PRICE_FIELDS
+# Bookkeeping columns of the skus table that are not part of the flat row
+SKU_INTERNAL_FIELDS = ["goods_id", "position", "row_hash"]
+# Fields kept from the stored goods row when a scrape leaves them blank
+CARRY_OVER_FIELDS = ["merchant", "支付宝编码", "是否同步支付宝"]
+# Sort keys stored as NULL rather than "" when blank, so they sort last off the index
+NULLABLE_GOODS_FIELDS = ["最近提交时间"]
+# List-page fields the scraper's incremental mode compares with the stored goods
+SCRAPE_STATE_FIELDS = ["最近提交时间", "是否同步支付宝"]
+# Legacy aliases that fold into a canonical goods field
+FIELD_ALIASES = {"商家": "merchant"}
+
+RENT_COLUMN_RE = re.compile(r"^(\d+)天租金$")
+
+# Flat (scraper-shaped) column order: base columns, then rents, prices and extras
+FLAT_HEAD_COLUMNS = ["ID", "商品名称", "短标题", "是否同步支付宝", "最近提交时间", "商品图片", "1级分类", "2级分类", "3级分类", "SKU", "编号"] + SKU_INT_FIELDS
+FLAT_TAIL_COLUMNS = ["merchant", "支付宝编码"]
+# Goods-level fields of one /goods group, in response order (ID, 库存 and skus are added around them)
+GOODS_GROUP_FIELDS = ["商品名称", "短标题", "1级分类", "2级分类", "3级分类", "merchant", "是否同步支付宝", "最近提交时间", "商品图片", "支付宝编码"]
+# SKU aggregates stored next to the goods fields in goods_summary
+SUMMARY_AGGREGATES = {
+    "库存": "COALESCE(SUM(s.\"库存\"), 0)",
+    "1天租金": "MIN(p.\"rent\")",
+    "sku_count": "COUNT(s.\"编号\")",
+}
+
+CHUNK_SIZE = 500
+
+# Tables a merge loads into before publishing
+STAGING_GOODS = "goods_staging"
+STAGING_SKUS = "skus_staging"
+STAGING_PRICES = "sku_prices_staging"
+# The staging tables are shared, so a merge holds this from create_staging_tables
+# to drop_staging_tables; a second merge would drop the first one's staged rows
+MERGE_LOCK = threading.Lock()
+
+# Counts reported by publish_staging
+MERGE_STAT_KEYS = ["goods", "goods_changed", "unchanged", "changed", "added", "removed", "price_changes"]
+
+# SKU columns whose changes go to price_history, next to every "N天租金"
+PRICE_HISTORY_FIELDS = SKU_PRICE_FIELDS
+
+
+def rent_days(column: str) -> Optional[int]:
+    match = RENT_COLUMN_RE.match(column or "")
+    return int(match.group(1)) if match else None
+
+def rent_column(days: int) -> str:
+    return f"{days}天租金"
+
+def goods_id_num(goods_id: str) -> Optional[int]:
+    # Numeric form of the ID for sorting; non-numeric IDs sort after all numeric ones
+    if goods_id.isdigit() and len(goods_id) <= 18:
+        return int(goods_id)
+    return None
+
+def clean_text(value) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, float) and value != value:
+        return ""
+    return str(value).strip()
+
+def parse_number(value) -> Optional[float]:
+    raw = clean_text(value).replace(",", "").replace("¥", "")
+    if not raw:
+        return None
+    try:
+        number = float(raw)
+    except ValueError:
+        return None
+    if number != number:
+        return None
+    return number
+
+def parse_int(value) -> Optional[int]:
+    number = parse_number(value)
+    return int(number) if number is not None else None
+
+def format_money(value) -> str:
+    number = parse_number(value)
+    return f"{number:.2f}" if number is not None else ""
+
+def format_int(value) -> str:
+    number = parse_number(value)
+    return str(int(number)) if number is not None else ""
+
+def extra_sku_columns(row: Dict[str, Any]) -> List[str]:
+    """Scraped columns that have no fixed home (e.g. 重量) and live as extra columns on skus."""
+    known = set(["ID"] + GOODS_FIELDS + SKU_FIXED_FIELDS + SKU_INTERNAL_FIELDS) | set(FIELD_ALIASES)
+    return [col for col in row.keys() if col not in known and rent_days(col) is None]
+
+def parse_typed(value, column_type: Optional[str]):
+    """Parse a scraped cell for a column of the given declared type (TEXT when unknown)."""
+    affinity = db.column_affinity(column_type or "TEXT")
+    if affinity == "NUMERIC":
+        return parse_number(value)
+    if affinity == "INTEGER":
+        return parse_int(value)
+    return clean_text(value)
+
+def format_typed(value, column_type: Optional[str]) -> str:
+    affinity = db.column_affinity(column_type or "TEXT")
+    if affinity == "NUMERIC":
+        return format_money(value)
+    if affinity == "INTEGER":
+        return format_int(value)
+    return clean_text(value)
+
+def unparsed_number_counts(rows: Iterable[Dict[str, Any]], columns: Iterable[str]) -> Dict[str, int]:
+    """Per column, how many non-blank values in rows don't parse as a number."""
+    counts = {}
+    columns = list(columns)
+    for row in rows:
+        for col in columns:
+            value = row.get(col)
+            if clean_text(value) and parse_number(value) is None:
+                counts[col] = counts.get(col, 0) + 1
+    return counts
+
+def infer_extra_types(rows: Iterable[Dict[str, Any]], columns: List[str]) -> Dict[str, str]:
+    """
+    Types for new extra columns: db.infer_column_type from the header,
+    downgraded to TEXT when a non-blank value in rows doesn't parse as a number.
+    """
+    types = {col: db.infer_column_type(col) for col in columns}
+    typed = [col for col, col_type in types.items() if col_type != "TEXT"]
+    for col in unparsed_number_counts(rows, typed):
+        types[col] = "TEXT"
+    return types
+
+def split_goods_rows(goods_id: str, rows: List[Dict[str, Any]], extra_types: Optional[Dict[str, str]] = None) -> Tuple[Dict[str, Any], List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """
+    Split the flat scraper rows of one goods ID into
+    (goods record, sku records, sku_prices records). Extra columns are
+    parsed for the types in extra_types (TEXT when missing).
+    """
+    goods = {"ID": goods_id, "id_num": goods_id_num(goods_id)}
+    for field in GOODS_FIELDS:
+        goods[field] = ""
+    for row in rows:
+        for field in GOODS_FIELDS:
+            if not goods[field]:
+                goods[field] = clean_text(row.get(field))
+        for alias, field in FIELD_ALIASES.items():
+            if not goods[field]:
+                goods[field] = clean_text(row.get(alias))
+
+    skus = []
+    prices = []
+    seen_codes = set()
+    for position, row in enumerate(rows):
+        code = clean_text(row.get("编号"))
+        spec = clean_text(row.get("SKU"))
+        has_data = code or spec or any(rent_days(col) is not None and clean_text(val) for col, val in row.items())
+        if not has_data:
+            # Goods without a SKU table only carry goods-level fields
+            continue
+        if not code or code in seen_codes:
+            code = f"{goods_id}#{position}"
+        seen_codes.add(code)
+
+        sku = {"编号": code, "goods_id": goods_id, "position": position, "SKU": spec}
+        for field in SKU_INT_FIELDS:
+            sku[field] = parse_int(row.get(field))
+        for field in SKU_PRICE_FIELDS:
+            sku[field] = parse_number(row.get(field))
+        for col in extra_sku_columns(row):
+            sku[col] = parse_typed(row.get(col), (extra_types or {}).get(col))
+        skus.append(sku)
+
+        for col, val in row.items():
+            days = rent_days(col)
+            if days is None:
+                continue
+            rent = parse_number(val)
+            if rent is not None:
+                prices.append({"sku": code, "tenancy_days": days, "rent": rent})
+    return goods, skus, prices
+
+def group_rows_by_id(items: List[Dict[str, Any]]) -> Dict[str, List[Dict[str, Any]]]:
+    grouped = {}
+    for item in items:
+        goods_id = clean_text(item.get("ID"))
+        if not goods_id:
+            continue
+        grouped.setdefault(goods_id, []).append(item)
+    return grouped
+
+SCRAPE_READ_SIZE = 1 << 16
+
+def iter_scrape_rows(path: str) -> Iterator[Dict[str, Any]]:
+    """
+    Rows of a scrape output file, read incrementally: NDJSON (one row per
+    line, what scrape_goods.py writes) or a JSON array of rows (older files),
+    told apart by the first character.
+    """
+    decoder = json.JSONDecoder()
+    with open(path, "r", encoding="utf-8") as f:
+        buffer = f.read(SCRAPE_READ_SIZE).lstrip("\ufeff")
+        if not buffer.lstrip().startswith("["):
+            for line in itertools.chain(io.StringIO(buffer + f.readline()), f):
+                line = line.strip()
+                if line:
+                    yield json.loads(line)
+            return
+
+        pos = buffer.index("[") + 1
+        eof = False
+        while True:
+            while pos < len(buffer) and buffer[pos] in " \t\r\n,":
+                pos += 1
+            if buffer.startswith("]", pos):
+                return
+            row, end = None, len(buffer)
+            if pos < len(buffer):
+                try:
+                    row, end = decoder.raw_decode(buffer, pos)
+                except ValueError:
+                    pass
+            if end >= len(buffer) and not eof:
+                # The value may run past the buffer: read more and decode it again
+                chunk = f.read(SCRAPE_READ_SIZE)
+                eof = not chunk
+                buffer = buffer[pos:] + chunk
+                pos = 0
+                continue
+            if row is None:
+                raise ValueError("Truncated or malformed scrape JSON array")
+            yield row
+            pos = end
+
+def iter_goods_chunks(rows: Iterable[Dict[str, Any]], max_ids: int = CHUNK_SIZE) -> Iterator[List[Dict[str, Any]]]:
+    """
+    Consecutive rows in batches covering at most max_ids goods IDs. The
+    scraper writes each goods' SKU rows together, so a goods never spans two
+    batches; an ID that shows up again later is merged again (its later rows win).
+    """
+    batch = []
+    batch_ids = set()
+    seen = set()
+    for row in rows:
+        goods_id = clean_text(row.get("ID"))
+        if goods_id not in batch_ids:
+            if len(batch_ids) >= max_ids:
+                seen |= batch_ids
+                yield batch
+                batch = []
+                batch_ids = set()
+            if goods_id in seen:
+                logging.warning(f"Goods {goods_id} appears in more than one place in the scrape output")
+            batch_ids.add(goods_id)
+        batch.append(row)
+    if batch:
+        yield batch
+
+def _in_clause(prefix: str, values: List[Any]) -> Tuple[str, Dict[str, Any]]:
+    placeholders = ",".join([f":{prefix}_{i}" for i in range(len(values))])
+    params = {f"{prefix}_{i}": val for i, val in enumerate(values)}
+    return placeholders, params
+
+def sku_row_hash(sku: Dict[str, Any], prices: List[Dict[str, Any]]) -> str:
+    """Digest of everything a scrape writes for one SKU: its columns (blank extras ignored) and its rents."""
+    fixed = set(SKU_FIXED_FIELDS + SKU_INTERNAL_FIELDS)
+    # Blank extras are skipped so adding a column to skus doesn't change every hash
+    fields = {k: v for k, v in sku.items() if k != "row_hash" and (k in fixed or v not in ("", None))}
+    rents = sorted((p["tenancy_days"], p["rent"]) for p in prices)
+    payload = json.dumps([sorted(fields.items()), rents], ensure_ascii=False, default=str)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+def _q(columns: List[str], alias: str = "") -> str:
+    prefix = f"{alias}." if alias else ""
+    return ", ".join([f"{prefix}\"{c}\"" for c in columns])
+
+def create_staging_tables(conn):
+    """
+    (Re)create the empty staging copies of goods / skus / sku_prices that a
+    merge loads into before publishing. Besides the live columns they carry
+    stage_seq (load batch number) and the merge bookkeeping columns.
+    """
+    drop_staging_tables(conn)
+    unlogged = "UNLOGGED " if conn.dialect.name == "postgresql" else ""
+    conn.execute(text(f"CREATE {unlogged}TABLE {STAGING_GOODS} AS SELECT g.*, CAST(0 AS INTEGER) AS stage_seq, CAST(0 AS INTEGER) AS goods_changed FROM goods g WHERE 1 = 0"))
+    conn.execute(text(f"CREATE {unlogged}TABLE {STAGING_SKUS} AS SELECT s.*, CAST(0 AS INTEGER) AS stage_seq, CAST(NULL AS TEXT) AS merge_state FROM skus s WHERE 1 = 0"))
+    conn.execute(text(f"CREATE {unlogged}TABLE {STAGING_PRICES} AS SELECT p.*, CAST(NULL AS TEXT) AS goods_id, CAST(0 AS INTEGER) AS stage_seq FROM sku_prices p WHERE 1 = 0"))
+    conn.execute(text(f"CREATE INDEX idx_{STAGING_GOODS}_id ON {STAGING_GOODS} (\"ID\")"))
+    conn.execute(text(f"CREATE INDEX idx_{STAGING_SKUS}_code ON {STAGING_SKUS} (\"编号\")"))
+    conn.execute(text(f"CREATE INDEX idx_{STAGING_SKUS}_goods_id ON {STAGING_SKUS} (\"goods_id\")"))
+    conn.execute(text(f"CREATE INDEX idx_{STAGING_PRICES}_sku ON {STAGING_PRICES} (\"sku\")"))
+    # The registry learns the new tables from their sources instead of re-reading the catalog
+    db.schema.add_table(STAGING_GOODS, {**db.schema.column_types("goods", conn), "stage_seq": "INTEGER", "goods_changed": "INTEGER"})
+    db.schema.add_table(STAGING_SKUS, {**db.schema.column_types("skus", conn), "stage_seq": "INTEGER", "merge_state": "TEXT"})
+    db.schema.add_table(STAGING_PRICES, {**db.schema.column_types("sku_prices", conn), "goods_id": "TEXT", "stage_seq": "INTEGER"})
+
+def drop_staging_tables(conn):
+    for table in (STAGING_PRICES, STAGING_SKUS, STAGING_GOODS):
+        conn.execute(text(f"DROP TABLE IF EXISTS {table}"))
+        db.schema.drop_table(table)
+
+def stage_goods_rows(conn, items: List[Dict[str, Any]], seq: int = 0) -> int:
+    """
+    Parse one batch of scraped rows into the staging tables (nothing live
+    is touched apart from new extra columns on skus). SKUs are hashed here.
+    seq orders batches: a goods ID staged again in a later batch replaces
+    the earlier rows. Returns the number of goods IDs staged. Caller commits.
+    """
+    grouped = group_rows_by_id(items)
+    if not grouped:
+        return 0
+
+    extra_cols = []
+    fixed_numeric = set()
+    for rows in grouped.values():
+        for row in rows:
+            for col in extra_sku_columns(row):
+                if col not in extra_cols:
+                    extra_cols.append(col)
+            fixed_numeric.update(col for col in row if col in SKU_INT_FIELDS or col in SKU_PRICE_FIELDS or rent_days(col) is not None)
+    extra_types = {}
+    if extra_cols:
+        new_cols = [col for col in extra_cols if col not in db.schema.columns("skus", conn)]
+        if new_cols:
+            db.ensure_columns("skus", new_cols, conn, types=infer_extra_types(items, new_cols))
+        # A typed column that meets a value it can't hold (运费 "10", later "包邮") becomes TEXT
+        sku_types = db.schema.column_types("skus", conn)
+        typed = [col for col in extra_cols if db.column_affinity(sku_types.get(col, "TEXT")) != "TEXT"]
+        for col in unparsed_number_counts(items, typed):
+            db.widen_column_to_text(conn, "skus", col)
+            db.widen_column_to_text(conn, STAGING_SKUS, col, versioned=False)
+        sku_types = db.schema.column_types("skus", conn)
+        extra_types = {col: sku_types.get(col, "TEXT") for col in extra_cols}
+        db.ensure_columns(STAGING_SKUS, extra_cols, conn, types=extra_types, versioned=False)
+    # Rents and the fixed SKU numbers have no TEXT fallback
+    dropped = unparsed_number_counts(items, fixed_numeric)
+    if dropped:
+        logging.warning(f"Stored as NULL, not a number: {dropped}")
+
+    goods_records = []
+    sku_records = []
+    price_records = []
+    for goods_id, rows in grouped.items():
+        goods, skus, prices = split_goods_rows(goods_id, rows, extra_types)
+        goods["stage_seq"] = seq
+        goods_records.append(goods)
+        prices_by_code = {}
+        for price in prices:
+            price["goods_id"] = goods_id
+            price["stage_seq"] = seq
+            prices_by_code.setdefault(price["sku"], []).append(price)
+        for sku in skus:
+            sku["row_hash"] = sku_row_hash(sku, prices_by_code.get(sku["编号"], []))
+            sku["stage_seq"] = seq
+        sku_records.extend(skus)
+        price_records.extend(prices)
+
+    sku_cols = ["编号", "goods_id", "position", "row_hash", "SKU"] + SKU_INT_FIELDS + SKU_PRICE_FIELDS + extra_cols
+    db.bulk_write(conn, STAGING_GOODS, ["ID", "id_num"] + GOODS_FIELDS + ["stage_seq"], goods_records)
+    db.bulk_write(conn, STAGING_SKUS, sku_cols + ["stage_seq"], sku_records)
+    db.bulk_write(conn, STAGING_PRICES, ["sku", "tenancy_days", "rent", "goods_id", "stage_seq"], price_records)
+    return len(goods_records)
+
+def _validate_staging(conn):
+    # A goods ID staged more than once keeps only its latest batch
+    for table, id_col in ((STAGING_SKUS, "goods_id"), (STAGING_PRICES, "goods_id"), (STAGING_GOODS, "ID")):
+        conn.execute(text(f"""
+            DELETE FROM {table} WHERE stage_seq < (
+                SELECT MAX(g.stage_seq) FROM {STAGING_GOODS} g WHERE g."ID" = {table}."{id_col}"
+            )
+        """))
+    # 编号 is unique across the catalog: a code listed under two goods stays with the greater ID
+    duplicates = conn.execute(text(f"""
+        DELETE FROM {STAGING_SKUS} WHERE EXISTS (
+            SELECT 1 FROM {STAGING_SKUS} o WHERE o."编号" = {STAGING_SKUS}."编号" AND o."goods_id" > {STAGING_SKUS}."goods_id"
+        )
+    """)).rowcount
+    if duplicates:
+        logging.warning(f"Dropped {duplicates} staged SKUs whose 编号 is also listed under another goods")
+    conn.execute(text(f"""
+        DELETE FROM {STAGING_PRICES} WHERE NOT EXISTS (
+            SELECT 1 FROM {STAGING_SKUS} s WHERE s."编号" = {STAGING_PRICES}."sku" AND s."goods_id" = {STAGING_PRICES}."goods_id"
+        )
+    """))
+
+def publish_staging(conn) -> Dict[str, int]:
+    """
+    Publish the staged batches onto the live tables with set-based SQL,
+    writing only what changed:
+    - merchant / 支付宝编码 / 是否同步支付宝 left blank by the scrape take
+      the stored goods value, and goods rows are upserted only when a field differs;
+    - staged SKUs are compared by row_hash with the stored ones: new codes are
+      inserted, changed ones upserted with their rents rewritten, unchanged ones skipped;
+    - stored SKUs of a staged goods ID that the scrape no longer lists are deleted;
+    - price changes of staged SKUs are appended to price_history first;
+    - goods_summary and the search index are refreshed for touched goods only,
+      and the catalog data version is bumped when anything changed.
+    Meant to run in one short transaction; returns MERGE_STAT_KEYS counts. Caller commits.
+    """
+    _validate_staging(conn)
+    for field in CARRY_OVER_FIELDS:
+        conn.execute(text(f"""
+            UPDATE {STAGING_GOODS} SET "{field}" = COALESCE((SELECT g."{field}" FROM goods g WHERE g."ID" = {STAGING_GOODS}."ID"), '')
+            WHERE COALESCE("{field}", '') = ''
+        """))
+    for field in NULLABLE_GOODS_FIELDS:
+        conn.execute(text(f"UPDATE {STAGING_GOODS} SET \"{field}\" = NULL WHERE \"{field}\" = ''"))
+
+    same_goods = " AND ".join(
+        [f"COALESCE(g.\"id_num\", -1) = COALESCE({STAGING_GOODS}.\"id_num\", -1)"]
+        + [f"COALESCE(g.\"{f}\", '') = COALESCE({STAGING_GOODS}.\"{f}\", '')" for f in GOODS_FIELDS]
+    )
+    conn.execute(text(f"""
+        UPDATE {STAGING_GOODS} SET goods_changed = 1 WHERE NOT EXISTS (
+            SELECT 1 FROM goods g WHERE g."ID" = {STAGING_GOODS}."ID" AND {same_goods}
+        )
+    """))
+    conn.execute(text(f"""
+        UPDATE {STAGING_SKUS} SET merge_state = CASE
+            WHEN NOT EXISTS (SELECT 1 FROM skus s WHERE s."编号" = {STAGING_SKUS}."编号") THEN 'added'
+            WHEN EXISTS (SELECT 1 FROM skus s WHERE s."编号" = {STAGING_SKUS}."编号" AND s."row_hash" = {STAGING_SKUS}."row_hash") THEN 'unchanged'
+            ELSE 'changed'
+        END
+    """))
+    removed_sql = f"""
+        SELECT s."编号" FROM skus s
+        WHERE s."goods_id" IN (SELECT "ID" FROM {STAGING_GOODS})
+        AND NOT EXISTS (SELECT 1 FROM {STAGING_SKUS} st WHERE st."编号" = s."编号")
+    """
+
+    stats = dict.fromkeys(MERGE_STAT_KEYS, 0)
+    stats["goods"] = conn.execute(text(f"SELECT COUNT(*) FROM {STAGING_GOODS}")).scalar()
+    stats["goods_changed"] = conn.execute(text(f"SELECT COUNT(*) FROM {STAGING_GOODS} WHERE goods_changed = 1")).scalar()
+    for state, count in conn.execute(text(f"SELECT merge_state, COUNT(*) FROM {STAGING_SKUS} GROUP BY merge_state")).fetchall():
+        stats[state] = count
+    stats["removed"] = conn.execute(text(f"SELECT COUNT(*) FROM ({removed_sql}) r")).scalar()
+    # Old owners of moved or removed SKUs need their summary refreshed too
+    touched = [str(row[0]) for row in conn.execute(text(f"""
+        SELECT "ID" FROM {STAGING_GOODS} WHERE goods_changed = 1
+        UNION SELECT "goods_id" FROM {STAGING_SKUS} WHERE merge_state <> 'unchanged'
+        UNION SELECT s."goods_id" FROM skus s JOIN {STAGING_SKUS} st ON st."编号" = s."编号" WHERE st.merge_state = 'changed'
+        UNION SELECT s."goods_id" FROM skus s WHERE s."编号" IN ({removed_sql})
+    """)).fetchall()]
+
+    stats["price_changes"] = record_price_history(conn)
+
+    goods_cols = ["ID", "id_num"] + GOODS_FIELDS
+    update_sql = ", ".join([f"\"{c}\" = excluded.\"{c}\"" for c in goods_cols[1:]])
+    conn.execute(text(f"""
+        INSERT INTO goods ({_q(goods_cols)})
+        SELECT {_q(goods_cols)} FROM {STAGING_GOODS} WHERE goods_changed = 1
+        ON CONFLICT ("ID") DO UPDATE SET {update_sql}
+    """))
+
+    # Prices are cleared explicitly rather than relying on ON DELETE CASCADE being enforced;
+    # rewritten SKUs drop their old rents too, since a tenancy may have disappeared
+    conn.execute(text(f"""
+        DELETE FROM sku_prices WHERE "sku" IN (SELECT "编号" FROM {STAGING_SKUS} WHERE merge_state = 'changed')
+        OR "sku" IN ({removed_sql})
+    """))
+    conn.execute(text(f"DELETE FROM skus WHERE \"编号\" IN ({removed_sql})"))
+
+    # Every extra column on skus is written, so one a SKU no longer carries is cleared
+    internal = {"stage_seq", "merge_state"}
+    sku_cols = [c for c in db.schema.columns(STAGING_SKUS, conn) if c not in internal]
+    update_sql = ", ".join([f"\"{c}\" = excluded.\"{c}\"" for c in sku_cols if c != "编号"])
+    conn.execute(text(f"""
+        INSERT INTO skus ({_q(sku_cols)})
+        SELECT {_q(sku_cols)} FROM {STAGING_SKUS} WHERE merge_state <> 'unchanged'
+        ON CONFLICT ("编号") DO UPDATE SET {update_sql}
+    """))
+    conn.execute(text(f"""
+        INSERT INTO sku_prices ("sku", "tenancy_days", "rent")
+        SELECT p."sku", p."tenancy_days", p."rent" FROM {STAGING_PRICES} p
+        JOIN {STAGING_SKUS} s ON s."编号" = p."sku"
+        WHERE s.merge_state <> 'unchanged'
+    """))
+    if touched:
+        refresh_goods_summary(conn, touched)
+        search_index.sync_goods(conn, touched)
+        cache.bump_version(conn, cache.CATALOG_VERSION)
+    return stats
+
+def record_price_history(conn, changed_at: Optional[str] = None) -> int:
+    """
+    Append to price_history every rent and PRICE_HISTORY_FIELDS value of the
+    staged (added or changed) SKUs that differs from the live one, before
+    publish_staging overwrites it. A tenancy that disappeared is recorded as
+    NULL. Unchanged SKUs are never looked at, so history grows with the
+    amount of change. Returns the number of rows appended.
+    """
+    params = {"changed_at": changed_at or datetime.utcnow().isoformat()}
+    rent_field = "CAST(p.\"tenancy_days\" AS TEXT) || '天租金'"
+    appended = conn.execute(text(f"""
+        INSERT INTO price_history ("sku", "field", "changed_at", "goods_id", "value")
+        SELECT p."sku", {rent_field}, :changed_at, s."goods_id", p."rent"
+        FROM {STAGING_PRICES} p
+        JOIN {STAGING_SKUS} s ON s."编号" = p."sku" AND s.merge_state <> 'unchanged'
+        LEFT JOIN sku_prices cur ON cur."sku" = p."sku" AND cur."tenancy_days" = p."tenancy_days"
+        WHERE cur."sku" IS NULL OR cur."rent" <> p."rent" OR (cur."rent" IS NULL) <> (p."rent" IS NULL)
+    """), params).rowcount
+    rent_field = rent_field.replace("p.", "cur.")
+    appended += conn.execute(text(f"""
+        INSERT INTO price_history ("sku", "field", "changed_at", "goods_id", "value")
+        SELECT cur."sku", {rent_field}, :changed_at, s."goods_id", NULL
+        FROM sku_prices cur
+        JOIN {STAGING_SKUS} s ON s."编号" = cur."sku" AND s.merge_state = 'changed'
+        WHERE cur."rent" IS NOT NULL AND NOT EXISTS (
+            SELECT 1 FROM {STAGING_PRICES} p WHERE p."sku" = cur."sku" AND p."tenancy_days" = cur."tenancy_days"
+        )
+    """), params).rowcount
+    for field in PRICE_HISTORY_FIELDS:
+        appended += conn.execute(text(f"""
+            INSERT INTO price_history ("sku", "field", "changed_at", "goods_id", "value")
+            SELECT st."编号", '{field}', :changed_at, st."goods_id", st."{field}"
+            FROM {STAGING_SKUS} st
+            LEFT JOIN skus cur ON cur."编号" = st."编号"
+            WHERE st.merge_state <> 'unchanged'
+            AND (cur."{field}" <> st."{field}" OR (cur."{field}" IS NULL) <> (st."{field}" IS NULL))
+        """), params).rowcount
+    return appended
+
+def load_price_history(conn, goods_id: str, sku: Optional[str] = None, field: Optional[str] = None, since: Optional[str] = None) -> List[Dict[str, Any]]:
+    """price_history of one goods ID as one series per (编号, field), points oldest first."""
+    where = ["\"goods_id\" = :id"]
+    params = {"id": goods_id}
+    for column, value in (("sku", sku), ("field", field)):
+        if value:
+            where.append(f"\"{column}\" = :{column}")
+            params[column] = value
+    if since:
+        where.append("\"changed_at\" >= :since")
+        params["since"] = since
+    rows = conn.execute(text(f"""
+        SELECT "sku", "field", "changed_at", "value" FROM price_history
+        WHERE {" AND ".join(where)}
+        ORDER BY "sku", "field", "changed_at"
+    """), params)
+    series = []
+    for code, name, changed_at, value in rows:
+        if not series or series[-1]["编号"] != code or series[-1]["field"] != name:
+            series.append({"编号": code, "field": name, "points": []})
+        series[-1]["points"].append({"at": changed_at, "value": format_money(value)})
+    return series
+
+def merge_goods_rows(conn, items: List[Dict[str, Any]]) -> Dict[str, int]:
+    """
+    Merge a list of scraped rows in the caller's transaction: stage them
+    and publish at once (see publish_staging). Returns MERGE_STAT_KEYS counts.
+    merge_scraped_data stages a file batch by batch instead.
+    """
+    with MERGE_LOCK:
+        create_staging_tables(conn)
+        try:
+            stage_goods_rows(conn, items)
+            return publish_staging(conn)
+        finally:
+            drop_staging_tables(conn)
+
+def _param(column: str) -> str:
+    # Bind parameter names must be plain identifiers
+    return "p_" + "".join(ch if ch.isascii() and ch.isalnum() else f"{ord(ch):x}" for ch in column)
+
+def goods_filter_sql(search: Optional[str] = None, merchant: Optional[str] = None, sync_status: Optional[str] = None,
+                     ids: Optional[List[str]] = None) -> Tuple[str, Dict[str, Any]]:
+    """WHERE clause over goods or goods_summary aliased as g, shared by /goods and /export-excel."""
+    params = {}
+    where_clauses = []
+    if ids is not None:
+        if not ids:
+            return " WHERE 1 = 0", params
+        placeholders, id_params = _in_clause("filter_id", ids)
+        where_clauses.append(f"g.\"ID\" IN ({placeholders})")
+        params.update(id_params)
+    if search:
+        search_clause, search_params = search_index.filter_sql(search)
+        where_clauses.append(search_clause)
+        params.update(search_params)
+    if merchant and merchant != "all":
+        where_clauses.append("g.\"merchant\" = :merchant")
+        params["merchant"] = merchant
+    if sync_status and sync_status != "all":
+        where_clauses.append("g.\"是否同步支付宝\" = :sync_status")
+        params["sync_status"] = sync_status
+    where_sql = " WHERE " + " AND ".join(where_clauses) if where_clauses else ""
+    return where_sql, params
+
+# Sort options of /goods; expressions over goods_summary aliased as g
+GOODS_SORT_EXPRESSIONS = {
+    "ID": "g.\"id_num\"",
+    "商品名称": "g.\"商品名称\"",
+    "1天租金": "g.\"1天租金\"",
+    "支付宝编码": "g.\"支付宝编码\"",
+    "最近提交时间": "g.\"最近提交时间\"",
+    "merchant": "g.\"merchant\"",
+}
+
+def goods_sort_field(sort_by: Optional[str] = None) -> str:
+    sort_field = (sort_by or "").strip()
+    return sort_field if sort_field in GOODS_SORT_EXPRESSIONS else "ID"
+
+def goods_sort_expr(sort_by: Optional[str] = None) -> str:
+    return GOODS_SORT_EXPRESSIONS[goods_sort_field(sort_by)]
+
+def goods_order_sql(sort_by: Optional[str] = None, sort_desc: bool = False) -> str:
+    """ORDER BY body for a full /goods ID listing: NULL sort keys last in both directions, ID as tie-breaker."""
+    sort_expr = goods_sort_expr(sort_by)
+    order = "DESC" if sort_desc else "ASC"
+    return f"({sort_expr} IS NULL) ASC, {sort_expr} {order}, g.\"ID\" {order}"
+
+def encode_cursor(sort_by: Optional[str], sort_desc: bool, sort_key, goods_id: str) -> str:
+    """Opaque keyset cursor: the sort option plus the sort key and ID of the last row served."""
+    if sort_key is not None and not isinstance(sort_key, (int, float, str)):
+        # NUMERIC keys come back as Decimal on Postgres
+        sort_key = float(sort_key)
+    payload = {"s": goods_sort_field(sort_by), "d": bool(sort_desc), "k": sort_key, "i": goods_id}
+    raw = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor: str, sort_by: Optional[str], sort_desc: bool) -> Dict[str, Any]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        payload = json.loads(raw.decode("utf-8"))
+        key, goods_id = payload["k"], str(payload["i"])
+    except Exception:
+        raise ValueError("Invalid cursor")
+    if payload.get("s") != goods_sort_field(sort_by) or bool(payload.get("d")) != bool(sort_desc):
+        raise ValueError("Cursor does not match the requested sort")
+    return {"key": key, "id": goods_id}
+
+def _and_where(where_sql: str, clauses: List[str]) -> str:
+    if not clauses:
+        return where_sql
+    joined = " AND ".join(clauses)
+    return f"{where_sql} AND {joined}" if where_sql else f" WHERE {joined}"
+
+def goods_page_query(
+    where_sql: str,
+    params: Dict[str, Any],
+    sort_by: Optional[str] = None,
+    sort_desc: bool = False,
+    limit: Optional[int] = None,
+    offset: int = 0,
+    cursor: Optional[str] = None
+) -> Tuple[str, Dict[str, Any]]:
+    """
+    (goods ID, sort key) rows of one /goods page in goods_order_sql order.
+
+    Paged queries are a UNION ALL of the rows with a sort key, ordered by
+    (key, ID), and the rows without one, ordered by ID. Each branch is a
+    plain range over a db.GOODS_INDEXES index, and the second one only runs
+    when the first runs out. A cursor turns into a (key, ID) > (k, id) seek
+    (or an ID seek inside the NULL block) instead of an OFFSET walk.
+    Raises ValueError for a cursor that does not belong to this sort.
+    """
+    sort_expr = goods_sort_expr(sort_by)
+    if limit is None:
+        return f"SELECT g.\"ID\", {sort_expr} FROM goods_summary g{where_sql} ORDER BY {goods_order_sql(sort_by, sort_desc)}", dict(params)
+
+    order = "DESC" if sort_desc else "ASC"
+    op = "<" if sort_desc else ">"
+    query_params = {**params, "page_limit": limit, "page_offset": offset, "branch_limit": limit + offset}
+    keyed = [f"{sort_expr} IS NOT NULL"]
+    unkeyed = [f"{sort_expr} IS NULL"]
+    if cursor:
+        position = decode_cursor(cursor, sort_by, sort_desc)
+        query_params["cursor_id"] = position["id"]
+        if position["key"] is None:
+            # Already in the trailing NULL block
+            keyed = None
+            unkeyed.append(f"g.\"ID\" {op} :cursor_id")
+        else:
+            query_params["cursor_key"] = position["key"]
+            keyed.append(f"({sort_expr}, g.\"ID\") {op} (:cursor_key, :cursor_id)")
+
+    unkeyed_sql = f"SELECT g.\"ID\" AS goods_id, NULL AS sort_key FROM goods_summary g{_and_where(where_sql, unkeyed)} ORDER BY g.\"ID\" {order} LIMIT :branch_limit"
+    if keyed is None:
+        branches = [unkeyed_sql]
+    else:
+        keyed_sql = f"SELECT g.\"ID\" AS goods_id, {sort_expr} AS sort_key FROM goods_summary g{_and_where(where_sql, keyed)} ORDER BY {sort_expr} {order}, g.\"ID\" {order} LIMIT :branch_limit"
+        branches = [keyed_sql, unkeyed_sql]
+    union_sql = " UNION ALL ".join([f"SELECT * FROM ({sql}) AS page_{i}" for i, sql in enumerate(branches)])
+    return f"{union_sql} LIMIT :page_limit OFFSET :page_offset", query_params
+
+def iter_flat_rows(conn, where_sql: str = "", params: Optional[Dict[str, Any]] = None, desc: bool = False,
+                   batch_size: int = CHUNK_SIZE) -> Iterator[Dict[str, Any]]:
+    """
+    Rebuild the flat, scraper-shaped rows (one per SKU, goods fields repeated,
+    rents as "N天租金" columns) for the goods matched by where_sql, in goods ID
+    order. Values are rendered as text, the way the API has always returned them.
+    Goods are walked in keyset batches of batch_size IDs; each batch reads its
+    SKU rows and only those SKUs' rents, so memory stays bounded by one batch.
+    The rent columns (distinct tenancy days) are looked up first.
+    """
+    params = params or {}
+    all_days = sorted(int(row[0]) for row in conn.execute(
+        text(f"SELECT DISTINCT p.\"tenancy_days\" FROM sku_prices p JOIN skus s ON s.\"编号\" = p.\"sku\" JOIN goods g ON g.\"ID\" = s.\"goods_id\"{where_sql}"),
+        params
+    ))
+    rent_cols = [(d, rent_column(d)) for d in all_days]
+    skip = set(["ID", "编号"] + GOODS_FIELDS + SKU_FIXED_FIELDS + SKU_INTERNAL_FIELDS + db.GOODS_INTERNAL_COLUMNS)
+    extra_types = {**db.schema.column_types("goods", conn), **db.schema.column_types("skus", conn)}
+
+    order = "DESC" if desc else "ASC"
+    op = "<" if desc else ">"
+    last_id = None
+    while True:
+        seek, seek_params = [], {**params, "batch_size": batch_size}
+        if last_id is not None:
+            seek.append(f"g.\"ID\" {op} :after_id")
+            seek_params["after_id"] = last_id
+        ids = [str(row[0]) for row in conn.execute(
+            text(f"SELECT g.\"ID\" FROM goods g{_and_where(where_sql, seek)} ORDER BY g.\"ID\" {order} LIMIT :batch_size"),
+            seek_params
+        )]
+        if not ids:
+            break
+        placeholders, id_params = _in_clause("batch_id", ids)
+
+        rents = {}
+        price_rows = conn.execute(
+            text(f"SELECT p.\"sku\", p.\"tenancy_days\", p.\"rent\" FROM sku_prices p JOIN skus s ON s.\"编号\" = p.\"sku\" WHERE s.\"goods_id\" IN ({placeholders})"),
+            id_params
+        )
+        for sku, days, rent in price_rows:
+            rents.setdefault(sku, {})[int(days)] = rent
+
+        result = conn.execute(
+            text(f"SELECT g.*, s.* FROM goods g LEFT JOIN skus s ON s.\"goods_id\" = g.\"ID\" WHERE g.\"ID\" IN ({placeholders}) ORDER BY g.\"ID\" {order}, s.\"position\""),
+            id_params
+        )
+        columns = list(result.keys())
+        extra_cols = [c for c in columns if c not in skip]
+        for db_row in result:
+            record = dict(zip(columns, db_row))
+            code = record.get("编号")
+            flat = {}
+            for col in FLAT_HEAD_COLUMNS:
+                if col in SKU_INT_FIELDS:
+                    flat[col] = format_int(record.get(col))
+                else:
+                    flat[col] = clean_text(record.get(col))
+            sku_rents = rents.get(code, {}) if code else {}
+            for days, col in rent_cols:
+                flat[col] = format_money(sku_rents.get(days))
+            for col in SKU_PRICE_FIELDS:
+                flat[col] = format_money(record.get(col))
+            for col in extra_cols:
+                flat[col] = format_typed(record.get(col), extra_types.get(col))
+            for col in FLAT_TAIL_COLUMNS:
+                flat[col] = clean_text(record.get(col))
+            yield flat
+
+        if len(ids) < batch_size:
+            break
+        last_id = ids[-1]
+
+def fetch_flat_rows(conn, where_sql: str = "", params: Optional[Dict[str, Any]] = None, desc: bool = False) -> List[Dict[str, Any]]:
+    return list(iter_flat_rows(conn, where_sql, params, desc))
+
+def assemble_goods_groups(rows: Iterable[Dict[str, Any]], ids: List[str]) -> List[Dict[str, Any]]:
+    """
+    Group flat rows into the /goods payload in one pass: goods fields come
+    from each ID's first row, 库存 is summed across its SKUs, and the result
+    follows the order of ids (IDs without rows are dropped).
+    """
+    groups_map = {}
+    for row in rows:
+        goods_id = row["ID"]
+        group = groups_map.get(goods_id)
+        if group is None:
+            group = {"ID": goods_id}
+            for col in GOODS_GROUP_FIELDS:
+                group[col] = row.get(col, "")
+            group["库存"] = 0
+            group["skus"] = []
+            groups_map[goods_id] = group
+        inventory = parse_number(row.get("库存"))
+        if inventory is not None:
+            group["库存"] += int(inventory)
+        group["skus"].append(row)
+    return [groups_map[gid] for gid in ids if gid in groups_map]
+
+def migrate_legacy_goods():
+    """
+    Convert a pre-normalization database: db.init_tables renames the old wide
+    goods table to goods_legacy; its rows are split into goods / skus /
+    sku_prices here and the legacy table is dropped once everything is copied.
+    Safe to re-run after an interruption.
+    """
+    with db.get_connection() as conn:
+        if not db.has_table(conn, db.LEGACY_GOODS_TABLE):
+            return 0
+        logging.info("Migrating legacy goods table to normalized schema...")
+        conn.execute(text("DELETE FROM goods_summary"))
+        conn.execute(text("DELETE FROM sku_prices"))
+        conn.execute(text("DELETE FROM skus"))
+        conn.execute(text("DELETE FROM goods"))
+
+        row_order = "ctid" if db.is_postgres() else "rowid"
+        result = conn.execute(text(f"SELECT * FROM {db.LEGACY_GOODS_TABLE} ORDER BY \"ID\", {row_order}"))
+        columns = list(result.keys())
+
+        def legacy_rows():
+            while True:
+                chunk = result.fetchmany(CHUNK_SIZE)
+                if not chunk:
+                    return
+                for db_row in chunk:
+                    yield dict(zip(columns, db_row))
+
+        with MERGE_LOCK:
+            create_staging_tables(conn)
+            for seq, batch in enumerate(iter_goods_chunks(legacy_rows())):
+                stage_goods_rows(conn, batch, seq)
+            migrated = publish_staging(conn)["goods"]
+            drop_staging_tables(conn)
+
+        conn.execute(text(f"DROP TABLE {db.LEGACY_GOODS_TABLE}"))
+        conn.commit()
+        db.schema.invalidate()
+        logging.info(f"Migrated {migrated} goods from legacy table.")
+        return migrated
+
+def delete_goods(conn, goods_id: str) -> int:
+    """Delete one goods ID with its SKUs and rents. Returns the number of goods rows removed."""
+    params = {"id": goods_id}
+    cache.bump_version(conn, cache.CATALOG_VERSION)
+    search_index.remove_goods(conn, [goods_id])
+    conn.execute(text("DELETE FROM sku_prices WHERE \"sku\" IN (SELECT \"编号\" FROM skus WHERE \"goods_id\" = :id)"), params)
+    conn.execute(text("DELETE FROM skus WHERE \"goods_id\" = :id"), params)
+    conn.execute(text("DELETE FROM goods_summary WHERE \"ID\" = :id"), params)
+    result = conn.execute(text("DELETE FROM goods WHERE \"ID\" = :id"), params)
+    return result.rowcount
+
+def load_scrape_state(conn) -> Dict[str, Dict[str, str]]:
+    """SCRAPE_STATE_FIELDS of every stored goods ID, the scraper's --known-file for an incremental run."""
+    rows = conn.execute(text(f"SELECT \"ID\", {_q(SCRAPE_STATE_FIELDS)} FROM goods")).mappings()
+    return {row["ID"]: {field: clean_text(row[field]) for field in SCRAPE_STATE_FIELDS} for row in rows}
+
+def update_goods_fields(conn, goods_id: str, values: Dict[str, Any]) -> int:
+    """Set goods-level fields on goods and its goods_summary row. Returns the number of goods rows updated."""
+    set_sql = ", ".join([f"\"{field}\" = :{_param(field)}" for field in values])
+    params = {_param(field): value for field, value in values.items()}
+    params["id"] = goods_id
+    cache.bump_version(conn, cache.CATALOG_VERSION)
+    result = conn.execute(text(f"UPDATE goods SET {set_sql} WHERE \"ID\" = :id"), params)
+    conn.execute(text(f"UPDATE goods_summary SET {set_sql} WHERE \"ID\" = :id"), params)
+    return result.rowcount
+
+def refresh_goods_summary(conn, ids: List[str]):
+    """Recompute the goods_summary rows of the given goods IDs inside the caller's transaction."""
+    goods_cols = ["ID", "id_num"] + GOODS_FIELDS
+    col_sql = ", ".join([f"\"{c}\"" for c in goods_cols + list(SUMMARY_AGGREGATES)])
+    select_sql = ", ".join([f"g.\"{c}\"" for c in goods_cols] + list(SUMMARY_AGGREGATES.values()))
+    for start in range(0, len(ids), CHUNK_SIZE):
+        placeholders, params = _in_clause("id", ids[start:start + CHUNK_SIZE])
+        conn.execute(text(f"DELETE FROM goods_summary WHERE \"ID\" IN ({placeholders})"), params)
+        # sku_prices has one row per (sku, tenancy), so the 1-day join never multiplies SKU rows
+        conn.execute(text(f"""
+            INSERT INTO goods_summary ({col_sql})
+            SELECT {select_sql}
+            FROM goods g
+            LEFT JOIN skus s ON s."goods_id" = g."ID"
+            LEFT JOIN sku_prices p ON p."sku" = s."编号" AND p."tenancy_days" = 1
+            WHERE g."ID" IN ({placeholders})
+            GROUP BY g."ID"
+        """), params)
+
+def init_goods_summary():
+    """Rebuild goods_summary when it is out of step with goods (new table, or rows written before it existed)."""
+    with db.get_connection() as conn:
+        goods_count = conn.execute(text("SELECT COUNT(*) FROM goods")).scalar()
+        summary_count = conn.execute(text("SELECT COUNT(*) FROM goods_summary")).scalar()
+        if goods_count == summary_count:
+            return
+        logging.info(f"Rebuilding goods summary for {goods_count} goods...")
+        ids = [str(row[0]) for row in conn.execute(text("SELECT \"ID\" FROM goods")).fetchall()]
+        conn.execute(text("DELETE FROM goods_summary"))
+        refresh_goods_summary(conn, ids)
+        conn.commit()
+
+def load_summary_groups(conn, ids: List[str]) -> List[Dict[str, Any]]:
+    """/goods groups (without SKUs) for the given IDs from goods_summary, in the order of ids."""
+    groups_map = {}
+    for start in range(0, len(ids), CHUNK_SIZE):
+        placeholders, params = _in_clause("id", ids[start:start + CHUNK_SIZE])
+        result = conn.execute(text(f"SELECT * FROM goods_summary WHERE \"ID\" IN ({placeholders})"), params)
+        columns = list(result.keys())
+        for db_row in result:
+            record = dict(zip(columns, db_row))
+            group = {"ID": str(record["ID"])}
+            for col in GOODS_GROUP_FIELDS:
+                group[col] = clean_text(record.get(col))
+            group["库存"] = int(record.get("库存") or 0)
+            group["1天租金"] = format_money(record.get("1天租金"))
+            group["sku_count"] = int(record.get("sku_count") or 0)
+            groups_map[group["ID"]] = group
+    return [groups_map[gid] for gid in ids if gid in groups_map]
+
+def attach_skus(conn, groups: List[Dict[str, Any]], ids: List[str]):
+    """Set "skus" on each /goods group to its flat SKU rows."""
+    placeholders, params = _in_clause("id", ids)
+    flat_rows = iter_flat_rows(conn, f" WHERE g.\"ID\" IN ({placeholders})", params)
+    skus_map = {group["ID"]: group["skus"] for group in assemble_goods_groups(flat_rows, ids)}
+    for group in groups:
+        group["skus"] = skus_map.get(group["ID"], [])
@@ -0,0 +1,166 @@
+import os
+import zlib
+from typing import Optional
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Bodies smaller than this are sent as-is
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 4
+
+COMPRESSIBLE_TYPES = ("application/json", "application/x-ndjson", "application/javascript", "text/")
+
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    """Best supported coding the client accepts ("br" over "gzip"), honouring q=0."""
+    accepted = {}
+    for part in accept_encoding.split(","):
+        fields = [f.strip() for f in part.split(";")]
+        coding = fields[0].lower()
+        if not coding:
+            continue
+        q = 1.0
+        for field in fields[1:]:
+            if field.startswith("q="):
+                try:
+                    q = float(field[2:])
+                except ValueError:
+                    q = 0.0
+        accepted[coding] = q
+    for coding in (["br"] if brotli is not None else []) + ["gzip"]:
+        q = accepted.get(coding, accepted.get("*", 0.0))
+        if q > 0:
+            return coding
+    return None
+
+
+class _Encoder:
+    def __init__(self, coding: str):
+        self.coding = coding
+        if coding == "br":
+            self._compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+        else:
+            self._compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+
+    def chunk(self, data: bytes) -> bytes:
+        # Flushed per chunk so a streamed body reaches the client batch by batch
+        if self.coding == "br":
+            return self._compressor.process(data) + self._compressor.flush()
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self, data: bytes = b"") -> bytes:
+        if self.coding == "br":
+            return self._compressor.process(data) + self._compressor.finish()
+        return self._compressor.compress(data) + self._compressor.flush()
+
+
+class CompressionMiddleware:
+    """
+    ASGI middleware compressing text/JSON responses with brotli (when the
+    brotli package is installed) or gzip, whichever the client prefers.
+    Single-body responses under COMPRESSION_MIN_SIZE and bodies that already
+    carry a Content-Encoding are passed through; streamed bodies are
+    compressed chunk by chunk. Strong ETags become weak on compressed
+    responses, since the bytes differ per coding, so If-None-Match still matches.
+    Every response with a compressible content type carries
+    Vary: Accept-Encoding, compressed or not, so shared caches keep the
+    variants apart.
+    """
+
+    def __init__(self, app, minimum_size: int = COMPRESSION_MIN_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        accept = ""
+        for name, value in scope.get("headers", []):
+            if name == b"accept-encoding":
+                accept = value.decode("latin-1")
+                break
+        coding = choose_encoding(accept) if accept else None
+
+        start_message = None
+        encoder = None
+        passthrough = False
+
+        async def send_wrapper(message):
+            nonlocal start_message, encoder, passthrough
+            if message["type"] == "http.response.start":
+                headers = {k.lower(): v for k, v in message.get("headers", [])}
+                content_type = headers.get(b"content-type", b"").decode("latin-1")
+                compressible = content_type.startswith(COMPRESSIBLE_TYPES)
+                if compressible:
+                    message = {**message, "headers": _add_vary(message.get("headers", []))}
+                start_message = message
+                passthrough = (
+                    coding is None
+                    or b"content-encoding" in headers
+                    or message["status"] in (204, 304)
+                    or not compressible
+                )
+                if passthrough:
+                    await send(message)
+                return
+
+            if message["type"] != "http.response.body" or passthrough:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if encoder is None:
+                if not more_body and len(body) < self.minimum_size:
+                    passthrough = True
+                    await send(start_message)
+                    await send(message)
+                    return
+                encoder = _Encoder(coding)
+                if not more_body:
+                    data = encoder.finish(body)
+                    await send({**start_message, "headers": self._headers(start_message, coding, len(data))})
+                    await send({"type": "http.response.body", "body": data})
+                    return
+                await send({**start_message, "headers": self._headers(start_message, coding)})
+
+            data = encoder.chunk(body) if more_body else encoder.finish(body)
+            await send({"type": "http.response.body", "body": data, "more_body": more_body})
+
+        await self.app(scope, receive, send_wrapper)
+
+    @staticmethod
+    def _headers(start_message, coding: str, length: Optional[int] = None):
+        # start_message already carries Vary: Accept-Encoding
+        headers = []
+        for name, value in start_message.get("headers", []):
+            lower = name.lower()
+            if lower == b"content-length":
+                continue
+            if lower == b"etag" and not value.startswith(b"W/"):
+                value = b"W/" + value
+            headers.append((name, value))
+        headers.append((b"content-encoding", coding.encode("latin-1")))
+        if length is not None:
+            headers.append((b"content-length", str(length).encode("latin-1")))
+        return headers
+
+
+def _add_vary(headers):
+    """Headers with Accept-Encoding merged into Vary (one Vary header, no duplicates)."""
+    result = []
+    vary = []
+    for name, value in headers:
+        if name.lower() == b"vary":
+            vary.extend(v.strip() for v in value.split(b",") if v.strip())
+            continue
+        result.append((name, value))
+    if not any(v == b"*" or v.lower() == b"accept-encoding" for v in vary):
+        vary.append(b"Accept-Encoding")
+    result.append((b"vary", b", ".join(vary)))
+    return result
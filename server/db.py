@@ -1,8 +1,14 @@
+import io
 import os
+import time
+import asyncio
+import threading
+import importlib.util
 import sqlalchemy
-from sqlalchemy import create_engine, text, inspect
+from sqlalchemy import create_engine, text, inspect, event
 import pandas as pd
 from datetime import datetime
+from typing import Any, Dict, List, Optional
 
 import logging
 
@@ -26,22 +32,496 @@ if not DATABASE_URL:
 
 print(f"Connecting to database: {DATABASE_URL}")
 
-connect_args = {}
-if "postgresql" in str(DATABASE_URL):
-    connect_args["connect_timeout"] = 5
+# Postgres pool
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "1") not in ("0", "false", "False")
+# SQLite pragmas: WAL lets readers continue while a merge holds the write lock
+SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+SQLITE_CACHE_SIZE_KB = int(os.getenv("SQLITE_CACHE_SIZE_KB", "20000"))
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
 
-engine = create_engine(DATABASE_URL, connect_args=connect_args)
+
+class PoolMetrics:
+    """Checkout counts and how long callers waited in get_connection for a pooled connection."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.connects = 0
+        self.checkouts = 0
+        self.checkins = 0
+        self.in_use = 0
+        self.max_in_use = 0
+        self.timeouts = 0
+        self.waits = 0
+        self.wait_total_ms = 0.0
+        self.wait_max_ms = 0.0
+
+    def on_connect(self):
+        with self._lock:
+            self.connects += 1
+
+    def on_checkout(self):
+        with self._lock:
+            self.checkouts += 1
+            self.in_use += 1
+            self.max_in_use = max(self.max_in_use, self.in_use)
+
+    def on_checkin(self):
+        with self._lock:
+            self.checkins += 1
+            self.in_use = max(self.in_use - 1, 0)
+
+    def on_wait(self, seconds: float, timed_out: bool = False):
+        with self._lock:
+            ms = seconds * 1000
+            self.waits += 1
+            self.wait_total_ms += ms
+            self.wait_max_ms = max(self.wait_max_ms, ms)
+            if timed_out:
+                self.timeouts += 1
+
+    def stats(self, pool=None) -> Dict[str, Any]:
+        with self._lock:
+            data = {
+                "connects": self.connects,
+                "checkouts": self.checkouts,
+                "checkins": self.checkins,
+                "in_use": self.in_use,
+                "max_in_use": self.max_in_use,
+                "timeouts": self.timeouts,
+                "wait_avg_ms": round(self.wait_total_ms / self.waits, 3) if self.waits else 0.0,
+                "wait_max_ms": round(self.wait_max_ms, 3)
+            }
+        if pool is not None:
+            data["pool"] = pool.status()
+        return data
+
+
+pool_metrics = PoolMetrics()
+
+def _apply_sqlite_pragmas(dbapi_conn, connection_record):
+    cursor = dbapi_conn.cursor()
+    # SQLite only enforces REFERENCES ... ON DELETE CASCADE when asked to
+    cursor.execute("PRAGMA foreign_keys=ON")
+    cursor.execute(f"PRAGMA journal_mode={SQLITE_JOURNAL_MODE}")
+    cursor.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+    cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    # Negative cache_size is in KiB
+    cursor.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KB}")
+    cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+    cursor.close()
+
+def make_engine(url: str):
+    """Engine for url with the pool / pragma settings above and pool_metrics hooked in."""
+    if "postgresql" in str(url):
+        new_engine = create_engine(
+            url,
+            connect_args={"connect_timeout": 5},
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT,
+            pool_recycle=DB_POOL_RECYCLE,
+            pool_pre_ping=DB_POOL_PRE_PING,
+        )
+    else:
+        # The sqlite3 driver's own busy wait, in seconds, matches the pragma
+        new_engine = create_engine(url, connect_args={"timeout": SQLITE_BUSY_TIMEOUT_MS / 1000})
+        event.listen(new_engine, "connect", _apply_sqlite_pragmas)
+    event.listen(new_engine.pool, "connect", lambda dbapi_conn, record: pool_metrics.on_connect())
+    event.listen(new_engine.pool, "checkout", lambda dbapi_conn, record, proxy: pool_metrics.on_checkout())
+    event.listen(new_engine.pool, "checkin", lambda dbapi_conn, record: pool_metrics.on_checkin())
+    return new_engine
+
+engine = make_engine(DATABASE_URL)
+
+# Async drivers for the async engine; without them async reads fall back to the sync engine
+ASYNC_DRIVERS = {"sqlite": "aiosqlite", "postgresql": "asyncpg"}
+
+def async_database_url(url: str) -> Optional[str]:
+    scheme, sep, rest = str(url).partition("://")
+    if not sep:
+        return None
+    dialect = scheme.split("+", 1)[0]
+    driver = ASYNC_DRIVERS.get(dialect)
+    if driver is None:
+        return None
+    if importlib.util.find_spec(driver) is None or importlib.util.find_spec("greenlet") is None:
+        return None
+    return f"{dialect}+{driver}://{rest}"
+
+def make_async_engine(url: str):
+    """Async engine with the same pool / pragma settings as make_engine, or None when no async driver is installed."""
+    async_url = async_database_url(url)
+    if async_url is None:
+        return None
+    try:
+        from sqlalchemy.ext.asyncio import create_async_engine
+        if async_url.startswith("postgresql"):
+            new_engine = create_async_engine(
+                async_url,
+                connect_args={"timeout": 5},
+                pool_size=DB_POOL_SIZE,
+                max_overflow=DB_MAX_OVERFLOW,
+                pool_timeout=DB_POOL_TIMEOUT,
+                pool_recycle=DB_POOL_RECYCLE,
+                pool_pre_ping=DB_POOL_PRE_PING,
+            )
+        else:
+            new_engine = create_async_engine(async_url, connect_args={"timeout": SQLITE_BUSY_TIMEOUT_MS / 1000})
+            event.listen(new_engine.sync_engine, "connect", _apply_sqlite_pragmas)
+    except Exception as e:
+        logging.warning(f"Async engine unavailable, reads use the sync engine: {e}")
+        return None
+    event.listen(new_engine.sync_engine.pool, "connect", lambda dbapi_conn, record: pool_metrics.on_connect())
+    event.listen(new_engine.sync_engine.pool, "checkout", lambda dbapi_conn, record, proxy: pool_metrics.on_checkout())
+    event.listen(new_engine.sync_engine.pool, "checkin", lambda dbapi_conn, record: pool_metrics.on_checkin())
+    return new_engine
+
+async_engine = make_async_engine(DATABASE_URL)
+
+# The pre-normalization wide goods table is renamed to this before migration
+LEGACY_GOODS_TABLE = "goods_legacy"
+# goods columns that are not part of the scraper-shaped row
+GOODS_INTERNAL_COLUMNS = ["id_num"]
+
+# One row per batch of columns added by ensure_columns
+SCHEMA_VERSIONS_TABLE = "schema_versions"
+# Header fragments that make a new scraped column NUMERIC / INTEGER instead of TEXT
+NUMERIC_COLUMN_HINTS = ("价", "金", "费")
+INTEGER_COLUMN_HINTS = ("库存", "数量", "销量")
+
+# Indexes backing the /goods filters and sort options, on goods_summary (the
+# table the list reads): (sort key, "ID"), with the equality filters in front.
+# catalog.goods_page_query reads the non-NULL keys with a (key, "ID") range seek
+# and the NULL keys by "ID", both straight off these.
+GOODS_INDEXES = {
+    "idx_goods_summary_id_num": '("id_num", "ID")',
+    "idx_goods_summary_merchant_id": '("merchant", "id_num", "ID")',
+    "idx_goods_summary_sync_id": '("是否同步支付宝", "id_num", "ID")',
+    "idx_goods_summary_submit_id": '("最近提交时间", "ID")',
+    "idx_goods_summary_name_id": '("商品名称", "ID")',
+    "idx_goods_summary_alipay_id": '("支付宝编码", "ID")',
+    "idx_goods_summary_rent_1d_id": '("1天租金", "ID")',
+}
+# Earlier list indexes: expression indexes the seek cannot range-scan on, then
+# the same composites on goods before the list moved to goods_summary
+SUPERSEDED_GOODS_INDEXES = [
+    "idx_goods_id_asc", "idx_goods_id_desc", "idx_goods_merchant", "idx_goods_sync",
+    "idx_goods_submit_asc", "idx_goods_submit_desc", "idx_goods_name", "idx_goods_alipay_code",
+    "idx_goods_id_num", "idx_goods_merchant_id", "idx_goods_sync_id",
+    "idx_goods_submit_id", "idx_goods_name_id", "idx_goods_alipay_id",
+]
 
 def get_connection():
-    return engine.connect()
+    started = time.perf_counter()
+    try:
+        conn = engine.connect()
+    except sqlalchemy.exc.TimeoutError:
+        pool_metrics.on_wait(time.perf_counter() - started, timed_out=True)
+        raise
+    pool_metrics.on_wait(time.perf_counter() - started)
+    return conn
+
+def pool_stats() -> Dict[str, Any]:
+    data = pool_metrics.stats(engine.pool)
+    data["async_pool"] = async_engine.sync_engine.pool.status() if async_engine is not None else None
+    return data
+
+async def run_read(fn, *args, heavy: bool = False):
+    """
+    Run fn(conn, *args) for an async endpoint. On the async engine fn gets a
+    sync-style Connection through run_sync, so the same query code serves
+    both paths; without an async driver it runs on the sync engine in a thread.
+
+    run_sync only awaits the driver calls: fn's own Python work runs on the
+    event-loop thread. heavy=True is for fn that assembles large results
+    (thousands of rows into dicts); it then runs on the sync engine in a
+    worker thread, so the loop keeps serving other requests meanwhile.
+    """
+    if async_engine is not None and not heavy:
+        started = time.perf_counter()
+        async with async_engine.connect() as conn:
+            pool_metrics.on_wait(time.perf_counter() - started)
+            return await conn.run_sync(fn, *args)
+
+    def call():
+        with get_connection() as conn:
+            return fn(conn, *args)
+    return await asyncio.to_thread(call)
 
 def is_postgres():
     return "postgresql" in str(engine.url)
 
+
+class SchemaRegistry:
+    """
+    Table and column names (with their declared types), read from the
+    database catalog once and served from memory afterwards. DDL issued by
+    the app either calls invalidate() or records what it did (add_table /
+    add_columns / drop_table) so the next lookup needs no introspection.
+    Column additions are numbered in schema_versions; refresh_if_stale()
+    compares that number with the cached one, so a column added by another
+    worker is picked up without re-reading the catalog every time.
+    """
+
+    def __init__(self):
+        self._tables: Optional[Dict[str, Dict[str, str]]] = None
+        self._version = 0
+        # Re-entrant: closing the loading connection fires the rollback hook
+        self._lock = threading.RLock()
+        # DDL recorded in a transaction that has not committed yet
+        self._pending = False
+        self.loads = 0
+        self.catalog_queries = 0
+        self.lookups = 0
+        self.version_checks = 0
+
+    def _ensure_loaded(self, conn=None) -> Dict[str, Dict[str, str]]:
+        with self._lock:
+            self.lookups += 1
+            if self._tables is not None:
+                return self._tables
+            if conn is not None:
+                tables = self._load(conn)
+            else:
+                with get_connection() as own_conn:
+                    tables = self._load(own_conn)
+            self._tables = tables
+            self.loads += 1
+            return tables
+
+    def _load(self, conn) -> Dict[str, Dict[str, str]]:
+        inspector = inspect(conn)
+        names = inspector.get_table_names()
+        tables = {name: {col["name"]: str(col["type"]) for col in inspector.get_columns(name)} for name in names}
+        # get_table_names plus one get_columns per table
+        self.catalog_queries += 1 + len(names)
+        self._version = self._read_version(conn) if SCHEMA_VERSIONS_TABLE in tables else 0
+        return tables
+
+    @staticmethod
+    def _read_version(conn) -> int:
+        return conn.execute(text(f"SELECT COALESCE(MAX(version), 0) FROM {SCHEMA_VERSIONS_TABLE}")).scalar() or 0
+
+    def has_table(self, table_name: str, conn=None) -> bool:
+        return table_name in self._ensure_loaded(conn)
+
+    def columns(self, table_name: str, conn=None) -> List[str]:
+        return list(self._ensure_loaded(conn).get(table_name, {}))
+
+    def column_types(self, table_name: str, conn=None) -> Dict[str, str]:
+        return dict(self._ensure_loaded(conn).get(table_name, {}))
+
+    def table_names(self, conn=None) -> List[str]:
+        return sorted(self._ensure_loaded(conn))
+
+    @property
+    def version(self) -> int:
+        return self._version
+
+    def refresh_if_stale(self, conn):
+        """Drop the cache when schema_versions moved past the cached version (one cheap query)."""
+        with self._lock:
+            if self._tables is None or SCHEMA_VERSIONS_TABLE not in self._tables:
+                return
+            self.version_checks += 1
+            if self._read_version(conn) != self._version:
+                self.invalidate()
+
+    def add_table(self, table_name: str, columns: Dict[str, str]):
+        # Record a table just created in the caller's transaction; a rollback reloads
+        with self._lock:
+            if self._tables is not None:
+                self._tables[table_name] = dict(columns)
+            self._pending = True
+
+    def drop_table(self, table_name: str):
+        with self._lock:
+            if self._tables is not None:
+                self._tables.pop(table_name, None)
+            self._pending = True
+
+    def add_columns(self, table_name: str, columns: Dict[str, str], version: Optional[int] = None):
+        # Record columns just ALTERed in the caller's transaction; a rollback reloads
+        with self._lock:
+            if self._tables is not None and table_name in self._tables:
+                for col, col_type in columns.items():
+                    self._tables[table_name].setdefault(col, col_type)
+            if version is not None:
+                self._version = version
+            self._pending = True
+
+    def set_column_type(self, table_name: str, column: str, col_type: str, version: Optional[int] = None):
+        # Record a column retyped in the caller's transaction; a rollback reloads
+        with self._lock:
+            if self._tables is not None and table_name in self._tables:
+                self._tables[table_name][column] = col_type
+            if version is not None:
+                self._version = version
+            self._pending = True
+
+    def invalidate(self):
+        with self._lock:
+            self._tables = None
+            self._pending = False
+
+    def on_commit(self):
+        self._pending = False
+
+    def on_rollback(self):
+        if self._pending:
+            self.invalidate()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            # Every lookup served from memory would have been at least one catalog query
+            return {
+                "loads": self.loads,
+                "catalog_queries": self.catalog_queries,
+                "lookups": self.lookups,
+                "saved_queries": self.lookups - self.loads,
+                "tables": len(self._tables) if self._tables is not None else 0,
+                "version": self._version,
+                "version_checks": self.version_checks
+            }
+
+
+schema = SchemaRegistry()
+
+@event.listens_for(engine, "commit")
+def _schema_on_commit(conn):
+    schema.on_commit()
+
+@event.listens_for(engine, "rollback")
+def _schema_on_rollback(conn):
+    schema.on_rollback()
+
+def has_table(conn, table_name: str) -> bool:
+    return schema.has_table(table_name, conn)
+
+def _rename_legacy_goods(conn):
+    # The old goods table held one wide TEXT row per SKU, with the SKU spec in "SKU"
+    if not schema.has_table("goods", conn) or schema.has_table(LEGACY_GOODS_TABLE, conn):
+        return
+    if "SKU" in schema.columns("goods", conn):
+        logging.info(f"Renaming legacy goods table to {LEGACY_GOODS_TABLE}...")
+        conn.execute(text(f'ALTER TABLE goods RENAME TO {LEGACY_GOODS_TABLE}'))
+        schema.invalidate()
+
+def _ensure_goods_id_num(conn):
+    # Databases created before id_num existed get the column and a backfill
+    if "id_num" not in schema.columns("goods", conn):
+        logging.info("Adding id_num column to goods...")
+        conn.execute(text('ALTER TABLE goods ADD COLUMN "id_num" BIGINT'))
+        schema.invalidate()
+    if is_postgres():
+        numeric_id = '"ID" ~ \'^[0-9]{1,18}$\''
+    else:
+        numeric_id = '"ID" <> \'\' AND "ID" NOT GLOB \'*[^0-9]*\' AND length("ID") <= 18'
+    conn.execute(text(f'UPDATE goods SET "id_num" = CAST("ID" AS BIGINT) WHERE "id_num" IS NULL AND {numeric_id}'))
+    # A missing submit time is NULL so it can sort last straight off the index
+    conn.execute(text('UPDATE goods SET "最近提交时间" = NULL WHERE "最近提交时间" = \'\''))
+
+def _ensure_sku_row_hash(conn):
+    # SKUs written before diff merging have no hash; the next merge rewrites them once
+    if "row_hash" not in schema.columns("skus", conn):
+        logging.info("Adding row_hash column to skus...")
+        conn.execute(text('ALTER TABLE skus ADD COLUMN "row_hash" TEXT'))
+        schema.invalidate()
+
+def _create_goods_indexes(conn):
+    for name in SUPERSEDED_GOODS_INDEXES:
+        conn.execute(text(f'DROP INDEX IF EXISTS {name}'))
+    for name, columns in GOODS_INDEXES.items():
+        conn.execute(text(f'CREATE INDEX IF NOT EXISTS {name} ON goods_summary {columns}'))
+
+def explain(conn, sql: str, params: dict = None) -> list:
+    # Plan text lines for a query, for /debug/explain
+    if is_postgres():
+        rows = conn.execute(text(f"EXPLAIN {sql}"), params or {}).fetchall()
+        return [row[0] for row in rows]
+    rows = conn.execute(text(f"EXPLAIN QUERY PLAN {sql}"), params or {}).fetchall()
+    return [row[-1] for row in rows]
+
+def _copy_text(value) -> str:
+    # One field of COPY's text format: \N is NULL, backslash escapes the rest
+    if value is None:
+        return "\\N"
+    if isinstance(value, bool):
+        return "t" if value else "f"
+    return (str(value).replace("\\", "\\\\").replace("\t", "\\t")
+            .replace("\n", "\\n").replace("\r", "\\r"))
+
+def _copy_rows(conn, table_name: str, columns: List[str], rows: List[tuple]) -> bool:
+    """COPY rows into table_name over the caller's connection; False when the driver has no COPY support."""
+    cursor = conn.connection.driver_connection.cursor()
+    if not hasattr(cursor, "copy_expert"):
+        return False
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write("\t".join(_copy_text(value) for value in row))
+        buffer.write("\n")
+    buffer.seek(0)
+    col_sql = ", ".join(f'"{c}"' for c in columns)
+    try:
+        cursor.copy_expert(f'COPY "{table_name}" ({col_sql}) FROM STDIN', buffer)
+    finally:
+        cursor.close()
+    return True
+
+def bulk_write(conn, table_name: str, columns: List[str], records: List[Dict[str, Any]], conflict: Optional[List[str]] = None) -> int:
+    """
+    Load records (dicts keyed by column) into table_name inside the caller's
+    transaction. With conflict, rows whose conflict columns already exist
+    update the other columns instead.
+
+    Postgres streams the rows with COPY FROM STDIN (through a temp table when
+    upserting); SQLite runs one prepared INSERT through executemany. Returns
+    the number of records written. Caller commits.
+    """
+    if not records:
+        return 0
+    rows = [tuple(record.get(c) for c in columns) for record in records]
+    col_sql = ", ".join(f'"{c}"' for c in columns)
+    on_conflict = ""
+    if conflict:
+        updates = [c for c in columns if c not in conflict]
+        conflict_sql = ", ".join(f'"{c}"' for c in conflict)
+        if updates:
+            update_sql = ", ".join(f'"{c}" = excluded."{c}"' for c in updates)
+            on_conflict = f" ON CONFLICT ({conflict_sql}) DO UPDATE SET {update_sql}"
+        else:
+            on_conflict = f" ON CONFLICT ({conflict_sql}) DO NOTHING"
+
+    if conn.dialect.name == "postgresql":
+        if not conflict:
+            if _copy_rows(conn, table_name, columns, rows):
+                return len(rows)
+        else:
+            staging = f"_bulk_{table_name}"
+            conn.execute(text(f'CREATE TEMP TABLE "{staging}" (LIKE "{table_name}" INCLUDING DEFAULTS)'))
+            try:
+                if _copy_rows(conn, staging, columns, rows):
+                    conn.execute(text(f'INSERT INTO "{table_name}" ({col_sql}) SELECT {col_sql} FROM "{staging}"{on_conflict}'))
+                    return len(rows)
+            finally:
+                conn.execute(text(f'DROP TABLE "{staging}"'))
+
+    # Driver-level executemany: the statement is prepared once for all rows
+    mark = "%s" if conn.dialect.paramstyle in ("format", "pyformat") else "?"
+    placeholders = ", ".join([mark] * len(columns))
+    conn.exec_driver_sql(f'INSERT INTO "{table_name}" ({col_sql}) VALUES ({placeholders}){on_conflict}', rows)
+    return len(rows)
+
 def init_tables():
     logging.info("Checking database tables...")
     try:
-        with engine.connect() as conn:
+        with get_connection() as conn:
             # Task Status Table
             logging.info("Creating task_status table if not exists...")
             conn.execute(text("""
@@ -64,10 +544,109 @@ def init_tables():
                     value TEXT
                 )
             """))
+
+            conn.execute(text(f"""
+                CREATE TABLE IF NOT EXISTS {SCHEMA_VERSIONS_TABLE} (
+                    version INTEGER PRIMARY KEY,
+                    table_name TEXT NOT NULL,
+                    columns TEXT NOT NULL,
+                    applied_at TEXT
+                )
+            """))
+
+            # Data version counters behind the response caches and ETags (see cache.bump_version)
+            conn.execute(text("""
+                CREATE TABLE IF NOT EXISTS data_versions (
+                    name TEXT PRIMARY KEY,
+                    version INTEGER NOT NULL,
+                    token TEXT NOT NULL
+                )
+            """))
+
+            # Catalog Tables: one row per goods ID, one per SKU, one per SKU and tenancy
+            schema.invalidate()
+            _rename_legacy_goods(conn)
+            logging.info("Creating catalog tables if not exists...")
+            conn.execute(text("""
+                CREATE TABLE IF NOT EXISTS goods (
+                    "ID" TEXT PRIMARY KEY,
+                    "id_num" BIGINT,
+                    "商品名称" TEXT,
+                    "短标题" TEXT,
+                    "1级分类" TEXT,
+                    "2级分类" TEXT,
+                    "3级分类" TEXT,
+                    "merchant" TEXT,
+                    "是否同步支付宝" TEXT,
+                    "最近提交时间" TEXT,
+                    "商品图片" TEXT,
+                    "支付宝编码" TEXT
+                )
+            """))
+            conn.execute(text("""
+                CREATE TABLE IF NOT EXISTS skus (
+                    "编号" TEXT PRIMARY KEY,
+                    "goods_id" TEXT NOT NULL REFERENCES goods ("ID") ON DELETE CASCADE,
+                    "position" INTEGER NOT NULL DEFAULT 0,
+                    "row_hash" TEXT,
+                    "SKU" TEXT,
+                    "库存" INTEGER,
+                    "市场价" NUMERIC(12, 2),
+                    "押金" NUMERIC(12, 2),
+                    "购买价" NUMERIC(12, 2),
+                    "采购价" NUMERIC(12, 2)
+                )
+            """))
+            conn.execute(text("""
+                CREATE TABLE IF NOT EXISTS sku_prices (
+                    "sku" TEXT NOT NULL REFERENCES skus ("编号") ON DELETE CASCADE,
+                    "tenancy_days" INTEGER NOT NULL,
+                    "rent" NUMERIC(12, 2),
+                    PRIMARY KEY ("sku", "tenancy_days")
+                )
+            """))
+            conn.execute(text('CREATE INDEX IF NOT EXISTS idx_skus_goods_id ON skus ("goods_id", "position")'))
+            # Append-only: one row per SKU price field and merge in which its value changed
+            conn.execute(text("""
+                CREATE TABLE IF NOT EXISTS price_history (
+                    "sku" TEXT NOT NULL,
+                    "field" TEXT NOT NULL,
+                    "changed_at" TEXT NOT NULL,
+                    "goods_id" TEXT NOT NULL,
+                    "value" NUMERIC(12, 2),
+                    PRIMARY KEY ("sku", "field", "changed_at")
+                )
+            """))
+            conn.execute(text('CREATE INDEX IF NOT EXISTS idx_price_history_goods ON price_history ("goods_id", "sku", "field", "changed_at")'))
+            # One list row per goods: the goods fields plus SKU aggregates, kept up to date by catalog writes
+            conn.execute(text("""
+                CREATE TABLE IF NOT EXISTS goods_summary (
+                    "ID" TEXT PRIMARY KEY REFERENCES goods ("ID") ON DELETE CASCADE,
+                    "id_num" BIGINT,
+                    "商品名称" TEXT,
+                    "短标题" TEXT,
+                    "1级分类" TEXT,
+                    "2级分类" TEXT,
+                    "3级分类" TEXT,
+                    "merchant" TEXT,
+                    "是否同步支付宝" TEXT,
+                    "最近提交时间" TEXT,
+                    "商品图片" TEXT,
+                    "支付宝编码" TEXT,
+                    "库存" INTEGER NOT NULL DEFAULT 0,
+                    "1天租金" NUMERIC(12, 2),
+                    "sku_count" INTEGER NOT NULL DEFAULT 0
+                )
+            """))
+            schema.invalidate()
+            _ensure_goods_id_num(conn)
+            _ensure_sku_row_hash(conn)
+            _create_goods_indexes(conn)
             conn.commit()
+            schema.invalidate()
             logging.info("Tables created successfully.")
             
-        with engine.connect() as conn:
+        with get_connection() as conn:
             # Initialize task_status if empty
             # Use dialect-specific UPSERT/IGNORE
             logging.info("Initializing default task status...")
@@ -90,28 +669,118 @@ def init_tables():
         logging.error(f"Error in init_tables: {e}")
         raise
 
-def ensure_columns(table_name: str, columns: list):
-    inspector = inspect(engine)
-    existing_cols = [col['name'] for col in inspector.get_columns(table_name)]
-    
-    with engine.connect() as conn:
-        for col in columns:
-            if col not in existing_cols:
-                # SQLite and Postgres support ADD COLUMN
-                # But we need to be careful with types. Defaulting to TEXT for simplicity as per original code.
-                conn.execute(text(f'ALTER TABLE "{table_name}" ADD COLUMN "{col}" TEXT'))
-        conn.commit()
-
-def upsert_config(key: str, value: str):
-    with engine.connect() as conn:
-        if is_postgres():
-            conn.execute(text("""
-                INSERT INTO config (key, value) VALUES (:key, :value)
-                ON CONFLICT (key) DO UPDATE SET value = EXCLUDED.value
-            """), {"key": key, "value": value})
+def column_affinity(type_name: str) -> str:
+    """Collapse a declared column type to INTEGER, NUMERIC or TEXT."""
+    upper = (type_name or "").upper()
+    if "INT" in upper:
+        return "INTEGER"
+    if any(t in upper for t in ("NUM", "DEC", "REAL", "FLOA", "DOUB")):
+        return "NUMERIC"
+    return "TEXT"
+
+def infer_column_type(column: str) -> str:
+    """Column type for a new scraped header: money-like names are NUMERIC, counts INTEGER, the rest TEXT."""
+    if any(hint in column for hint in NUMERIC_COLUMN_HINTS):
+        return "NUMERIC(12, 2)"
+    if any(hint in column for hint in INTEGER_COLUMN_HINTS):
+        return "INTEGER"
+    return "TEXT"
+
+def ensure_columns(table_name: str, columns: list, conn=None, types: Optional[Dict[str, str]] = None, versioned: bool = True) -> List[str]:
+    """
+    Add the columns of table_name that don't exist yet, all in one
+    transaction, typed from types or infer_column_type. Existing columns
+    come from the schema registry, so no introspection happens when nothing
+    is missing. Each batch of added columns gets a row in schema_versions
+    (unless versioned is False, for scratch tables). Returns the added names.
+
+    Pass conn when the caller already holds a write transaction (SQLite would
+    lock otherwise); the caller then owns the commit.
+    """
+    if conn is None:
+        with get_connection() as own_conn:
+            added = ensure_columns(table_name, columns, own_conn, types, versioned)
+            own_conn.commit()
+        return added
+
+    if versioned:
+        schema.refresh_if_stale(conn)
+    existing = set(schema.columns(table_name, conn))
+    missing = [col for col in dict.fromkeys(columns) if col not in existing]
+    if not missing:
+        return []
+    col_types = {col: (types or {}).get(col) or infer_column_type(col) for col in missing}
+    if conn.dialect.name == "postgresql":
+        # One statement, one table rewrite at most
+        adds = ", ".join(f'ADD COLUMN IF NOT EXISTS "{col}" {col_type}' for col, col_type in col_types.items())
+        conn.execute(text(f'ALTER TABLE "{table_name}" {adds}'))
+    else:
+        # SQLite takes one column per ALTER; ADD COLUMN only touches the schema, not the rows
+        for col, col_type in col_types.items():
+            conn.execute(text(f'ALTER TABLE "{table_name}" ADD COLUMN "{col}" {col_type}'))
+
+    version = _record_schema_version(conn, table_name, col_types) if versioned else None
+    schema.add_columns(table_name, col_types, version)
+    logging.info(f"Added columns to {table_name}: {col_types}")
+    return missing
+
+def _record_schema_version(conn, table_name: str, col_types: Dict[str, str]) -> Optional[int]:
+    # Number one schema change in schema_versions; None before the table exists
+    if not schema.has_table(SCHEMA_VERSIONS_TABLE, conn):
+        return None
+    version = (conn.execute(text(f"SELECT COALESCE(MAX(version), 0) FROM {SCHEMA_VERSIONS_TABLE}")).scalar() or 0) + 1
+    conn.execute(
+        text(f"INSERT INTO {SCHEMA_VERSIONS_TABLE} (version, table_name, columns, applied_at) VALUES (:version, :table_name, :columns, :applied_at)"),
+        {"version": version, "table_name": table_name, "columns": ", ".join(f"{c} {t}" for c, t in col_types.items()), "applied_at": datetime.utcnow().isoformat()}
+    )
+    return version
+
+def widen_column_to_text(conn, table_name: str, column: str, versioned: bool = True) -> bool:
+    """
+    Retype a NUMERIC / INTEGER column of table_name to TEXT in the caller's
+    transaction, keeping stored values as their text rendering (money with
+    two decimals). Used when a scrape brings a value the inferred type can't
+    hold. The change gets a schema_versions row unless versioned is False.
+    Returns False when the column already is TEXT or doesn't exist.
+    """
+    if versioned:
+        schema.refresh_if_stale(conn)
+    col_type = schema.column_types(table_name, conn).get(column)
+    if col_type is None or column_affinity(col_type) == "TEXT":
+        return False
+    if conn.dialect.name == "postgresql":
+        conn.execute(text(f'ALTER TABLE "{table_name}" ALTER COLUMN "{column}" TYPE TEXT USING "{column}"::text'))
+    else:
+        # SQLite can't retype a column: copy it into a new TEXT column and swap the names
+        scratch = f"{column}__text"
+        if column_affinity(col_type) == "NUMERIC":
+            rendered = f"CASE WHEN typeof(\"{column}\") IN ('integer', 'real') THEN printf('%.2f', \"{column}\") ELSE \"{column}\" END"
         else:
-            conn.execute(text("""
-                INSERT INTO config (key, value) VALUES (:key, :value)
-                ON CONFLICT(key) DO UPDATE SET value = excluded.value
-            """), {"key": key, "value": value})
-        conn.commit()
+            rendered = f'CAST("{column}" AS TEXT)'
+        conn.execute(text(f'ALTER TABLE "{table_name}" ADD COLUMN "{scratch}" TEXT'))
+        conn.execute(text(f'UPDATE "{table_name}" SET "{scratch}" = {rendered}'))
+        conn.execute(text(f'ALTER TABLE "{table_name}" DROP COLUMN "{column}"'))
+        conn.execute(text(f'ALTER TABLE "{table_name}" RENAME COLUMN "{scratch}" TO "{column}"'))
+    version = _record_schema_version(conn, table_name, {column: "TEXT"}) if versioned else None
+    schema.set_column_type(table_name, column, "TEXT", version)
+    logging.warning(f"Widened {table_name}.{column} from {col_type} to TEXT")
+    return True
+
+
+def upsert_config(key: str, value: str, conn=None):
+    # With conn the caller owns the transaction (e.g. to bump a data version in it)
+    if conn is None:
+        with get_connection() as own_conn:
+            upsert_config(key, value, own_conn)
+            own_conn.commit()
+        return
+    if is_postgres():
+        conn.execute(text("""
+            INSERT INTO config (key, value) VALUES (:key, :value)
+            ON CONFLICT (key) DO UPDATE SET value = EXCLUDED.value
+        """), {"key": key, "value": value})
+    else:
+        conn.execute(text("""
+            INSERT INTO config (key, value) VALUES (:key, :value)
+            ON CONFLICT(key) DO UPDATE SET value = excluded.value
+        """), {"key": key, "value": value})
@@ -9,19 +9,26 @@ import math
 import io
 import uuid
 import logging
+import asyncio
 import re
 import locale
 from datetime import datetime
 from typing import List, Optional, Dict, Any
-from fastapi import FastAPI, HTTPException, BackgroundTasks, Query, Body, Request
+from fastapi import FastAPI, HTTPException, BackgroundTasks, Query, Body, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.concurrency import run_in_threadpool
 from fastapi.responses import StreamingResponse, JSONResponse
 from pydantic import BaseModel
 from sqlalchemy import text
-import sqlalchemy
 import db
+import catalog
+import search_index
+import cache
+import serialization
+import scrape_journal
+from compression import CompressionMiddleware
 
-app = FastAPI()
+app = FastAPI(default_response_class=serialization.FastJSONResponse)
 
 app.add_middleware(
     CORSMiddleware,
@@ -30,6 +37,7 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(CompressionMiddleware)
 
 # Paths
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -39,8 +47,21 @@ UPDATE_SCRIPT_PATH = os.path.join(BASE_DIR, "update_goods.py")
 ALIPAY_SCRIPT_PATH = os.path.join(BASE_DIR, "alipay_product_automation.py")
 SCRAPE_SCRIPT_PATH = os.path.join(BASE_DIR, "scrape_goods.py")
 SCRAPE_OUTPUT_FILE = os.path.join(BASE_DIR, "scrape_goods_data.json")
+# Incremental scrapes: stored list-page state handed to the scraper, and its report of new/changed/delisted IDs
+SCRAPE_KNOWN_FILE = os.path.join(BASE_DIR, "scrape_goods_known.json")
+SCRAPE_MANIFEST_FILE = os.path.join(BASE_DIR, "scrape_goods_manifest.json")
+# Run journals of scrape_goods.py (its default GOODS_JOURNAL_DIR, relative to BASE_DIR)
+SCRAPE_JOURNAL_DIR = os.path.join(BASE_DIR, "scrape_runs")
+SCRAPE_RUNS_KEEP = int(os.getenv("GOODS_SCRAPE_RUNS_KEEP", "10"))
+# Delete goods an incremental scrape no longer finds on the list pages; off, they are only reported
+SCRAPE_PRUNE_DELETED = os.getenv("GOODS_SCRAPE_PRUNE_DELETED", "false").lower() == "true"
 RENT_CURVES_PATH = os.path.join(os.path.dirname(__file__), "data", "rent_curves.json")
 
+# Goods per batch in /goods/stream; each batch is one keyset page on its own connection
+GOODS_STREAM_BATCH_SIZE = 200
+# ids per /goods/stream?ids= request; stays under SQLite's default bound-parameter limit
+MAX_STREAM_IDS = 500
+
 AUTOMATION_STATUS_FILE = os.path.join(BASE_DIR, "automation_status.json")
 CAPTCHA_INPUT_FILE = os.path.join(BASE_DIR, "captcha_input.txt")
 AUTOMATION_DATA_FILE = os.path.join(BASE_DIR, "automation_data.json")
@@ -72,28 +93,32 @@ DB_STATUS = {"connected": False, "error": None}
 
 def init_db():
     db.init_tables()
+    catalog.migrate_legacy_goods()
+    catalog.init_goods_summary()
+    search_index.init_search_index()
 
 
+def read_task_status(conn) -> Dict[str, Any]:
+    if not db.has_table(conn, "task_status"):
+        return TASK_STATUS.copy()
+    row = conn.execute(text("SELECT running, task_name, message, progress, pid, updated_at FROM task_status WHERE id = 1")).fetchone()
+    if not row:
+        return TASK_STATUS.copy()
+    return {
+        "running": bool(row[0]),
+        "task_name": row[1],
+        "message": row[2] or "",
+        "progress": row[3] or 0,
+        "pid": row[4],
+        "updated_at": row[5]
+    }
+
 def load_task_status_from_db():
     try:
         with db.get_connection() as conn:
-            inspector = sqlalchemy.inspect(conn)
-            if not inspector.has_table("task_status"):
+            if not db.has_table(conn, "task_status"):
                 db.init_tables()
-                inspector = sqlalchemy.inspect(conn)
-                if not inspector.has_table("task_status"):
-                    return TASK_STATUS.copy()
-            row = conn.execute(text("SELECT running, task_name, message, progress, pid, updated_at FROM task_status WHERE id = 1")).fetchone()
-            if not row:
-                return TASK_STATUS.copy()
-            return {
-                "running": bool(row[0]),
-                "task_name": row[1],
-                "message": row[2] or "",
-                "progress": row[3] or 0,
-                "pid": row[4],
-                "updated_at": row[5]
-            }
+            return read_task_status(conn)
     except Exception as e:
         logging.error(f"Failed to load task status from DB: {e}")
         return TASK_STATUS.copy()
@@ -101,11 +126,9 @@ def load_task_status_from_db():
 def persist_task_status(status: Dict[str, Any]):
     try:
         with db.get_connection() as conn:
-            inspector = sqlalchemy.inspect(conn)
-            if not inspector.has_table("task_status"):
+            if not db.has_table(conn, "task_status"):
                 db.init_tables()
-                inspector = sqlalchemy.inspect(conn)
-                if not inspector.has_table("task_status"):
+                if not db.has_table(conn, "task_status"):
                     return
             conn.execute(
                 text("UPDATE task_status SET running = :running, task_name = :task_name, message = :message, progress = :progress, pid = :pid, updated_at = :updated_at WHERE id = 1"),
@@ -246,8 +269,21 @@ def unhandled_exception_handler(request: Request, exc: Exception):
 
 import traceback
 
+def etag_headers(tag: str) -> Dict[str, str]:
+    return {"ETag": tag, "Cache-Control": "no-cache"}
+
+def not_modified(request: Request, response: Response, tag: str) -> Optional[Response]:
+    # Tag the response; a matching If-None-Match short-circuits to 304 before any data is read
+    headers = etag_headers(tag)
+    response.headers.update(headers)
+    if cache.etag_matches(request.headers.get("if-none-match"), tag):
+        return Response(status_code=304, headers=headers)
+    return None
+
 @app.get("/goods")
-def get_goods(
+async def get_goods(
+    request: Request,
+    response: Response,
     page: int = 1,
     limit: int = 50,
     all_data: bool = False,
@@ -256,125 +292,89 @@ def get_goods(
     search: Optional[str] = None,
     sort_by: Optional[str] = None,
     sort_desc: bool = False,
-    page_size: Optional[int] = None
+    page_size: Optional[int] = None,
+    cursor: Optional[str] = None,
+    with_total: bool = True,
+    with_skus: bool = False
 ):
+    # cursor mode: pass cursor= (empty) for the first page, then each response's next_cursor.
+    # Pages are found by seeking past the last row instead of OFFSET; with_total=false skips the count.
     if page_size is not None:
         limit = page_size
     if limit <= 0:
         limit = 50
-    
-    try:
-        params = {}
-        where_clauses = []
-        if search:
-            where_clauses.append("(\"商品名称\" LIKE :search OR \"SKU\" LIKE :search OR \"ID\" LIKE :search)")
-            params["search"] = f"%{search}%"
-        if merchant and merchant != "all":
-            where_clauses.append("(\"merchant\" = :merchant OR \"商家\" = :merchant)")
-            params["merchant"] = merchant
-        if sync_status and sync_status != "all":
-            where_clauses.append("\"是否同步支付宝\" = :sync_status")
-            params["sync_status"] = sync_status
-        where_sql = " WHERE " + " AND ".join(where_clauses) if where_clauses else ""
 
-        with db.get_connection() as conn:
-            inspector = sqlalchemy.inspect(conn)
-            if not inspector.has_table("goods"):
-                return {"data": [], "total": 0, "page": page, "limit": limit, "total_pages": 0}
+    # The version comes from the database, so a write by any worker or process changes it
+    version = await db.run_read(cache.read_version, cache.CATALOG_VERSION)
+    tag = cache.etag(cache.CATALOG_VERSION, version, "goods", sorted(request.query_params.multi_items()))
+    unchanged = not_modified(request, response, tag)
+    if unchanged is not None:
+        return unchanged
+
+    # List rows come from goods_summary; SKU rows only with with_skus=true (or per item via /goods/{id}/skus)
+    # Identical polls are served from memory, already rendered, until a catalog write bumps the version
+    cache_key = ("goods", page, limit, all_data, merchant, sync_status, search, sort_by, sort_desc, cursor, with_total, with_skus)
+    cached = cache.goods_cache.get(cache_key, version)
+    if cached is not None:
+        return Response(cached, media_type="application/json", headers=etag_headers(tag))
+    # Whole-catalog and SKU payloads are assembled and rendered off the event loop
+    heavy = all_data or with_skus
+    result = await load_goods_page(page, limit, all_data, merchant, sync_status, search, sort_by, sort_desc, cursor, with_total, with_skus, heavy)
+    # Rendered here rather than by a response class, so FastAPI skips its jsonable_encoder pass too
+    body = await asyncio.to_thread(serialization.dumps, result) if heavy else serialization.dumps(result)
+    cache.goods_cache.put(cache_key, body, version)
+    return Response(body, media_type="application/json", headers=etag_headers(tag))
+
+async def load_goods_page(page, limit, all_data, merchant, sync_status, search, sort_by, sort_desc, cursor, with_total, with_skus, heavy=False):
+    try:
+        where_sql, params = catalog.goods_filter_sql(search, merchant, sync_status)
+        count_query = f"SELECT COUNT(*) FROM goods_summary g{where_sql}"
+        try:
+            # One extra row tells whether there is a next page
+            id_query, id_params = catalog.goods_page_query(
+                where_sql, params, sort_by, sort_desc,
+                limit=None if all_data else limit + 1,
+                offset=0 if cursor is not None else max(page - 1, 0) * limit,
+                cursor=cursor
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        empty = {"data": [], "total": 0, "page": page, "limit": limit, "total_pages": 0, "next_cursor": None}
 
-            total_row = conn.execute(text(f"SELECT COUNT(DISTINCT \"ID\") FROM goods{where_sql}"), params).fetchone()
-            total = total_row[0] if total_row else 0
-            if total == 0:
-                return {"data": [], "total": 0, "page": page, "limit": limit, "total_pages": 0}
+        def read_page(conn):
+            if not db.has_table(conn, "goods"):
+                return empty
 
-            order = "DESC" if sort_desc else "ASC"
-            sort_field = (sort_by or "").strip()
-            
-            sort_expr = ""
-            if sort_field == "ID" or not sort_field:
-                if db.is_postgres():
-                    sort_expr = "CASE WHEN \"ID\" ~ '^[0-9]+' THEN CAST(\"ID\" AS INTEGER) ELSE NULL END"
-                else:
-                    sort_expr = "CASE WHEN \"ID\" GLOB '[0-9]*' THEN CAST(\"ID\" AS INTEGER) ELSE NULL END"
-            elif sort_field == "商品名称":
-                sort_expr = "MIN(\"商品名称\")"
-            elif sort_field == "1天租金":
-                sort_expr = "MIN(CASE WHEN NULLIF(\"1天租金\", '') IS NULL THEN NULL ELSE CAST(\"1天租金\" AS REAL) END)"
-            elif sort_field == "支付宝编码":
-                sort_expr = "MIN(\"支付宝编码\")"
-            elif sort_field == "最近提交时间":
-                sort_expr = "MIN(NULLIF(\"最近提交时间\", ''))"
-            elif sort_field == "merchant":
-                sort_expr = "MIN(\"merchant\")"
-            else:
-                if db.is_postgres():
-                    sort_expr = "CASE WHEN \"ID\" ~ '^[0-9]+' THEN CAST(\"ID\" AS INTEGER) ELSE NULL END"
-                else:
-                    sort_expr = "CASE WHEN \"ID\" GLOB '[0-9]*' THEN CAST(\"ID\" AS INTEGER) ELSE NULL END"
-
-            id_query = f"""
-                SELECT \"ID\"
-                FROM goods
-                {where_sql}
-                GROUP BY \"ID\"
-                ORDER BY ({sort_expr} IS NULL) ASC, {sort_expr} {order}, \"ID\" {order}
-            """
-            
-            id_params = params.copy()
-            if not all_data:
-                offset = max(page - 1, 0) * limit
-                id_query += " LIMIT :limit OFFSET :offset"
-                id_params["limit"] = limit
-                id_params["offset"] = offset
+            total = None
+            if with_total or cursor is None:
+                total_row = conn.execute(text(count_query), params).fetchone()
+                total = total_row[0] if total_row else 0
+                if total == 0:
+                    return empty
 
             id_rows = conn.execute(text(id_query), id_params).fetchall()
+            next_cursor = None
+            if not all_data and len(id_rows) > limit:
+                id_rows = id_rows[:limit]
+                last_id, last_key = id_rows[-1][0], id_rows[-1][1]
+                next_cursor = catalog.encode_cursor(sort_by, sort_desc, last_key, str(last_id))
             ids = [str(row[0]) for row in id_rows]
             if not ids:
-                return {"data": [], "total": 0, "page": page, "limit": limit, "total_pages": 0}
-
-            # Handle IN clause with parameters manually to avoid list binding issues across drivers
-            # Or better, use pandas read_sql which handles it if we pass params correctly?
-            # Actually constructing the IN clause safely is better for cross-db
-            placeholders = ",".join([f":id_{i}" for i in range(len(ids))])
-            in_params = {f"id_{i}": id_val for i, id_val in enumerate(ids)}
-            # We don't need other params here since we are selecting by ID only
-            
-            df = pd.read_sql_query(
-                text(f"SELECT * FROM goods WHERE \"ID\" IN ({placeholders})"),
-                conn,
-                params=in_params
-            )
-            df = df.fillna("")
-            if df.empty:
-                return {"data": [], "total": 0, "page": page, "limit": limit, "total_pages": 0}
-
-            df["ID"] = df["ID"].astype(str)
-            groups_map = {}
-            for goods_id, group_df in df.groupby("ID"):
-                first_row = group_df.iloc[0].to_dict()
-                inventory_series = pd.to_numeric(group_df.get("库存", pd.Series([], dtype="object")), errors="coerce").fillna(0)
-                total_inventory = int(inventory_series.sum()) if not inventory_series.empty else 0
-                merchant_value = first_row.get("merchant") or first_row.get("商家") or ""
-                group_data = {
-                    "ID": goods_id,
-                    "商品名称": first_row.get("商品名称", ""),
-                    "短标题": first_row.get("短标题", ""),
-                    "1级分类": first_row.get("1级分类", ""),
-                    "2级分类": first_row.get("2级分类", ""),
-                    "3级分类": first_row.get("3级分类", ""),
-                    "merchant": merchant_value,
-                    "是否同步支付宝": first_row.get("是否同步支付宝", ""),
-                    "最近提交时间": first_row.get("最近提交时间", ""),
-                    "商品图片": first_row.get("商品图片", ""),
-                    "支付宝编码": first_row.get("支付宝编码", ""),
-                    "库存": total_inventory,
-                    "skus": group_df.to_dict(orient="records")
-                }
-                groups_map[goods_id] = group_data
+                return {**empty, "total": total}
+
+            groups = catalog.load_summary_groups(conn, ids)
+            if not groups:
+                return empty
+
+            if with_skus:
+                catalog.attach_skus(conn, groups, ids)
+
+            total_pages = (math.ceil(total / limit) if limit else 1) if total is not None else None
+            return {"data": groups, "total": total, "page": page, "limit": limit, "total_pages": total_pages, "next_cursor": next_cursor}
 
-            groups = [groups_map[gid] for gid in ids if gid in groups_map]
-            total_pages = math.ceil(total / limit) if limit else 1
-            return {"data": groups, "total": total, "page": page, "limit": limit, "total_pages": total_pages}
+        # Small pages on the async engine when its driver is installed, so they do not hold
+        # threadpool threads; heavy ones in a worker thread, as their row assembly is CPU work
+        return await db.run_read(read_page, heavy=heavy)
     except HTTPException:
         raise
     except Exception as e:
@@ -383,6 +383,96 @@ def get_goods(
         logging.error(traceback.format_exc())
         raise HTTPException(status_code=500, detail=f"Failed to fetch goods: {error_msg}")
 
+@app.get("/goods/{id}/skus")
+def get_goods_skus(id: str, request: Request, response: Response):
+    # SKU rows of one goods item, fetched when the list row is expanded
+    with db.get_connection() as conn:
+        tag = cache.etag(cache.CATALOG_VERSION, cache.read_version(conn, cache.CATALOG_VERSION), "skus", id)
+        unchanged = not_modified(request, response, tag)
+        if unchanged is not None:
+            return unchanged
+        if not db.has_table(conn, "goods"):
+            raise HTTPException(status_code=404, detail="Item not found (Table missing)")
+        skus = catalog.fetch_flat_rows(conn, " WHERE g.\"ID\" = :id", {"id": id})
+    if not skus:
+        raise HTTPException(status_code=404, detail="Item not found")
+    return serialization.FastJSONResponse({"ID": id, "skus": skus}, headers=etag_headers(tag))
+
+@app.get("/goods/{id}/history")
+async def get_goods_history(
+    id: str,
+    request: Request,
+    response: Response,
+    sku: Optional[str] = None,
+    field: Optional[str] = None,
+    since: Optional[str] = None
+):
+    # Rent / price series of one goods item's SKUs, from price_history
+    version = await db.run_read(cache.read_version, cache.CATALOG_VERSION)
+    tag = cache.etag(cache.CATALOG_VERSION, version, "history", id, sku, field, since)
+    unchanged = not_modified(request, response, tag)
+    if unchanged is not None:
+        return unchanged
+    series = await db.run_read(catalog.load_price_history, id, sku, field, since)
+    return serialization.FastJSONResponse({"ID": id, "series": series}, headers=etag_headers(tag))
+
+def iter_goods_ndjson(merchant, sync_status, search, sort_by, sort_desc, with_skus, ids=None):
+    where_sql, params = catalog.goods_filter_sql(search, merchant, sync_status, ids)
+    cursor = None
+    try:
+        while True:
+            id_query, id_params = catalog.goods_page_query(
+                where_sql, params, sort_by, sort_desc, limit=GOODS_STREAM_BATCH_SIZE, cursor=cursor
+            )
+            # A short-lived connection per batch, so a slow reader never holds a transaction open
+            with db.get_connection() as conn:
+                id_rows = conn.execute(text(id_query), id_params).fetchall()
+                ids = [str(row[0]) for row in id_rows]
+                groups = catalog.load_summary_groups(conn, ids) if ids else []
+                if with_skus and ids:
+                    catalog.attach_skus(conn, groups, ids)
+            if groups:
+                yield b"".join(serialization.dumps(group) + b"\n" for group in groups)
+            if len(id_rows) < GOODS_STREAM_BATCH_SIZE:
+                break
+            cursor = catalog.encode_cursor(sort_by, sort_desc, id_rows[-1][1], str(id_rows[-1][0]))
+    except Exception as e:
+        # Headers are already sent; the error goes out as the last line
+        logging.error(f"Error in goods stream: {e}")
+        logging.error(traceback.format_exc())
+        yield serialization.dumps({"status": "error", "message": str(e)}) + b"\n"
+
+@app.get("/goods/stream")
+def stream_goods(
+    merchant: Optional[str] = None,
+    sync_status: Optional[str] = None,
+    search: Optional[str] = None,
+    sort_by: Optional[str] = None,
+    sort_desc: bool = False,
+    with_skus: bool = True,
+    ids: Optional[str] = None
+):
+    # Whole (filtered) catalog as NDJSON, one /goods group per line, sent batch by batch;
+    # ids (comma-separated) restricts it to those goods
+    id_list = None
+    if ids is not None:
+        id_list = list(dict.fromkeys(i.strip() for i in ids.split(",") if i.strip()))
+        if len(id_list) > MAX_STREAM_IDS:
+            raise HTTPException(status_code=400, detail=f"At most {MAX_STREAM_IDS} ids per request")
+    return StreamingResponse(
+        iter_goods_ndjson(merchant, sync_status, search, sort_by, sort_desc, with_skus, id_list),
+        media_type="application/x-ndjson"
+    )
+
+@app.get("/goods/search")
+def search_goods(q: str, limit: int = 20):
+    # Ranked goods IDs for a search string, best match first
+    if limit <= 0:
+        limit = 20
+    with db.get_connection() as conn:
+        ids = search_index.search_ids(conn, q, limit)
+    return {"ids": ids, "backend": search_index.backend.name}
+
 class UpdateFieldRequest(BaseModel):
     field: str
     value: Any
@@ -395,17 +485,16 @@ def update_goods_field(id: str, req: UpdateFieldRequest):
             raise HTTPException(status_code=400, detail=f"Field {req.field} not allowed")
             
         with db.get_connection() as conn:
-            inspector = sqlalchemy.inspect(conn)
-            if not inspector.has_table("goods"):
+            if not db.has_table(conn, "goods"):
                 raise HTTPException(status_code=404, detail="Item not found (Table missing)")
 
-            # Use quotes for field name to handle potential keywords or special chars
-            result = conn.execute(
-                text(f"UPDATE goods SET \"{req.field}\" = :value WHERE \"ID\" = :id"),
-                {"value": req.value, "id": id}
-            )
+            # 商家 is the legacy alias of merchant
+            field = catalog.FIELD_ALIASES.get(req.field, req.field)
+            updated = catalog.update_goods_fields(conn, id, {field: req.value})
+            if field == "商品名称":
+                search_index.sync_goods(conn, [id])
             conn.commit()
-            if result.rowcount == 0:
+            if updated == 0:
                  raise HTTPException(status_code=404, detail="Item not found")
         return {"status": "success"}
     except Exception as e:
@@ -417,50 +506,53 @@ class UpdateMerchantRequest(BaseModel):
 @app.post("/goods/{id}/merchant")
 def update_goods_merchant(id: str, req: UpdateMerchantRequest):
     with db.get_connection() as conn:
-        inspector = sqlalchemy.inspect(conn)
-        if not inspector.has_table("goods"):
+        if not db.has_table(conn, "goods"):
             raise HTTPException(status_code=404, detail="Item not found (Table missing)")
 
-        result = conn.execute(
-            text("UPDATE goods SET \"merchant\" = :merchant, \"商家\" = :merchant WHERE \"ID\" = :id"),
-            {"merchant": req.merchant, "id": id}
-        )
+        updated = catalog.update_goods_fields(conn, id, {"merchant": req.merchant})
         conn.commit()
-        if result.rowcount == 0:
+        if updated == 0:
             raise HTTPException(status_code=404, detail="Item not found")
     return {"status": "success"}
 
 @app.delete("/goods/{id}")
 def delete_goods(id: str):
     with db.get_connection() as conn:
-        inspector = sqlalchemy.inspect(conn)
-        if not inspector.has_table("goods"):
+        if not db.has_table(conn, "goods"):
             raise HTTPException(status_code=404, detail="Item not found (Table missing)")
 
-        result = conn.execute(text("DELETE FROM goods WHERE \"ID\" = :id"), {"id": id})
+        deleted = catalog.delete_goods(conn, id)
         conn.commit()
-        if result.rowcount == 0:
+        if deleted == 0:
             raise HTTPException(status_code=404, detail="Item not found")
     return {"status": "success"}
 
 # --- Task Management Endpoints ---
 
-@app.get("/task-status")
-def get_task_status():
-    status = load_task_status_from_db()
+def check_task_process(status: Dict[str, Any]) -> Dict[str, Any]:
     # Check if process is still running
+    try:
+        # Check if PID exists (Windows)
+        # Use tasklist filter
+        output = subprocess.check_output(f"tasklist /FI \"PID eq {status['pid']}\"", shell=True).decode()
+        if str(status["pid"]) not in output:
+            # Process died
+            status["running"] = False
+            status["message"] = "Process terminated unexpectedly"
+            persist_task_status(status)
+    except:
+         pass
+    return status
+
+@app.get("/task-status")
+async def get_task_status():
+    try:
+        status = await db.run_read(read_task_status)
+    except Exception as e:
+        logging.error(f"Failed to load task status from DB: {e}")
+        status = TASK_STATUS.copy()
     if status["running"] and status["pid"]:
-        try:
-            # Check if PID exists (Windows)
-            # Use tasklist filter
-            output = subprocess.check_output(f"tasklist /FI \"PID eq {status['pid']}\"", shell=True).decode()
-            if str(status["pid"]) not in output:
-                # Process died
-                status["running"] = False
-                status["message"] = "Process terminated unexpectedly"
-                persist_task_status(status)
-        except:
-             pass
+        status = await run_in_threadpool(check_task_process, status)
     return status
 
 @app.get("/logs")
@@ -490,25 +582,35 @@ class ConfigUpdateRequest(BaseModel):
     key: str
     value: str
 
+def read_config_map(conn) -> Dict[str, str]:
+    rows = conn.execute(text("SELECT key, value FROM config")).fetchall()
+    data = {row[0]: row[1] for row in rows}
+    defaults = {
+        "filter_keywords": "已出租,下架,不可租",
+        "default_merchant_filter": "all"
+    }
+    for k, v in defaults.items():
+        data.setdefault(k, v)
+    return data
+
 def get_config_map():
     with db.get_connection() as conn:
-        rows = conn.execute(text("SELECT key, value FROM config")).fetchall()
-        data = {row[0]: row[1] for row in rows}
-        defaults = {
-            "filter_keywords": "已出租,下架,不可租",
-            "default_merchant_filter": "all"
-        }
-        for k, v in defaults.items():
-            data.setdefault(k, v)
-        return data
+        return read_config_map(conn)
 
 @app.get("/config")
-def get_config():
-    return get_config_map()
+async def get_config(request: Request, response: Response):
+    version = await db.run_read(cache.read_version, cache.CONFIG_VERSION)
+    unchanged = not_modified(request, response, cache.etag(cache.CONFIG_VERSION, version))
+    if unchanged is not None:
+        return unchanged
+    return await db.run_read(read_config_map)
 
 @app.post("/config")
 def update_config(req: ConfigUpdateRequest):
-    db.upsert_config(req.key, req.value)
+    with db.get_connection() as conn:
+        db.upsert_config(req.key, req.value, conn)
+        cache.bump_version(conn, cache.CONFIG_VERSION)
+        conn.commit()
     return {"status": "success"}
 
 def read_rent_curves() -> List[Dict[str, Any]]:
@@ -526,8 +628,12 @@ def write_rent_curves(curves: List[Dict[str, Any]]):
         json.dump(curves, f, ensure_ascii=False, indent=2)
 
 @app.get("/rent-curves")
-def get_rent_curves():
-    return read_rent_curves()
+async def get_rent_curves(request: Request, response: Response):
+    # The curves file is shared by every worker, so its mtime / size is the version
+    unchanged = not_modified(request, response, cache.etag(cache.CURVES_VERSION, cache.file_version(RENT_CURVES_PATH)))
+    if unchanged is not None:
+        return unchanged
+    return await run_in_threadpool(read_rent_curves)
 
 @app.post("/rent-curves")
 def save_rent_curve(curve: Dict[str, Any] = Body(...)):
@@ -569,17 +675,19 @@ def get_debug_info():
             masked_url = "invalid_url_format"
             
     goods_count = 0
+    sku_count = 0
     table_exists = False
     table_names = []
     current_database = None
     try:
         with db.get_connection() as conn:
-            inspector = sqlalchemy.inspect(conn)
-            table_names = inspector.get_table_names()
-            table_exists = inspector.has_table("goods")
+            table_names = db.schema.table_names(conn)
+            table_exists = db.has_table(conn, "goods")
             if table_exists:
                 result = conn.execute(text("SELECT COUNT(*) FROM goods")).fetchone()
                 goods_count = result[0] if result else 0
+                result = conn.execute(text("SELECT COUNT(*) FROM skus")).fetchone()
+                sku_count = result[0] if result else 0
             if db.is_postgres():
                 db_row = conn.execute(text("SELECT current_database()")).fetchone()
                 current_database = db_row[0] if db_row else None
@@ -594,6 +702,7 @@ def get_debug_info():
         "is_postgres": db.is_postgres(),
         "goods_table_exists": table_exists,
         "goods_count": goods_count,
+        "sku_count": sku_count,
         "table_names": table_names,
         "current_database": current_database,
         "scrape_file_path": SCRAPE_OUTPUT_FILE,
@@ -601,99 +710,190 @@ def get_debug_info():
         "scrape_file_size": scrape_file_size,
         "cwd": os.getcwd(),
         "base_dir": BASE_DIR,
-        "env_database_url_present": bool(db_url)
+        "env_database_url_present": bool(db_url),
+        "goods_cache": cache.goods_cache.stats(),
+        "schema_registry": db.schema.stats(),
+        "db_pool": db.pool_stats()
     }
 
-def merge_scraped_data(scrape_path: str) -> int:
+@app.get("/debug/explain")
+def explain_goods_queries(
+    merchant: Optional[str] = None,
+    sync_status: Optional[str] = None,
+    search: Optional[str] = None,
+    sort_by: Optional[str] = None,
+    sort_desc: bool = False,
+    limit: int = 50,
+    cursor: Optional[str] = None
+):
+    # Query plans of the /goods count and page queries for the given filters
+    where_sql, params = catalog.goods_filter_sql(search, merchant, sync_status)
+    count_query = f"SELECT COUNT(*) FROM goods_summary g{where_sql}"
+    try:
+        id_query, id_params = catalog.goods_page_query(where_sql, params, sort_by, sort_desc, limit=limit, cursor=cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    try:
+        with db.get_connection() as conn:
+            return {
+                "count_query": count_query,
+                "count_plan": db.explain(conn, count_query, params),
+                "id_query": id_query,
+                "id_plan": db.explain(conn, id_query, id_params)
+            }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+def merge_scraped_data(scrape_path: str) -> dict:
     if not os.path.exists(scrape_path):
         raise HTTPException(status_code=400, detail="Scrape data file not found")
     
     logging.info(f"Starting merge from {scrape_path}")
-    
-    with open(scrape_path, "r", encoding="utf-8") as f:
-        items = json.load(f)
-    if not items:
+    return merge_scraped_rows(catalog.iter_scrape_rows(scrape_path))
+
+def merge_scraped_rows(scraped_rows, wait: bool = True) -> dict:
+    # One merge at a time from staging to publish (catalog.MERGE_LOCK); wait=False
+    # refuses with 409 instead of queueing behind a running merge
+    if not catalog.MERGE_LOCK.acquire(blocking=wait):
+        raise HTTPException(status_code=409, detail="Another merge is running")
+    try:
+        return _merge_scraped_rows(scraped_rows)
+    finally:
+        catalog.MERGE_LOCK.release()
+
+def _merge_scraped_rows(scraped_rows) -> dict:
+    row_count = 0
+    has_id = False
+
+    def rows():
+        nonlocal row_count, has_id
+        for row in scraped_rows:
+            row_count += 1
+            has_id = has_id or "ID" in row
+            yield row
+
+    # The file is parsed into staging tables batch by batch, one short write
+    # transaction each, so /goods readers and field edits are never held up;
+    # the live tables are then updated in a single publish transaction.
+    try:
+        with db.get_connection() as conn:
+            catalog.create_staging_tables(conn)
+            conn.commit()
+            for seq, batch in enumerate(catalog.iter_goods_chunks(rows())):
+                catalog.stage_goods_rows(conn, batch, seq)
+                conn.commit()
+            if row_count and not has_id:
+                raise HTTPException(status_code=400, detail="Scrape data missing ID")
+            stats = catalog.publish_staging(conn)
+            conn.commit()
+    finally:
+        with db.get_connection() as conn:
+            catalog.drop_staging_tables(conn)
+            conn.commit()
+    if not row_count:
         logging.info("No items in scrape file")
-        return 0
-    df = pd.DataFrame(items).fillna("")
-    if "ID" not in df.columns:
-        raise HTTPException(status_code=400, detail="Scrape data missing ID")
-    df["ID"] = df["ID"].astype(str)
-    ids = df["ID"].unique().tolist()
-    
-    logging.info(f"Found {len(ids)} unique items to merge")
+    logging.info(f"Merge finished: {stats}")
+    return stats
+
+def merge_summary(stats: dict) -> str:
+    return (f"{stats['goods']} goods, SKUs: {stats['added']} added, {stats['changed']} changed, "
+            f"{stats['removed']} removed, {stats['unchanged']} unchanged")
 
+def write_scrape_known_file():
     with db.get_connection() as conn:
-        # Check if table exists
-        inspector = sqlalchemy.inspect(conn)
-        if not inspector.has_table("goods"):
-            logging.info("Creating goods table")
-            df.to_sql("goods", conn, if_exists="append", index=False)
+        state = catalog.load_scrape_state(conn) if db.has_table(conn, "goods") else {}
+    with open(SCRAPE_KNOWN_FILE, "w", encoding="utf-8") as f:
+        json.dump(state, f, ensure_ascii=False)
+    if os.path.exists(SCRAPE_MANIFEST_FILE):
+        os.remove(SCRAPE_MANIFEST_FILE)
+    return len(state)
+
+def apply_scrape_manifest() -> str:
+    """Summarise an incremental scrape's manifest; with SCRAPE_PRUNE_DELETED, delete the delisted goods it found."""
+    try:
+        with open(SCRAPE_MANIFEST_FILE, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return "no incremental manifest"
+    summary = (f"{len(manifest.get('new', []))} new, {len(manifest.get('changed', []))} changed, "
+               f"{manifest.get('skipped', 0)} unchanged goods skipped")
+    deleted = manifest.get("deleted", [])
+    if not manifest.get("scan_complete"):
+        summary += ", list scan incomplete so delisted goods were not checked"
+    elif deleted and SCRAPE_PRUNE_DELETED:
+        with db.get_connection() as conn:
+            removed = sum(catalog.delete_goods(conn, goods_id) for goods_id in deleted)
             conn.commit()
-            return len(ids)
-
-        logging.info("Updating existing records")
-        
-        # Ensure critical columns exist before querying to avoid UndefinedColumn errors
-        db.ensure_columns("goods", ["merchant", "商家", "支付宝编码", "是否同步支付宝"])
-        
-        chunk_size = 500
-        existing_map = {}
-        for start in range(0, len(ids), chunk_size):
-            chunk = ids[start:start + chunk_size]
-            placeholders = ",".join([f":id_{i}" for i in range(len(chunk))])
-            params = {f"id_{i}": id_val for i, id_val in enumerate(chunk)}
-            existing_df = pd.read_sql_query(
-                text(f"SELECT \"ID\", \"merchant\", \"商家\", \"支付宝编码\", \"是否同步支付宝\" FROM goods WHERE \"ID\" IN ({placeholders})"),
-                conn,
-                params=params
-            )
-            for _, row in existing_df.fillna("").iterrows():
-                existing_map[str(row["ID"])] = row.to_dict()
-
-        for field in ["merchant", "商家", "支付宝编码", "是否同步支付宝"]:
-            if field not in df.columns:
-                df[field] = ""
-            existing_values = {k: v.get(field, "") for k, v in existing_map.items()}
-            df[field] = df[field].replace("", pd.NA)
-            df[field] = df[field].fillna(df["ID"].map(existing_values)).fillna("")
-
-        # Ensure columns exist
-        db.ensure_columns("goods", df.columns.tolist())
-        
-        # Delete old records
-        for start in range(0, len(ids), chunk_size):
-            chunk = ids[start:start + chunk_size]
-            placeholders = ",".join([f":id_{i}" for i in range(len(chunk))])
-            params = {f"id_{i}": id_val for i, id_val in enumerate(chunk)}
-            conn.execute(text(f"DELETE FROM goods WHERE \"ID\" IN ({placeholders})"), params)
-        
-        # Insert new records
-        # Use chunksize to avoid parameter limit issues if many rows
-        df.to_sql("goods", conn, if_exists="append", index=False, chunksize=500)
-        conn.commit()
-    return len(ids)
+        summary += f", {removed} delisted goods deleted"
+    elif deleted:
+        summary += f", {len(deleted)} goods no longer listed: {','.join(deleted)}"
+    logging.info(f"Incremental scrape: {summary}")
+    return summary
 
 @app.post("/run-scrape")
-def run_scrape():
+def run_scrape(incremental: bool = False, resume: Optional[str] = None):
+    # incremental: only new goods and goods whose list-page submit time or sync status changed are re-scraped
+    # resume: run ID of an interrupted scrape to continue, skipping the goods its journal already holds
     if TASK_STATUS["running"]:
         return {"status": "error", "message": "Task already running"}
+    if resume:
+        try:
+            journal_path = scrape_journal.journal_path(SCRAPE_JOURNAL_DIR, resume)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        if not os.path.exists(journal_path):
+            raise HTTPException(status_code=404, detail="Scrape run not found")
+        run_id = resume
+        # Mode, IDs and incremental state come from the journal
+        incremental = scrape_journal.read_journal(journal_path, with_rows=False)["start"].get("incremental", False)
+        cmd = [sys.executable, "-u", SCRAPE_SCRIPT_PATH, "--resume", run_id]
+    else:
+        scrape_journal.prune_runs(SCRAPE_JOURNAL_DIR, SCRAPE_RUNS_KEEP)
+        run_id = scrape_journal.new_run_id()
+        cmd = [sys.executable, "-u", SCRAPE_SCRIPT_PATH, "--run-id", run_id]
+        if incremental:
+            known = write_scrape_known_file()
+            logging.info(f"Incremental scrape against {known} stored goods")
+            cmd += ["--incremental", "--known-file", SCRAPE_KNOWN_FILE]
     update_task_status(True, "scrape", "Starting scrape...", 0)
-    cmd = [sys.executable, "-u", SCRAPE_SCRIPT_PATH]
 
     def task_thread():
         returncode = run_process_with_logging(cmd, BASE_DIR, TASK_LOG_PATH, "scrape")
         if returncode != 0:
+            update_task_status(False, "scrape", f"{TASK_STATUS.get('message')}; run {run_id} can be resumed or its completed goods merged", TASK_STATUS.get("progress", 0))
             return
         try:
-            updated = merge_scraped_data(SCRAPE_OUTPUT_FILE)
-            update_task_status(False, "scrape", f"Scrape completed, updated {updated} goods", 100)
+            stats = merge_scraped_data(SCRAPE_OUTPUT_FILE)
+            message = f"Scrape completed, merged {merge_summary(stats)}"
+            if incremental:
+                message += f"; {apply_scrape_manifest()}"
+            update_task_status(False, "scrape", message, 100)
         except Exception as e:
             update_task_status(False, "scrape", f"Scrape completed, merge failed: {e}", 100)
 
     thread = threading.Thread(target=task_thread)
     thread.start()
-    return {"status": "success", "message": "Scrape started"}
+    return {"status": "success", "message": "Scrape started", "run_id": run_id}
+
+@app.get("/scrape-runs")
+def list_scrape_runs():
+    # Journaled scrape runs, newest first; unfinished ones can be resumed or merged as they are
+    return {"runs": scrape_journal.list_runs(SCRAPE_JOURNAL_DIR)}
+
+@app.post("/scrape-runs/{run_id}/merge")
+def merge_scrape_run(run_id: str):
+    # Merge the goods a (possibly interrupted) run has completed so far
+    if TASK_STATUS["running"] and TASK_STATUS.get("task_name") in ["scrape", "scrape_partial"]:
+        return {"status": "error", "message": "A scrape is still running"}
+    try:
+        journal_path = scrape_journal.journal_path(SCRAPE_JOURNAL_DIR, run_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not os.path.exists(journal_path):
+        raise HTTPException(status_code=404, detail="Scrape run not found")
+    logging.info(f"Starting merge from scrape run {run_id}")
+    stats = merge_scraped_rows(scrape_journal.iter_journal_rows(journal_path), wait=False)
+    return {"status": "success", "message": f"Merged {merge_summary(stats)}", "stats": stats}
 
 class PartialScrapeRequest(BaseModel):
     ids: List[str]
@@ -713,8 +913,8 @@ def run_partial_scrape(req: PartialScrapeRequest):
         if returncode != 0:
             return
         try:
-            updated = merge_scraped_data(SCRAPE_OUTPUT_FILE)
-            update_task_status(False, "scrape_partial", f"Partial scrape completed, updated {updated} goods", 100)
+            stats = merge_scraped_data(SCRAPE_OUTPUT_FILE)
+            update_task_status(False, "scrape_partial", f"Partial scrape completed, merged {merge_summary(stats)}", 100)
         except Exception as e:
             update_task_status(False, "scrape_partial", f"Partial scrape completed, merge failed: {e}", 100)
 
@@ -729,25 +929,13 @@ def export_excel(
     search: Optional[str] = None
 ):
     try:
-        params = {}
-        where_clauses = []
-        if search:
-            where_clauses.append("(\"商品名称\" LIKE :search OR \"SKU\" LIKE :search OR \"ID\" LIKE :search)")
-            params["search"] = f"%{search}%"
-        if merchant and merchant != "all":
-            where_clauses.append("(\"merchant\" = :merchant OR \"商家\" = :merchant)")
-            params["merchant"] = merchant
-        if sync_status and sync_status != "all":
-            where_clauses.append("\"是否同步支付宝\" = :sync_status")
-            params["sync_status"] = sync_status
-        where_sql = " WHERE " + " AND ".join(where_clauses) if where_clauses else ""
+        where_sql, params = catalog.goods_filter_sql(search, merchant, sync_status)
         
         with db.get_connection() as conn:
-            inspector = sqlalchemy.inspect(conn)
-            if not inspector.has_table("goods"):
+            if not db.has_table(conn, "goods"):
                 df = pd.DataFrame()
             else:
-                df = pd.read_sql_query(text(f"SELECT * FROM goods{where_sql} ORDER BY \"ID\" DESC"), conn, params=params)
+                df = pd.DataFrame(catalog.fetch_flat_rows(conn, where_sql, params, desc=True))
         
         df = df.fillna("")
         output = io.BytesIO()
@@ -813,8 +1001,7 @@ def start_alipay_update(req: AutomationRequest):
     # 1. Prepare Data
     try:
         with db.get_connection() as conn:
-            inspector = sqlalchemy.inspect(conn)
-            if not inspector.has_table("goods"):
+            if not db.has_table(conn, "goods"):
                  raise Exception("Table 'goods' not found. Please scrape data first.")
 
             placeholders = ",".join([f":id_{i}" for i in range(len(req.ids))])
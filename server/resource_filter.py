@@ -0,0 +1,126 @@
+"""
+Playwright 上下文的请求过滤，scrape_goods.py 与 update_goods.py 共用。
+
+在 context.route 上拦截每个请求：按资源类型 (图片、字体等) 和第三方域名
+直接 abort，不再下载；放行的响应按 Content-Length 累计字节数。
+各脚本传入自己的资源类型与域名白名单，结束时打印统计，
+对比 GOODS_RESOURCE_FILTER=false 的运行即可看出效果。
+"""
+import os
+import time
+import threading
+from urllib.parse import urlparse
+
+RESOURCE_FILTER_ENABLED = os.getenv("GOODS_RESOURCE_FILTER", "true").lower() == "true"
+# 额外放行的第三方域名 (逗号分隔)，用于站点从 CDN 加载必需脚本的情况
+EXTRA_ALLOWED_HOSTS = [h.strip() for h in os.getenv("GOODS_ALLOWED_HOSTS", "").split(",") if h.strip()]
+
+# 只读抓取：页面只需 DOM，样式也不需要
+SCRAPER_BLOCKED_TYPES = ("image", "media", "font", "stylesheet", "manifest")
+# 更新脚本要点击、判断 is_visible，保留样式表
+UPDATER_BLOCKED_TYPES = ("image", "media", "font", "manifest")
+
+# 统计 / 广告域名，无论哪个脚本都拦截
+TRACKER_HOSTS = (
+    "hm.baidu.com", "cnzz.com", "umeng.com", "google-analytics.com",
+    "googletagmanager.com", "doubleclick.net", "growingio.com"
+)
+
+
+def _host_matches(host, patterns):
+    return any(host == p or host.endswith("." + p) for p in patterns)
+
+
+def site_domain(url):
+    """站点主域 (取 hostname 的后两段)，同主域下的子域名视为第一方"""
+    host = urlparse(url).hostname or ""
+    parts = host.split(".")
+    return ".".join(parts[-2:]) if len(parts) >= 2 else host
+
+
+class ResourceFilter:
+    """
+    context.route 处理器与统计。一个实例可挂在多个 context 上 (并发 worker)，
+    计数用锁保护。
+    blocked_types:     直接拦截的资源类型
+    block_third_party: 是否拦截站点主域以外的请求 (allowed_hosts 除外)
+    """
+
+    def __init__(self, site_url, blocked_types=(), block_third_party=False, allowed_hosts=(), enabled=RESOURCE_FILTER_ENABLED):
+        self.enabled = enabled
+        self.first_party = site_domain(site_url)
+        self.blocked_types = set(blocked_types)
+        self.block_third_party = block_third_party
+        self.allowed_hosts = tuple(allowed_hosts) + tuple(EXTRA_ALLOWED_HOSTS)
+        self._lock = threading.Lock()
+        self.blocked_by_type = {}
+        self.blocked_hosts = {}
+        self.blocked_requests = 0
+        self.allowed_requests = 0
+        self.loaded_bytes = 0
+        self.page_loads = 0
+        self.page_load_seconds = 0.0
+
+    def should_block(self, resource_type, url):
+        host = urlparse(url).hostname or ""
+        if _host_matches(host, TRACKER_HOSTS):
+            return True
+        if resource_type == "document":
+            # 页面本身总是放行
+            return False
+        if resource_type in self.blocked_types:
+            return True
+        if self.block_third_party and host and not _host_matches(host, (self.first_party,) + self.allowed_hosts):
+            return True
+        return False
+
+    def _handle(self, route):
+        request = route.request
+        resource_type = request.resource_type
+        if not self.should_block(resource_type, request.url):
+            route.continue_()
+            return
+        host = urlparse(request.url).hostname or ""
+        with self._lock:
+            self.blocked_requests += 1
+            self.blocked_by_type[resource_type] = self.blocked_by_type.get(resource_type, 0) + 1
+            self.blocked_hosts[host] = self.blocked_hosts.get(host, 0) + 1
+        route.abort("blockedbyclient")
+
+    def _on_response(self, response):
+        # headers 随事件一起到达，不需要额外的往返
+        length = response.headers.get("content-length")
+        with self._lock:
+            self.allowed_requests += 1
+            if length and length.isdigit():
+                self.loaded_bytes += int(length)
+
+    def attach(self, context):
+        """挂到 BrowserContext 上；未启用时只统计放行的请求"""
+        if self.enabled:
+            context.route("**/*", self._handle)
+        context.on("response", self._on_response)
+        return context
+
+    def timed_load(self, fn, *args, **kwargs):
+        """执行一次页面加载 (goto / wait_for_*) 并计入平均加载时间"""
+        start = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self.page_loads += 1
+                self.page_load_seconds += elapsed
+
+    def summary(self):
+        with self._lock:
+            avg_ms = self.page_load_seconds / self.page_loads * 1000 if self.page_loads else 0.0
+            by_type = ", ".join(f"{k}={v}" for k, v in sorted(self.blocked_by_type.items(), key=lambda kv: -kv[1])) or "-"
+            top_hosts = ", ".join(f"{k}={v}" for k, v in sorted(self.blocked_hosts.items(), key=lambda kv: -kv[1])[:5]) or "-"
+            return (
+                f"资源过滤{'已启用' if self.enabled else '未启用'}: "
+                f"拦截 {self.blocked_requests} 个请求 ({by_type})，主要域名: {top_hosts}；"
+                f"放行 {self.allowed_requests} 个响应，共 {self.loaded_bytes / 1024:.1f} KB (按 Content-Length)；"
+                f"页面加载 {self.page_loads} 次，平均 {avg_ms:.0f} ms"
+            )
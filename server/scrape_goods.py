@@ -3,12 +3,20 @@ import argparse
 import time
 import os
 import re
+import json
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
 import openpyxl
 from datetime import datetime
 from playwright.sync_api import sync_playwright
 from openpyxl.styles import PatternFill
 from openpyxl.utils.dataframe import dataframe_to_rows
+import scrape_http
+import scrape_journal
+from resource_filter import ResourceFilter, SCRAPER_BLOCKED_TYPES
+from sku_table import extract_sku_table, sku_table_rows, update_master_headers
 
 USERNAME = os.getenv("GOODS_USERNAME", "伟填")
 PASSWORD = os.getenv("GOODS_PASSWORD", "Test0528.")
@@ -16,36 +24,93 @@ LOGIN_URL = os.getenv("GOODS_LOGIN_URL", "https://szguokuai.zlj.xyzulin.top/web/
 MAX_PAGES = int(os.getenv("GOODS_MAX_PAGES", "0"))
 HEADLESS = os.getenv("GOODS_HEADLESS", "true").lower() == "true"
 OUTPUT_FILE = os.getenv("GOODS_OUTPUT_FILE", "scrape_goods_data.json")
+# 增量模式：KNOWN_FILE 为库中已有商品的列表页字段 (由服务端写入)，MANIFEST_FILE 记录本次抓取/跳过/下架的 ID
+KNOWN_FILE = os.getenv("GOODS_KNOWN_FILE", "scrape_goods_known.json")
+MANIFEST_FILE = os.getenv("GOODS_MANIFEST_FILE", "scrape_goods_manifest.json")
+# 运行日志目录 (见 scrape_journal.py)；JOURNAL 为当前运行的日志，抓取完成的商品随时写入
+JOURNAL_DIR = os.getenv("GOODS_JOURNAL_DIR", "scrape_runs")
+JOURNAL = None
+# browser: Chromium 渲染页面; http: 直接请求 HTML (见 scrape_http.py)
+SCRAPE_MODE = os.getenv("GOODS_SCRAPE_MODE", "browser")
+# 详情页并发抓取的 worker 数 (浏览器模式下每个 worker 一个浏览器，HTTP 模式共用连接池)，1 为串行
+GOODS_CONCURRENCY = max(1, int(os.getenv("GOODS_CONCURRENCY", "1")))
+MAX_DETAIL_RETRIES = 3
+DETAIL_URL = "https://szguokuai.zlj.xyzulin.top/web/index.php?c=site&a=entry&m=ewei_shopv2&do=web&r=goods.edit&id={goods_id}&goodsfrom=sale&page=1"
+# 只读 DOM：拦截图片/字体/样式与第三方域名 (GOODS_ALLOWED_HOSTS 可放行)，所有浏览器上下文共用统计
+RESOURCE_FILTER = ResourceFilter(LOGIN_URL, SCRAPER_BLOCKED_TYPES, block_third_party=True)
 
-def update_master_headers(master_headers, current_headers):
+def browser_login(page):
+    """登录后台 (已登录时直接返回)，完成后 page 停留在商品列表页"""
+    print(f"正在访问登录页面: {LOGIN_URL}")
+    page.goto(LOGIN_URL)
+    try:
+        page.wait_for_load_state('networkidle')
+        if "login" in page.url or page.query_selector("input[type='password']"):
+            print(f"检测到需要登录 (当前URL: {page.url})")
+            
+            if USERNAME and PASSWORD:
+                print(f"尝试自动登录...")
+                if page.query_selector("input[name='username']"):
+                    page.fill("input[name='username']", USERNAME)
+                if page.query_selector("input[name='password']"):
+                    page.fill("input[name='password']", PASSWORD)
+                submit_btn = page.query_selector("input[type='submit']") or page.query_selector("button[type='submit']") or page.query_selector(".btn-submit")
+                if submit_btn:
+                    submit_btn.click()
+            
+            print("等待登录跳转...")
+            try:
+                page.wait_for_selector("input[type='password']", state="hidden", timeout=5000)
+            except:
+                pass
+            
+            page.wait_for_timeout(3000)
+            print(f"当前页面 URL: {page.url}")
+
+            if "r=goods" not in page.url or "login" in page.url:
+                print("未自动跳转到商品列表页，尝试强制访问...")
+                page.goto(LOGIN_URL)
+                page.wait_for_load_state('networkidle')
+            
+            print("登录流程结束。")
+        else:
+            print("已处于登录状态。")
+            
+        if page.query_selector("table"):
+            print("成功检测到商品列表表格！")
+        else:
+            print("警告：当前页面未找到表格，可能需要手动干预。")
+            
+    except Exception as e:
+        print(f"登录检查异常: {e}")
+
+def browser_login_cookies():
+    """用 Playwright 登录一次并返回 cookies，供 HTTP 模式复用登录会话"""
+    p = sync_playwright().start()
+    try:
+        browser = p.chromium.launch(headless=HEADLESS)
+        try:
+            context = RESOURCE_FILTER.attach(browser.new_context())
+            browser_login(context.new_page())
+            return context.cookies()
+        finally:
+            browser.close()
+    finally:
+        p.stop()
+
+def scrape_with_browser(target_ids, list_info=None, select_ids=None):
     """
-    合并新表头到主表头列表，保持相对顺序。
+    浏览器模式：Playwright 登录后扫描列表页 (target_ids 为空时) 并抓取详情。
+    list_info 为已有的列表页信息 (HTTP 模式回退、续跑时传入)。
+    select_ids(列表页ID, list_info, 是否扫描到最后一页) 返回实际需要抓取详情的 ID (增量模式并记入运行日志)。
+    返回 (ids_to_process, list_info, {ID 在 ids_to_process 中的下标: scrape_goods_detail 的结果})。
     """
-    last_index = -1
-    for header in current_headers:
-        if header in master_headers:
-            last_index = master_headers.index(header)
-        else:
-            # 插入到上一个已知列的后面
-            insert_pos = last_index + 1
-            master_headers.insert(insert_pos, header)
-            last_index = insert_pos
+    ids_to_process = list(target_ids)
+    list_info = list_info or ({}, {}, {})
+    # ID -> 同步状态 / 最近提交时间 / 商品图片链接
+    scraped_sync_status, scraped_submit_time, scraped_image_url = list_info
+    results = {}
 
-def run_scraping():
-    parser = argparse.ArgumentParser(description='Scrape goods data')
-    parser.add_argument('--target-ids', type=str, help='Comma separated list of IDs to scrape', default='')
-    args = parser.parse_args()
-    
-    target_ids = []
-    if args.target_ids:
-        target_ids = [x.strip() for x in args.target_ids.split(',') if x.strip()]
-        print(f"启动抓取任务 (指定ID模式)，目标ID: {target_ids}，HEADLESS={HEADLESS}")
-    else:
-        print(f"启动抓取任务 (全量模式)，HEADLESS={HEADLESS}，MAX_PAGES={MAX_PAGES}")
-    
-    all_sku_rows = []
-    master_sku_headers = [] # 用于记录所有SKU列的正确顺序
-    
     p = None
     browser = None
     try:
@@ -54,69 +119,19 @@ def run_scraping():
         print("启动 Chromium 浏览器...")
         browser = p.chromium.launch(headless=HEADLESS)
         print("创建上下文...")
-        context = browser.new_context()
+        context = RESOURCE_FILTER.attach(browser.new_context())
         print("创建页面...")
         page = context.new_page()
         print("浏览器上下文与页面已创建。")
-        
-        # --- 登录阶段 ---
-        print(f"正在访问登录页面: {LOGIN_URL}")
-        page.goto(LOGIN_URL)
-        try:
-            page.wait_for_load_state('networkidle')
-            if "login" in page.url or page.query_selector("input[type='password']"):
-                print(f"检测到需要登录 (当前URL: {page.url})")
-                
-                if USERNAME and PASSWORD:
-                    print(f"尝试自动登录...")
-                    if page.query_selector("input[name='username']"):
-                        page.fill("input[name='username']", USERNAME)
-                    if page.query_selector("input[name='password']"):
-                        page.fill("input[name='password']", PASSWORD)
-                    submit_btn = page.query_selector("input[type='submit']") or page.query_selector("button[type='submit']") or page.query_selector(".btn-submit")
-                    if submit_btn:
-                        submit_btn.click()
-                
-                print("等待登录跳转...")
-                try:
-                    page.wait_for_selector("input[type='password']", state="hidden", timeout=5000)
-                except:
-                    pass
-                
-                page.wait_for_timeout(3000)
-                print(f"当前页面 URL: {page.url}")
-
-                if "r=goods" not in page.url or "login" in page.url:
-                    print("未自动跳转到商品列表页，尝试强制访问...")
-                    page.goto(LOGIN_URL)
-                    page.wait_for_load_state('networkidle')
-                
-                print("登录流程结束。")
-            else:
-                print("已处于登录状态。")
-                
-            if page.query_selector("table"):
-                print("成功检测到商品列表表格！")
-            else:
-                print("警告：当前页面未找到表格，可能需要手动干预。")
-                
-        except Exception as e:
-            print(f"登录检查异常: {e}")
+        browser_login(page)
 
         # --- 第一阶段：扫描列表页收集新ID ---
-        ids_to_process = []
-        scraped_sync_status = {}  # ID -> Sync Status
-        scraped_submit_time = {}  # ID -> 最近提交时间
-        scraped_image_url = {}  # ID -> 商品图片链接
-        
         if target_ids:
             print("\n=== 指定ID模式：跳过列表扫描，直接处理指定ID ===")
-            ids_to_process = target_ids
         else:
             print("\n=== 第一阶段：扫描列表页收集新ID ===")
-            processed_ids = set()
-            FORCE_UPDATE = True
             page_num = 1
+        scan_complete = False
         
         while not target_ids:
             if MAX_PAGES > 0 and page_num > MAX_PAGES:
@@ -195,6 +210,7 @@ def run_scraping():
                     parent_class = next_btn.evaluate("el => el.parentElement.className")
                     if "disabled" in parent_class:
                         print("下一页按钮被禁用，扫描结束。")
+                        scan_complete = True
                         break
                     
                     next_btn.click()
@@ -206,140 +222,25 @@ def run_scraping():
                     break
             else:
                 print("未找到下一页按钮，扫描结束。")
+                scan_complete = True
                 break
 
             print(f"\n扫描结束，共发现 {len(ids_to_process)} 个新商品需要抓取。")
+
+        if select_ids and not target_ids:
+            ids_to_process = select_ids(ids_to_process, list_info, scan_complete)
         
         # --- 第二阶段：批量抓取详情 ---
         if ids_to_process:
-            print("\n=== 第二阶段：批量抓取详情 ===")
-            processed_count = 0
-            
-            for goods_id in ids_to_process:
-                processed_count += 1
-                print(f"[{processed_count}/{len(ids_to_process)}] 正在处理 ID: {goods_id}")
-                
-                max_retries = 3
-                for retry in range(max_retries):
-                    try:
-                        # 每次重试前确保上下文有效
-                        if context.pages and len(context.pages) > 0 and context.pages[0].is_closed():
-                             print("  上下文已关闭，尝试重建...")
-                             # 这里比较复杂，简单起见只重试页面
-                        
-                        detail_page = context.new_page()
-                        detail_url = f"https://szguokuai.zlj.xyzulin.top/web/index.php?c=site&a=entry&m=ewei_shopv2&do=web&r=goods.edit&id={goods_id}&goodsfrom=sale&page=1"
-                        
-                        # 设置超时
-                        detail_page.set_default_timeout(15000)
-                        
-                        try:
-                            detail_page.goto(detail_url, timeout=20000)
-                        except Exception as nav_err:
-                            print(f"  导航失败 ({retry+1}/{max_retries}): {nav_err}")
-                            detail_page.close()
-                            continue
-
-                        try:
-                            detail_page.wait_for_selector("#goodsname", state="visible", timeout=15000)
-                            
-                            goods_name = detail_page.input_value("#goodsname")
-                            
-                            short_title = ""
-                            short_title_selector = "#tab_basic > div > div:nth-child(1) > div.region-goods-right.col-sm-10 > div:nth-child(3) > div > input"
-                            if detail_page.query_selector(short_title_selector):
-                                short_title = detail_page.input_value(short_title_selector)
-                            
-                            # 抓取分类信息
-                            cate1 = ""
-                            cate2 = ""
-                            cate3 = ""
-                            
-                            def get_cate_text(p, sel):
-                                try:
-                                    txt = p.eval_on_selector(sel, "el => el.options[el.selectedIndex] ? el.options[el.selectedIndex].text : ''").strip()
-                                    return "" if "请选择" in txt else txt
-                                except:
-                                    return ""
-
-                            # 等待分类加载 (简单等待)
-                            try:
-                                detail_page.wait_for_selector("#cate1", state="attached", timeout=5000)
-                            except: pass
+            print(f"\n=== 第二阶段：批量抓取详情 (并发 {GOODS_CONCURRENCY}) ===")
+            if GOODS_CONCURRENCY > 1 and len(ids_to_process) > 1:
+                # 各 worker 使用独立的浏览器，通过 storage_state 共享登录会话
+                results = scrape_details_concurrently(context.storage_state(), ids_to_process, list_info)
+            else:
+                for index, goods_id in enumerate(ids_to_process):
+                    print(f"[{index + 1}/{len(ids_to_process)}] 正在处理 ID: {goods_id}")
+                    results[index] = scrape_goods_detail(context, goods_id, list_info)
 
-                            cate1 = get_cate_text(detail_page, "#cate1")
-                            cate2 = get_cate_text(detail_page, "#cate2")
-                            cate3 = get_cate_text(detail_page, "#cate3")
-                            
-                            print(f"  分类: {cate1} | {cate2} | {cate3}")
-                            
-                            # --- SKU 表格抓取优化 ---
-                            sku_table = detail_page.query_selector("#options > table")
-                            
-                            if sku_table:
-                                # 1. 获取动态表头
-                                headers = []
-                                try:
-                                    ths = sku_table.query_selector_all("thead th")
-                                    for th in ths:
-                                        h_text = th.inner_text().strip()
-                                        if h_text:
-                                            headers.append(h_text)
-                                except:
-                                    pass
-                                
-                                # 更新主表头顺序
-                                update_master_headers(master_sku_headers, headers)
-                                
-                                # 2. 获取所有数据行
-                                # 使用新的解析函数
-                                sku_rows = parse_sku_table(sku_table, master_sku_headers)
-                                
-                                for row_data in sku_rows:
-                                    # 补全基础信息
-                                    row_data["ID"] = goods_id
-                                    row_data["商品名称"] = goods_name
-                                    row_data["短标题"] = short_title
-                                    row_data["是否同步支付宝"] = scraped_sync_status.get(goods_id, "未知")
-                                    row_data["最近提交时间"] = scraped_submit_time.get(goods_id, "")
-                                    row_data["商品图片"] = scraped_image_url.get(goods_id, "")
-                                    row_data["1级分类"] = cate1
-                                    row_data["2级分类"] = cate2
-                                    row_data["3级分类"] = cate3
-                                    all_sku_rows.append(row_data)
-                            else:
-                                # 无SKU表格，仅保存基本信息
-                                all_sku_rows.append({
-                                    "ID": goods_id,
-                                    "商品名称": goods_name,
-                                    "短标题": short_title,
-                                    "是否同步支付宝": scraped_sync_status.get(goods_id, "未知"),
-                                    "最近提交时间": scraped_submit_time.get(goods_id, ""),
-                                    "商品图片": scraped_image_url.get(goods_id, ""),
-                                    "1级分类": cate1,
-                                    "2级分类": cate2,
-                                    "3级分类": cate3
-                                })
-                                
-                            # 成功，跳出重试循环
-                            detail_page.close()
-                            break
-                                
-                        except Exception as e:
-                            print(f"  抓取详情异常 ({retry+1}/{max_retries}): {e}")
-                            detail_page.close()
-                            if "Target page, context or browser has been closed" in str(e):
-                                # 这种错误可能需要稍作等待
-                                time.sleep(2)
-                            continue
-                        
-                    except Exception as e:
-                        print(f"  页面操作严重错误 ({retry+1}/{max_retries}): {e}")
-                        if 'detail_page' in locals():
-                            try: detail_page.close() 
-                            except: pass
-                        time.sleep(1)
-        
     except Exception as e:
         print(f"抓取流程发生异常: {e}")
         import traceback
@@ -352,11 +253,233 @@ def run_scraping():
             try: p.stop()
             except: pass
 
-    if not all_sku_rows:
-        if not FORCE_UPDATE and processed_ids:
-            print("没有抓取到任何SKU数据，可能是历史ID已全部处理。")
+    print(RESOURCE_FILTER.summary())
+    return ids_to_process, list_info, results
+
+def scrape_with_http(target_ids, fixtures_dir="", save_dir="", select_ids=None, list_info=None):
+    """
+    HTTP 模式：登录一次后用带连接池的会话直接请求列表页与详情页 HTML，
+    不启动浏览器。表单登录不成功时用 Playwright 登录一次并导入 cookies。
+    target_ids / list_info / select_ids 与返回值同 scrape_with_browser；抓取失败的 ID 对应结果为 None。
+    """
+    client = scrape_http.HttpSession(pool_size=GOODS_CONCURRENCY, fixtures_dir=fixtures_dir or None, save_dir=save_dir or None)
+    try:
+        print(f"正在通过 HTTP 登录: {LOGIN_URL}")
+        if not client.login(LOGIN_URL, USERNAME, PASSWORD):
+            print("HTTP 表单登录未成功，改用浏览器登录获取 cookies...")
+            client.add_cookies(browser_login_cookies())
+
+        ids_to_process = list(target_ids)
+        list_info = list_info or ({}, {}, {})
+        if target_ids:
+            print("\n=== 指定ID模式：跳过列表扫描，直接处理指定ID ===")
+        else:
+            print("\n=== 第一阶段：扫描列表页收集新ID (HTTP) ===")
+            ids_to_process, scan_complete = scrape_http.scan_list_pages(client, LOGIN_URL, list_info, MAX_PAGES)
+            print(f"\n扫描结束，共发现 {len(ids_to_process)} 个新商品需要抓取。")
+            if select_ids:
+                ids_to_process = select_ids(ids_to_process, list_info, scan_complete)
+
+        def fetch_detail(index, goods_id):
+            print(f"[{index + 1}/{len(ids_to_process)}] 正在处理 ID: {goods_id}")
+            detail_url = DETAIL_URL.format(goods_id=goods_id)
+            for retry in range(MAX_DETAIL_RETRIES):
+                try:
+                    result = scrape_http.parse_detail_page(client.get(detail_url), goods_id, list_info)
+                    journal_goods(goods_id, result)
+                    return result
+                except scrape_http.CategoriesNotRendered as e:
+                    # 重试也拿不到，交给浏览器重试
+                    print(f"  [{goods_id}] {e}，改用浏览器抓取")
+                    return None
+                except Exception as e:
+                    print(f"  [{goods_id}] HTTP 抓取详情异常 ({retry+1}/{MAX_DETAIL_RETRIES}): {e}")
+            return None
+
+        results = {}
+        if ids_to_process:
+            print(f"\n=== 第二阶段：批量抓取详情 (HTTP，并发 {GOODS_CONCURRENCY}) ===")
+            with ThreadPoolExecutor(max_workers=GOODS_CONCURRENCY) as pool:
+                futures = {pool.submit(fetch_detail, index, goods_id): index for index, goods_id in enumerate(ids_to_process)}
+                for future, index in futures.items():
+                    results[index] = future.result()
+        return ids_to_process, list_info, results
+    finally:
+        client.close()
+
+def load_known_goods(path):
+    """读取库中已有商品的列表页字段 {ID: {"最近提交时间": ..., "是否同步支付宝": ...}}"""
+    if not os.path.exists(path):
+        print(f"未找到已有商品文件 {path}，所有ID按新增处理。")
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def make_incremental_selector(known, manifest):
+    """
+    增量模式的 select_ids：只抓取新增的ID，以及列表页 最近提交时间 / 同步状态
+    与库中不同的ID。列表扫描到最后一页时，库中有而列表页没有的ID记为下架；
+    结果写入 manifest。
+    """
+    def select_ids(listed_ids, list_info, scan_complete):
+        scraped_sync_status, scraped_submit_time, _ = list_info
+        new_ids = []
+        changed_ids = []
+        for goods_id in listed_ids:
+            stored = known.get(goods_id)
+            if stored is None:
+                new_ids.append(goods_id)
+            elif (scraped_submit_time.get(goods_id, "") != (stored.get("最近提交时间") or "")
+                  or scraped_sync_status.get(goods_id, "未知") != (stored.get("是否同步支付宝") or "")):
+                changed_ids.append(goods_id)
+        # 列表未扫描完整 (MAX_PAGES / 翻页失败) 时无法判断下架
+        listed = set(listed_ids)
+        deleted_ids = [goods_id for goods_id in known if goods_id not in listed] if scan_complete else []
+        skipped = len(listed_ids) - len(new_ids) - len(changed_ids)
+        manifest.update({
+            "incremental": True,
+            "scan_complete": scan_complete,
+            "listed": len(listed_ids),
+            "new": new_ids,
+            "changed": changed_ids,
+            "skipped": skipped,
+            "deleted": deleted_ids
+        })
+        print(f"增量模式：列表页共 {len(listed_ids)} 个ID，新增 {len(new_ids)}，有变化 {len(changed_ids)}，跳过 {skipped}，"
+              + (f"已下架 {len(deleted_ids)}" if scan_complete else "列表未扫描完整，不判断下架"))
+        fetch_ids = set(new_ids) | set(changed_ids)
+        return [goods_id for goods_id in listed_ids if goods_id in fetch_ids]
+    return select_ids
+
+def run_scraping():
+    parser = argparse.ArgumentParser(description='Scrape goods data')
+    parser.add_argument('--target-ids', type=str, help='Comma separated list of IDs to scrape', default='')
+    parser.add_argument('--mode', choices=['browser', 'http'], default=SCRAPE_MODE,
+                        help='browser: render pages in Chromium; http: fetch the HTML directly, falling back to the browser for failed IDs')
+    parser.add_argument('--fixtures', type=str, default='', help='http mode: read saved list_<page>.html / edit_<id>.html from this directory instead of the network')
+    parser.add_argument('--save-fixtures', type=str, default='', help='http mode: save every fetched page to this directory')
+    parser.add_argument('--incremental', action='store_true',
+                        help='only fetch detail pages of new goods and goods whose list-page submit time or sync status differ from --known-file')
+    parser.add_argument('--known-file', type=str, default=KNOWN_FILE, help='JSON {ID: {最近提交时间, 是否同步支付宝}} of the goods already stored')
+    parser.add_argument('--run-id', type=str, default='', help='ID of the run journal to create (default: timestamp)')
+    parser.add_argument('--resume', type=str, default='', help='resume the journaled run with this ID, skipping goods it already completed')
+    args = parser.parse_args()
+    
+    target_ids = []
+    if args.target_ids:
+        target_ids = [x.strip() for x in args.target_ids.split(',') if x.strip()]
+
+    # 运行日志：每个商品抓取完成即落盘，中断后可 --resume 继续
+    global JOURNAL
+    if args.resume:
+        JOURNAL = scrape_journal.ScrapeJournal.resume(JOURNAL_DIR, args.resume)
+        start = JOURNAL.start_info
+        args.mode = start.get("mode", args.mode)
+        args.incremental = start.get("incremental", False)
+        args.known_file = start.get("known_file", args.known_file)
+        target_ids = start.get("target_ids", [])
+        print(f"继续抓取任务 {JOURNAL.run_id}，已完成 {len(JOURNAL.completed)} 个商品")
+    else:
+        JOURNAL = scrape_journal.ScrapeJournal.create(JOURNAL_DIR, args.run_id or None)
+        JOURNAL.start({"mode": args.mode, "target_ids": target_ids, "incremental": args.incremental, "known_file": args.known_file})
+        print(f"抓取任务 {JOURNAL.run_id}，运行日志: {JOURNAL.path}")
+
+    if target_ids:
+        print(f"启动抓取任务 (指定ID模式)，目标ID: {target_ids}，MODE={args.mode}，HEADLESS={HEADLESS}")
+    else:
+        print(f"启动抓取任务 ({'增量' if args.incremental else '全量'}模式)，MODE={args.mode}，HEADLESS={HEADLESS}，MAX_PAGES={MAX_PAGES}")
+    
+    all_sku_rows = []
+    master_sku_headers = [] # 用于记录所有SKU列的正确顺序
+
+    manifest = dict(JOURNAL.manifest)
+    incremental = args.incremental and not target_ids
+    selector = make_incremental_selector(load_known_goods(args.known_file), manifest) if incremental else None
+
+    def select_ids(listed_ids, list_info, scan_complete):
+        selected = selector(listed_ids, list_info, scan_complete) if selector else listed_ids
+        JOURNAL.record_ids(selected, list_info, manifest)
+        return selected
+
+    # all_ids: 本次任务的全部ID (按列表顺序)；run_ids: 本次进程需要抓取的ID
+    all_ids = JOURNAL.ids
+    list_info = None
+    if all_ids is not None:
+        # 续跑且列表已扫描：跳过扫描，只抓取未完成的ID
+        run_ids = [goods_id for goods_id in all_ids if goods_id not in JOURNAL.completed]
+        list_info = JOURNAL.list_info
+        print(f"共 {len(all_ids)} 个ID，剩余 {len(run_ids)} 个未完成")
+    elif target_ids:
+        all_ids = run_ids = target_ids
+        JOURNAL.record_ids(target_ids, ({}, {}, {}))
+    else:
+        run_ids = []
+
+    ids_to_process = []
+    results = None
+    if all_ids is not None and not run_ids:
+        results = {}
+    elif args.mode == "http":
+        if not scrape_http.http_mode_available():
+            print("HTTP 模式需要安装 requests 与 selectolax。")
         else:
-            print("没有抓取到任何SKU数据。")
+            try:
+                ids_to_process, list_info, results = scrape_with_http(run_ids, args.fixtures, args.save_fixtures, select_ids, list_info)
+            except Exception as e:
+                print(f"HTTP 抓取流程发生异常: {e}")
+                import traceback
+                traceback.print_exc()
+
+    if args.fixtures:
+        # 离线复现不回退到浏览器
+        results = results or {}
+    elif results is None:
+        if args.mode == "http":
+            print("回退到浏览器模式...")
+        ids_to_process, list_info, results = scrape_with_browser(run_ids, list_info, select_ids)
+    else:
+        retry_indices = [index for index in range(len(ids_to_process)) if results.get(index) is None]
+        if retry_indices:
+            print(f"HTTP 模式下 {len(retry_indices)} 个ID抓取失败，改用浏览器重试...")
+            _, _, browser_results = scrape_with_browser([ids_to_process[i] for i in retry_indices], list_info)
+            for n, index in enumerate(retry_indices):
+                results[index] = browser_results.get(n)
+
+    if all_ids is None:
+        all_ids = ids_to_process
+    # 之前的进程已完成的商品 (续跑时) 加上本次抓取的结果
+    results_by_id = dict(JOURNAL.completed)
+    for index, goods_id in enumerate(ids_to_process):
+        if results.get(index) is not None:
+            results_by_id[goods_id] = results[index]
+
+    # 按 ID 原始顺序合并表头与数据，输出与串行抓取一致
+    failed_ids = []
+    for goods_id in all_ids:
+        result = results_by_id.get(goods_id)
+        if result is None:
+            failed_ids.append(goods_id)
+            continue
+        header_lists, sku_rows = result
+        for headers in header_lists:
+            update_master_headers(master_sku_headers, headers)
+        all_sku_rows.extend(sku_rows)
+    if failed_ids:
+        print(f"以下 {len(failed_ids)} 个ID多次重试后仍失败: {','.join(failed_ids)}")
+    JOURNAL.finish(failed_ids)
+    JOURNAL.close()
+
+    if incremental:
+        manifest["failed"] = failed_ids
+        with open(MANIFEST_FILE, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False)
+        print(f"增量清单已保存到 {MANIFEST_FILE}")
+
+    if not all_sku_rows:
+        print("没有抓取到任何SKU数据。")
+        if incremental:
+            # 没有变化时输出空文件，避免合并上一次的抓取结果
+            open(OUTPUT_FILE, "w", encoding="utf-8").close()
         return
 
     print("开始整理数据并保存...")
@@ -415,8 +538,8 @@ def run_scraping():
 
     # 保存数据
     try:
-        # Save as JSON
-        df.to_json(OUTPUT_FILE, orient="records", force_ascii=False, indent=2)
+        # Save as NDJSON (one row per line) so the merge can stream it
+        df.to_json(OUTPUT_FILE, orient="records", force_ascii=False, lines=True)
         print(f"数据已保存到 {OUTPUT_FILE}")
     except Exception as e:
         print(f"保存 JSON 失败: {e}")
@@ -424,164 +547,189 @@ def run_scraping():
     # 全量模式下无需保存 processed_ids
     print("完成。")
 
-def parse_sku_table(sku_table, master_headers):
+def journal_goods(goods_id, result):
+    """商品抓取完成后立即写入运行日志"""
+    if JOURNAL is not None:
+        JOURNAL.record_goods(goods_id, *result)
+
+def scrape_goods_detail(context, goods_id, list_info):
     """
-    解析 SKU 表格，处理 rowspan，合并规格列，提取数据列。
-    返回: list of dict (rows)
+    抓取单个商品详情页 (最多重试 MAX_DETAIL_RETRIES 次)。
+    返回 (表头列表, SKU 行)，表头由调用方按 ID 顺序合并到 master_sku_headers；
+    全部重试失败时返回 None。
     """
-    rows = []
-    try:
-        # 1. 获取表头
-        thead = sku_table.query_selector("thead")
-        if not thead: return []
-        
-        headers = []
-        ths = thead.query_selector_all("th")
-        for th in ths:
-            headers.append(th.inner_text().strip())
+    scraped_sync_status, scraped_submit_time, scraped_image_url = list_info
+    for retry in range(MAX_DETAIL_RETRIES):
+        detail_page = None
+        try:
+            detail_page = context.new_page()
+            detail_url = DETAIL_URL.format(goods_id=goods_id)
             
-        # 更新主表头记录
-        update_master_headers(master_headers, headers)
-        
-        # 2. 构建网格 (处理 rowspan)
-        tbody = sku_table.query_selector("tbody")
-        if not tbody: return []
-        
-        tr_elements = tbody.query_selector_all("tr")
-        if not tr_elements: return []
-        
-        # 初始化网格
-        # 这是一个动态增长的网格，row_idx -> col_idx -> {text, element}
-        grid = {} 
-        
-        current_row_idx = 0
-        for tr in tr_elements:
-            tds = tr.query_selector_all("td")
-            current_col_idx = 0
+            # 设置超时
+            detail_page.set_default_timeout(15000)
             
-            # 确保当前行存在
-            if current_row_idx not in grid:
-                grid[current_row_idx] = {}
+            try:
+                RESOURCE_FILTER.timed_load(detail_page.goto, detail_url, timeout=20000)
+            except Exception as nav_err:
+                print(f"  [{goods_id}] 导航失败 ({retry+1}/{MAX_DETAIL_RETRIES}): {nav_err}")
+                detail_page.close()
+                continue
+
+            try:
+                detail_page.wait_for_selector("#goodsname", state="visible", timeout=15000)
                 
-            for td in tds:
-                # 跳过已被占用的位置
-                while current_col_idx in grid[current_row_idx]:
-                    current_col_idx += 1
+                goods_name = detail_page.input_value("#goodsname")
                 
-                # 获取属性
-                rowspan = 1
-                colspan = 1
-                try:
-                    rs = td.get_attribute("rowspan")
-                    if rs: rowspan = int(rs)
-                except: pass
+                short_title = ""
+                short_title_selector = "#tab_basic > div > div:nth-child(1) > div.region-goods-right.col-sm-10 > div:nth-child(3) > div > input"
+                if detail_page.query_selector(short_title_selector):
+                    short_title = detail_page.input_value(short_title_selector)
                 
+                # 抓取分类信息
+                def get_cate_text(p, sel):
+                    try:
+                        txt = p.eval_on_selector(sel, "el => el.options[el.selectedIndex] ? el.options[el.selectedIndex].text : ''").strip()
+                        return "" if "请选择" in txt else txt
+                    except:
+                        return ""
+
+                # 等待分类加载 (简单等待)
                 try:
-                    cs = td.get_attribute("colspan")
-                    if cs: colspan = int(cs)
+                    detail_page.wait_for_selector("#cate1", state="attached", timeout=5000)
                 except: pass
+
+                cate1 = get_cate_text(detail_page, "#cate1")
+                cate2 = get_cate_text(detail_page, "#cate2")
+                cate3 = get_cate_text(detail_page, "#cate3")
                 
-                # 提取数据
-                # 优先找 input
-                val = ""
-                is_data_col = False
-                
-                input_el = td.query_selector("input:not([type='hidden'])")
-                if input_el:
-                    val = input_el.input_value()
-                    is_data_col = True
-                else:
-                    select_el = td.query_selector("select")
-                    if select_el:
-                        val = select_el.input_value()
-                        is_data_col = True # select 通常也是数据设定
-                    else:
-                        val = td.inner_text().strip()
+                print(f"  [{goods_id}] 分类: {cate1} | {cate2} | {cate3}")
                 
-                cell_info = {
-                    "value": val,
-                    "is_data": is_data_col
+                base_info = {
+                    "ID": goods_id,
+                    "商品名称": goods_name,
+                    "短标题": short_title,
+                    "是否同步支付宝": scraped_sync_status.get(goods_id, "未知"),
+                    "最近提交时间": scraped_submit_time.get(goods_id, ""),
+                    "商品图片": scraped_image_url.get(goods_id, ""),
+                    "1级分类": cate1,
+                    "2级分类": cate2,
+                    "3级分类": cate3
                 }
+                header_lists = []
+                sku_rows = []
                 
-                # 填充网格
-                for r in range(rowspan):
-                    for c in range(colspan):
-                        target_row = current_row_idx + r
-                        target_col = current_col_idx + c
-                        
-                        if target_row not in grid:
-                            grid[target_row] = {}
-                        
-                        grid[target_row][target_col] = cell_info
-                        
-                current_col_idx += colspan
-                
-            current_row_idx += 1
-            
-        # 3. 从网格生成数据行
-        num_cols = len(headers)
-        
-        # 识别哪些列是“数据列”，哪些是“规格列”
-        # 启发式规则：
-        # - 列名包含 "库存", "编号", "租金", "价格", "重量", "编码" -> 数据列
-        # - 单元格包含 input -> 数据列 (在 cell_info 中已标记)
-        # - 其他 -> 规格列
-        
-        spec_col_indices = []
-        data_col_indices = []
-        
-        for idx, h in enumerate(headers):
-            h_lower = h.lower()
-            if any(k in h_lower for k in ["库存", "编号", "租金", "价格", "重量", "编码", "id"]):
-                data_col_indices.append(idx)
-            else:
-                # 进一步检查该列在所有行中是否包含 input
-                has_input = False
-                for r in range(current_row_idx):
-                    if r in grid and idx in grid[r] and grid[r][idx]["is_data"]:
-                        has_input = True
-                        break
+                # --- SKU 表格抓取优化 ---
+                sku_table = detail_page.query_selector("#options > table")
                 
-                if has_input:
-                    data_col_indices.append(idx)
+                if sku_table:
+                    # 1. 获取动态表头
+                    headers = []
+                    try:
+                        ths = sku_table.query_selector_all("thead th")
+                        for th in ths:
+                            h_text = th.inner_text().strip()
+                            if h_text:
+                                headers.append(h_text)
+                    except:
+                        pass
+                    header_lists.append(headers)
+                    
+                    # 2. 获取所有数据行 (parse_sku_table 记录的表头也一并返回)
+                    table_headers = []
+                    sku_rows = parse_sku_table(sku_table, table_headers)
+                    header_lists.append(table_headers)
+                    
+                    for row_data in sku_rows:
+                        # 补全基础信息
+                        row_data.update(base_info)
                 else:
-                    spec_col_indices.append(idx)
-
-        # 生成每一行的数据
-        for r in range(current_row_idx):
-            if r not in grid: continue
-            
-            row_data = {}
-            specs = []
-            
-            # 收集规格
-            for c in spec_col_indices:
-                if c in grid[r]:
-                    val = grid[r][c]["value"]
-                    if val:
-                        # 加上表头名称，格式：表头：值
-                        header_name = headers[c] if c < len(headers) else ""
-                        if header_name:
-                            specs.append(f"{header_name}：{val}")
-                        else:
-                            specs.append(val)
-            
-            row_data["SKU"] = "|".join(specs)
-            
-            # 收集数据
-            for c in data_col_indices:
-                if c in grid[r]:
-                    header_name = headers[c] if c < len(headers) else f"Col_{c}"
-                    row_data[header_name] = grid[r][c]["value"]
-            
-            rows.append(row_data)
+                    # 无SKU表格，仅保存基本信息
+                    sku_rows = [dict(base_info)]
+                    
+                # 成功，跳出重试循环
+                detail_page.close()
+                journal_goods(goods_id, (header_lists, sku_rows))
+                return header_lists, sku_rows
+                    
+            except Exception as e:
+                print(f"  [{goods_id}] 抓取详情异常 ({retry+1}/{MAX_DETAIL_RETRIES}): {e}")
+                detail_page.close()
+                if "Target page, context or browser has been closed" in str(e):
+                    # 这种错误可能需要稍作等待
+                    time.sleep(2)
+                continue
             
+        except Exception as e:
+            print(f"  [{goods_id}] 页面操作严重错误 ({retry+1}/{MAX_DETAIL_RETRIES}): {e}")
+            if detail_page is not None:
+                try: detail_page.close() 
+                except: pass
+            time.sleep(1)
+    return None
+
+def scrape_details_concurrently(storage_state, ids, list_info):
+    """
+    用 GOODS_CONCURRENCY 个 worker 线程并发抓取详情页。Playwright 同步 API
+    不能跨线程共享，所以每个 worker 启动自己的 Playwright 与浏览器，并用
+    主上下文的 storage_state (cookies) 复用登录会话。
+    返回 {ID 在 ids 中的下标: scrape_goods_detail 的结果}。
+    """
+    jobs = queue.Queue()
+    for index, goods_id in enumerate(ids):
+        jobs.put((index, goods_id))
+    results = {}
+    progress = {"done": 0}
+    lock = threading.Lock()
+
+    def worker(worker_num):
+        p = None
+        browser = None
+        try:
+            p = sync_playwright().start()
+            browser = p.chromium.launch(headless=HEADLESS)
+            context = RESOURCE_FILTER.attach(browser.new_context(storage_state=storage_state))
+            while True:
+                try:
+                    index, goods_id = jobs.get_nowait()
+                except queue.Empty:
+                    break
+                with lock:
+                    progress["done"] += 1
+                    print(f"[{progress['done']}/{len(ids)}] worker {worker_num} 正在处理 ID: {goods_id}")
+                result = scrape_goods_detail(context, goods_id, list_info)
+                with lock:
+                    results[index] = result
+        except Exception as e:
+            # 未取走的 ID 由其他 worker 继续处理
+            print(f"worker {worker_num} 异常退出: {e}")
+        finally:
+            if browser:
+                try: browser.close()
+                except: pass
+            if p:
+                try: p.stop()
+                except: pass
+
+    workers = [threading.Thread(target=worker, args=(n + 1,)) for n in range(min(GOODS_CONCURRENCY, len(ids)))]
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    return results
+
+def parse_sku_table(sku_table, master_headers):
+    """
+    解析 SKU 表格，处理 rowspan，合并规格列，提取数据列。
+    整张表通过 sku_table.extract_sku_table 一次 evaluate 取回。
+    返回: list of dict (rows)
+    """
+    try:
+        return sku_table_rows(extract_sku_table(sku_table), master_headers)
     except Exception as e:
         print(f"解析 SKU 表格出错: {e}")
         import traceback
         traceback.print_exc()
-        
-    return rows
+        return []
 
 if __name__ == "__main__":
     try:
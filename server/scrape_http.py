@@ -0,0 +1,291 @@
+"""
+scrape_goods.py 的 HTTP 模式 (--mode http)：不启动浏览器，用带连接池的
+requests.Session 直接获取 r=goods 列表页与 r=goods.edit 详情页的 HTML，
+再用 selectolax 解析成与浏览器模式相同的行结构。
+
+解析函数只依赖 HTML 文本，可以离线对保存下来的页面运行：
+--save-fixtures DIR 会把抓到的页面存为 list_<页码>.html / edit_<ID>.html，
+--fixtures DIR 则从这些文件读取页面而不访问网络。
+"""
+import os
+from urllib.parse import urljoin, urlparse, parse_qs, urlencode, urlunparse
+
+try:
+    import requests
+    from requests.adapters import HTTPAdapter
+except ImportError:
+    requests = None
+
+try:
+    from selectolax.lexbor import LexborHTMLParser as HTMLParser
+except ImportError:
+    HTMLParser = None
+
+from sku_table import extract_sku_table_html, sku_table_rows, control_value, inner_text
+
+REQUEST_TIMEOUT = 20
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0 Safari/537.36"
+
+# 与浏览器模式使用相同的选择器
+LIST_ROW_SELECTOR = "body > div.wb-container > div.page-content > div.row > div > table > tbody > tr"
+SHORT_TITLE_SELECTOR = "#tab_basic > div > div:nth-child(1) > div.region-goods-right.col-sm-10 > div:nth-child(3) > div > input"
+CATEGORY_SELECTORS = ["#cate1", "#cate2", "#cate3"]
+
+
+class CategoriesNotRendered(ValueError):
+    """分类下拉框的选项由页面脚本加载，静态 HTML 取不到分类，需改用浏览器抓取该商品"""
+
+
+def http_mode_available():
+    return requests is not None and HTMLParser is not None
+
+
+def fixture_name(url):
+    """页面对应的 fixture 文件名：详情页 edit_<ID>.html，列表页 list_<页码>.html"""
+    query = parse_qs(urlparse(url).query)
+    route = query.get("r", [""])[0]
+    if route == "goods.edit":
+        return f"edit_{query.get('id', [''])[0]}.html"
+    return f"list_{query.get('page', ['1'])[0]}.html"
+
+
+class HttpSession:
+    """
+    带 keep-alive 连接池的页面获取器，各 worker 线程共用。
+    fixtures_dir 不为空时从保存的 HTML 读取页面 (离线)；
+    save_dir 不为空时把获取到的页面另存一份，供之后离线复现。
+    """
+
+    def __init__(self, pool_size=1, fixtures_dir=None, save_dir=None):
+        self.fixtures_dir = fixtures_dir
+        self.save_dir = save_dir
+        self.session = None
+        if fixtures_dir:
+            return
+        if requests is None:
+            raise RuntimeError("HTTP 模式需要安装 requests")
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(1, pool_size))
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers["User-Agent"] = USER_AGENT
+        if save_dir:
+            os.makedirs(save_dir, exist_ok=True)
+
+    def add_cookies(self, cookies):
+        """导入 Playwright context.cookies() 的登录会话"""
+        for c in cookies:
+            self.session.cookies.set(c["name"], c["value"], domain=c.get("domain", ""), path=c.get("path", "/"))
+
+    def get(self, url):
+        if self.fixtures_dir:
+            path = os.path.join(self.fixtures_dir, fixture_name(url))
+            with open(path, "r", encoding="utf-8") as f:
+                return f.read()
+        resp = self.session.get(url, timeout=REQUEST_TIMEOUT)
+        resp.raise_for_status()
+        html = resp.text
+        if self.save_dir:
+            with open(os.path.join(self.save_dir, fixture_name(url)), "w", encoding="utf-8") as f:
+                f.write(html)
+        return html
+
+    def login(self, login_url, username, password):
+        """
+        提交登录页上包含密码框的表单 (保留其中的隐藏字段)。
+        返回是否已处于登录状态。
+        """
+        if self.fixtures_dir:
+            return True
+        resp = self.session.get(login_url, timeout=REQUEST_TIMEOUT)
+        tree = HTMLParser(resp.text)
+        password_input = tree.css_first("input[type='password']")
+        if password_input is None:
+            return True
+        if not (username and password):
+            return False
+
+        form = password_input.parent
+        while form is not None and form.tag != "form":
+            form = form.parent
+        if form is None:
+            return False
+        fields = {}
+        for el in form.css("input"):
+            name = el.attributes.get("name")
+            if not name or el.attributes.get("type") in ("submit", "button", "checkbox"):
+                continue
+            fields[name] = el.attributes.get("value") or ""
+        for el in form.css("input[type='submit']"):
+            # 部分后台依赖 submit 按钮本身的字段判断是否为提交
+            if el.attributes.get("name"):
+                fields[el.attributes["name"]] = el.attributes.get("value") or ""
+        username_input = form.css_first("input[name='username']") or form.css_first("input[type='text']")
+        if username_input is not None and username_input.attributes.get("name"):
+            fields[username_input.attributes["name"]] = username
+        fields[password_input.attributes.get("name") or "password"] = password
+
+        action = urljoin(resp.url, form.attributes.get("action") or resp.url)
+        self.session.post(action, data=fields, timeout=REQUEST_TIMEOUT)
+        check = self.session.get(login_url, timeout=REQUEST_TIMEOUT)
+        return HTMLParser(check.text).css_first("input[type='password']") is None
+
+    def close(self):
+        if self.session is not None:
+            self.session.close()
+
+
+def _page_url(url, page_num):
+    parts = urlparse(url)
+    query = parse_qs(parts.query)
+    query["page"] = [str(page_num)]
+    return urlunparse(parts._replace(query=urlencode(query, doseq=True)))
+
+
+def parse_list_page(html, page_url, page_num, list_info):
+    """
+    解析商品列表页，把同步状态 / 最近提交时间 / 商品图片写入 list_info 的三个字典。
+    返回 (本页 ID 列表, 下一页 URL 或 None)。
+    """
+    scraped_sync_status, scraped_submit_time, scraped_image_url = list_info
+    tree = HTMLParser(html)
+    ids = []
+    for row in tree.css(LIST_ROW_SELECTOR):
+        id_cell = row.css_first("td:nth-child(2)")
+        if id_cell is None:
+            continue
+        goods_id = inner_text(id_cell)
+        if not goods_id.isdigit():
+            continue
+        ids.append(goods_id)
+        status_cell = row.css_first("td:nth-child(13)")
+        if status_cell is not None:
+            # 如果是“可售卖”就是已同步，否则是未同步
+            scraped_sync_status[goods_id] = "已同步" if inner_text(status_cell) == "可售卖" else "未同步"
+        submit_cell = row.css_first("td:nth-child(10) > span:nth-child(1)")
+        if submit_cell is not None and inner_text(submit_cell):
+            scraped_submit_time[goods_id] = inner_text(submit_cell)
+        img_el = row.css_first("td:nth-child(4) > a > img")
+        if img_el is not None and img_el.attributes.get("src"):
+            scraped_image_url[goods_id] = img_el.attributes["src"]
+
+    next_btn = tree.css_first("ul.pagination > li > a[aria-label='Next']")
+    if next_btn is None:
+        for a in tree.css("ul.pagination li a"):
+            if inner_text(a) in ("下一页", "»"):
+                next_btn = a
+                break
+    if next_btn is None:
+        return ids, None
+    parent = next_btn.parent
+    if parent is not None and "disabled" in (parent.attributes.get("class") or ""):
+        return ids, None
+    href = (next_btn.attributes.get("href") or "").strip()
+    if href and not href.startswith(("javascript", "#")):
+        return ids, urljoin(page_url, href)
+    # 分页链接由脚本处理时，直接改 page 参数
+    return ids, _page_url(page_url, page_num + 1)
+
+
+def scan_list_pages(client, first_url, list_info, max_pages=0):
+    """
+    从 first_url 开始逐页扫描列表页，返回 (ID 列表, 是否扫描到最后一页)。
+    一页里没有新的 ID 时停止：分页链接由脚本处理、站点又不认 page 参数时，
+    改 page 参数翻页会一直拿到同一页。
+    """
+    ids = []
+    seen = set()
+    visited = set()
+    page_url = first_url
+    page_num = 1
+    while page_url and page_url not in visited:
+        if max_pages > 0 and page_num > max_pages:
+            print(f"已达到最大页数限制 ({max_pages})，停止扫描。")
+            return ids, False
+        visited.add(page_url)
+        print(f"正在扫描列表第 {page_num} 页...")
+        page_ids, next_url = parse_list_page(client.get(page_url), page_url, page_num, list_info)
+        if not page_ids:
+            print("未找到表格行，可能已无数据或登录失效。")
+            return ids, False
+        new_ids = [gid for gid in page_ids if gid not in seen]
+        if not new_ids:
+            print(f"  - 第 {page_num} 页没有新的ID，翻页可能未生效，停止扫描。")
+            return ids, False
+        print(f"  - 第 {page_num} 页共 {len(page_ids)} 个ID")
+        ids.extend(new_ids)
+        seen.update(new_ids)
+        page_url = next_url
+        page_num += 1
+    return ids, page_url is None
+
+
+def _is_placeholder(option):
+    return "请选择" in inner_text(option) or option.attributes.get("value") == ""
+
+
+def _selected_text(select):
+    option = select.css_first("option[selected]") or select.css_first("option")
+    txt = inner_text(option) if option is not None else ""
+    return "" if "请选择" in txt else txt
+
+
+def category_texts(tree):
+    """
+    1~3 级分类的选中项 (与浏览器模式相同，没有选中项时取第一项)。
+    上一级已选中、下一级却只有“请选择”时，下一级的选项是脚本按上一级加载的，
+    静态 HTML 里没有，抛出 CategoriesNotRendered。
+    """
+    texts = []
+    for level, selector in enumerate(CATEGORY_SELECTORS):
+        select = tree.css_first(selector)
+        if select is None:
+            texts.append("")
+            continue
+        has_options = any(not _is_placeholder(o) for o in select.css("option"))
+        if not has_options and (level == 0 or texts[-1]):
+            raise CategoriesNotRendered(f"{selector} 的选项由页面脚本加载")
+        texts.append(_selected_text(select))
+    return texts
+
+
+def parse_detail_page(html, goods_id, list_info):
+    """
+    解析商品编辑页，返回与 scrape_goods_detail 相同的 (表头列表, SKU 行)。
+    页面不含 #goodsname (未登录 / 出错页) 时抛出 ValueError，
+    分类由脚本加载时抛出 CategoriesNotRendered。
+    """
+    scraped_sync_status, scraped_submit_time, scraped_image_url = list_info
+    tree = HTMLParser(html)
+    name_input = tree.css_first("#goodsname")
+    if name_input is None:
+        raise ValueError("详情页缺少 #goodsname，可能未登录")
+
+    short_title_input = tree.css_first(SHORT_TITLE_SELECTOR)
+    cate1, cate2, cate3 = category_texts(tree)
+    base_info = {
+        "ID": goods_id,
+        "商品名称": control_value(name_input),
+        "短标题": control_value(short_title_input) if short_title_input is not None else "",
+        "是否同步支付宝": scraped_sync_status.get(goods_id, "未知"),
+        "最近提交时间": scraped_submit_time.get(goods_id, ""),
+        "商品图片": scraped_image_url.get(goods_id, ""),
+        "1级分类": cate1,
+        "2级分类": cate2,
+        "3级分类": cate3
+    }
+
+    table_node = tree.css_first("#options > table")
+    if table_node is None:
+        # 无SKU表格，仅保存基本信息
+        return [], [dict(base_info)]
+
+    table = extract_sku_table_html(table_node)
+    header_lists = [[h for h in table["headers"] or [] if h]]
+    table_headers = []
+    sku_rows = sku_table_rows(table, table_headers)
+    header_lists.append(table_headers)
+    for row_data in sku_rows:
+        row_data.update(base_info)
+    return header_lists, sku_rows
+
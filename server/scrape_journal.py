@@ -0,0 +1,215 @@
+"""
+抓取任务的运行日志 (journal)，scrape_goods.py 写入，main.py 读取。
+
+每次抓取对应 <journal_dir>/<run_id>.ndjson，只追加，每行一条记录：
+    {"type": "start", ...}                          启动参数
+    {"type": "ids", "ids": [...], "list_info": [...], "manifest": {...}}   列表扫描得到的待抓取ID
+    {"type": "goods", "id": ..., "headers": [...], "rows": [...]}         一个商品抓取完成
+    {"type": "done", ...}                           正常结束
+每条记录写入后立即 flush + fsync，进程崩溃、被 /stop-task 终止或容器重启后，
+已完成的商品都还在；--resume <run_id> 跳过已完成的商品继续抓取，
+iter_journal_rows 也可以把未完成任务的部分结果交给合并。
+"""
+import os
+import re
+import json
+import uuid
+import threading
+from datetime import datetime
+
+JOURNAL_SUFFIX = ".ndjson"
+RUN_ID_RE = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+
+def new_run_id():
+    return datetime.now().strftime("%Y%m%d-%H%M%S") + "-" + uuid.uuid4().hex[:6]
+
+
+def journal_path(journal_dir, run_id):
+    """run_id 只允许字母数字、下划线和连字符 (来自接口参数，防止路径穿越)"""
+    if not RUN_ID_RE.match(run_id or ""):
+        raise ValueError(f"Invalid run id: {run_id!r}")
+    return os.path.join(journal_dir, run_id + JOURNAL_SUFFIX)
+
+
+def _iter_records(path):
+    """逐行读取记录，跳过崩溃时写了一半的行"""
+    with open(path, "r", encoding="utf-8") as f:
+        while True:
+            offset = f.tell()
+            line = f.readline()
+            if not line:
+                return
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            yield offset, record
+
+
+def _empty_state():
+    return {
+        "start": {},
+        "ids": None,
+        "list_info": [{}, {}, {}],
+        "manifest": {},
+        "completed": {},
+        "done": False
+    }
+
+
+def read_journal(path, with_rows=True):
+    """
+    汇总日志状态。ids 为最后一条 ids 记录 (列表扫描未完成时为 None)；
+    completed 为 {ID: [表头列表, SKU 行]}，with_rows=False 时只记文件偏移。
+    同一ID出现多次时以最后一条为准。
+    """
+    state = _empty_state()
+    for offset, record in _iter_records(path):
+        kind = record.get("type")
+        if kind == "start":
+            state["start"] = record
+        elif kind == "ids":
+            state["ids"] = record.get("ids", [])
+            state["list_info"] = record.get("list_info", [{}, {}, {}])
+            state["manifest"] = record.get("manifest", {})
+        elif kind == "goods":
+            state["completed"][record["id"]] = [record["headers"], record["rows"]] if with_rows else offset
+        elif kind == "done":
+            state["done"] = True
+    return state
+
+
+def iter_journal_rows(path):
+    """
+    日志中已完成商品的 SKU 行 (与 scrape_goods_data.json 的行结构相同)，
+    按ID列表顺序输出，可直接交给合并。只在内存中保存每个ID的偏移。
+    """
+    state = read_journal(path, with_rows=False)
+    offsets = state["completed"]
+    order = [goods_id for goods_id in (state["ids"] or []) if goods_id in offsets]
+    listed = set(order)
+    order += [goods_id for goods_id in offsets if goods_id not in listed]
+    with open(path, "r", encoding="utf-8") as f:
+        for goods_id in order:
+            f.seek(offsets[goods_id])
+            for row in json.loads(f.readline())["rows"]:
+                yield row
+
+
+def run_summary(path):
+    state = read_journal(path, with_rows=False)
+    start = state["start"]
+    return {
+        "run_id": os.path.basename(path)[:-len(JOURNAL_SUFFIX)],
+        "started_at": start.get("started_at"),
+        "updated_at": datetime.fromtimestamp(os.path.getmtime(path)).isoformat(timespec="seconds"),
+        "mode": start.get("mode"),
+        "incremental": start.get("incremental", False),
+        "ids": len(state["ids"]) if state["ids"] is not None else None,
+        "completed": len(state["completed"]),
+        "done": state["done"]
+    }
+
+
+def list_runs(journal_dir):
+    """所有运行日志的摘要，最近更新的在前"""
+    if not os.path.isdir(journal_dir):
+        return []
+    paths = [os.path.join(journal_dir, name) for name in os.listdir(journal_dir) if name.endswith(JOURNAL_SUFFIX)]
+    paths.sort(key=os.path.getmtime, reverse=True)
+    return [run_summary(path) for path in paths]
+
+
+def prune_runs(journal_dir, keep):
+    """只保留最近的 keep 个运行日志"""
+    if not os.path.isdir(journal_dir):
+        return 0
+    paths = [os.path.join(journal_dir, name) for name in os.listdir(journal_dir) if name.endswith(JOURNAL_SUFFIX)]
+    paths.sort(key=os.path.getmtime, reverse=True)
+    for path in paths[keep:]:
+        os.remove(path)
+    return len(paths[keep:])
+
+
+class ScrapeJournal:
+    """追加写入的运行日志，各 worker 线程共用 (写入加锁)。"""
+
+    def __init__(self, path, state):
+        self.path = path
+        self.run_id = os.path.basename(path)[:-len(JOURNAL_SUFFIX)]
+        self.state = state
+        self._lock = threading.Lock()
+        self._file = open(path, "a", encoding="utf-8")
+
+    @classmethod
+    def create(cls, journal_dir, run_id=None):
+        os.makedirs(journal_dir, exist_ok=True)
+        path = journal_path(journal_dir, run_id or new_run_id())
+        if os.path.exists(path):
+            raise ValueError(f"Run {run_id} already exists, use --resume")
+        return cls(path, _empty_state())
+
+    @classmethod
+    def resume(cls, journal_dir, run_id):
+        path = journal_path(journal_dir, run_id)
+        if not os.path.exists(path):
+            raise ValueError(f"Run {run_id} not found in {journal_dir}")
+        with open(path, "rb+") as f:
+            # 补上崩溃时写了一半的行的换行，后续记录另起一行
+            f.seek(0, os.SEEK_END)
+            if f.tell() > 0:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    f.write(b"\n")
+        return cls(path, read_journal(path))
+
+    @property
+    def start_info(self):
+        return self.state["start"]
+
+    @property
+    def ids(self):
+        return self.state["ids"]
+
+    @property
+    def list_info(self):
+        return tuple(self.state["list_info"])
+
+    @property
+    def manifest(self):
+        return self.state["manifest"]
+
+    @property
+    def completed(self):
+        return self.state["completed"]
+
+    def _append(self, record):
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def start(self, info):
+        record = {"type": "start", "started_at": datetime.now().isoformat(timespec="seconds"), **info}
+        self.state["start"] = record
+        self._append(record)
+
+    def record_ids(self, ids, list_info, manifest=None):
+        self.state["ids"] = list(ids)
+        self.state["list_info"] = [dict(d) for d in list_info]
+        self.state["manifest"] = dict(manifest or {})
+        self._append({"type": "ids", "ids": self.state["ids"], "list_info": self.state["list_info"], "manifest": self.state["manifest"]})
+
+    def record_goods(self, goods_id, header_lists, sku_rows):
+        with self._lock:
+            self.state["completed"][goods_id] = [header_lists, sku_rows]
+        self._append({"type": "goods", "id": goods_id, "headers": header_lists, "rows": sku_rows})
+
+    def finish(self, failed_ids=()):
+        self.state["done"] = True
+        self._append({"type": "done", "finished_at": datetime.now().isoformat(timespec="seconds"), "failed": list(failed_ids)})
+
+    def close(self):
+        self._file.close()
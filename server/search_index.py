@@ -0,0 +1,262 @@
+import os
+import re
+import logging
+from typing import List, Dict, Any, Optional, Tuple
+from sqlalchemy import text
+import db
+
+# auto | fts5 | trigram | like
+SEARCH_BACKEND = os.getenv("SEARCH_BACKEND", "auto").strip().lower()
+
+SEARCH_TABLE = "goods_search"
+CHUNK_SIZE = 200
+
+# Runs of letters/digits; CJK characters count as letters
+_TOKEN_RUN_RE = re.compile(r"[^\W_]+")
+
+
+def ngram_runs(value: str) -> List[str]:
+    return _TOKEN_RUN_RE.findall((value or "").lower())
+
+def ngram_document(value: str) -> str:
+    """
+    Index form of a text for FTS5: overlapping character bigrams per run plus
+    the run's last character, space separated. Chinese product names have no
+    word boundaries, so bigrams give substring matching for any query length.
+    """
+    tokens = []
+    for run in ngram_runs(value):
+        tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+        tokens.append(run[-1])
+    return " ".join(tokens)
+
+def ngram_query(value: str) -> str:
+    # One phrase of consecutive bigrams per run; single characters become prefix queries
+    parts = []
+    for run in ngram_runs(value):
+        if len(run) == 1:
+            parts.append(f"\"{run}\"*")
+        else:
+            parts.append("\"" + " ".join(run[i:i + 2] for i in range(len(run) - 1)) + "\"")
+    return " AND ".join(parts)
+
+def _like_pattern(value: str) -> str:
+    escaped = value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escaped}%"
+
+def _in_clause(values: List[str]) -> Tuple[str, Dict[str, Any]]:
+    placeholders = ",".join([f":id_{i}" for i in range(len(values))])
+    params = {f"id_{i}": val for i, val in enumerate(values)}
+    return placeholders, params
+
+def load_documents(conn, ids: List[str]) -> Dict[str, Dict[str, str]]:
+    """Searchable text per goods ID: name, all SKU specs and the ID itself."""
+    placeholders, params = _in_clause(ids)
+    docs = {}
+    rows = conn.execute(text(f"SELECT \"ID\", \"商品名称\" FROM goods WHERE \"ID\" IN ({placeholders})"), params).fetchall()
+    for goods_id, name in rows:
+        docs[str(goods_id)] = {"name": name or "", "sku": [], "code": str(goods_id)}
+    rows = conn.execute(text(f"SELECT \"goods_id\", \"SKU\" FROM skus WHERE \"goods_id\" IN ({placeholders}) ORDER BY \"goods_id\", \"position\""), params).fetchall()
+    for goods_id, spec in rows:
+        if str(goods_id) in docs and spec:
+            docs[str(goods_id)]["sku"].append(spec)
+    for doc in docs.values():
+        doc["sku"] = "\n".join(doc["sku"])
+    return docs
+
+
+class LikeSearchBackend:
+    """Unindexed fallback, same semantics as the original LIKE filter."""
+    name = "like"
+
+    def create(self, conn):
+        pass
+
+    def is_empty(self, conn) -> bool:
+        return False
+
+    def sync(self, conn, ids: List[str]):
+        pass
+
+    def remove(self, conn, ids: List[str]):
+        pass
+
+    def filter_sql(self, query: str) -> Tuple[str, Dict[str, Any]]:
+        clause = "(g.\"商品名称\" LIKE :search OR g.\"ID\" LIKE :search OR EXISTS (SELECT 1 FROM skus s WHERE s.\"goods_id\" = g.\"ID\" AND s.\"SKU\" LIKE :search))"
+        return clause, {"search": f"%{query}%"}
+
+    def search_ids(self, conn, query: str, limit: int) -> List[str]:
+        clause, params = self.filter_sql(query)
+        rows = conn.execute(text(f"SELECT g.\"ID\" FROM goods g WHERE {clause} ORDER BY g.\"ID\" LIMIT :limit"), {**params, "limit": limit}).fetchall()
+        return [str(row[0]) for row in rows]
+
+
+class Fts5SearchBackend(LikeSearchBackend):
+    """SQLite FTS5 over pre-tokenized bigram documents, ranked by bm25."""
+    name = "fts5"
+
+    def create(self, conn):
+        # gid holds one hex token per goods ID so rows can be found (and deleted) through the index
+        conn.execute(text(f"""
+            CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5(
+                goods_id UNINDEXED, gid, name, sku, code,
+                tokenize = 'unicode61 remove_diacritics 2',
+                prefix = '1'
+            )
+        """))
+
+    def is_empty(self, conn) -> bool:
+        return conn.execute(text(f"SELECT 1 FROM {SEARCH_TABLE} LIMIT 1")).fetchone() is None
+
+    @staticmethod
+    def _gid(goods_id: str) -> str:
+        return "g" + goods_id.encode("utf-8").hex()
+
+    def remove(self, conn, ids: List[str]):
+        for start in range(0, len(ids), CHUNK_SIZE):
+            chunk = ids[start:start + CHUNK_SIZE]
+            match = "gid : (" + " OR ".join(self._gid(i) for i in chunk) + ")"
+            conn.execute(text(f"DELETE FROM {SEARCH_TABLE} WHERE rowid IN (SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH :match)"), {"match": match})
+
+    def sync(self, conn, ids: List[str]):
+        for start in range(0, len(ids), CHUNK_SIZE):
+            chunk = ids[start:start + CHUNK_SIZE]
+            self.remove(conn, chunk)
+            docs = load_documents(conn, chunk)
+            if not docs:
+                continue
+            conn.execute(
+                text(f"INSERT INTO {SEARCH_TABLE} (goods_id, gid, name, sku, code) VALUES (:goods_id, :gid, :name, :sku, :code)"),
+                [
+                    {
+                        "goods_id": goods_id,
+                        "gid": self._gid(goods_id),
+                        "name": ngram_document(doc["name"]),
+                        "sku": ngram_document(doc["sku"]),
+                        "code": ngram_document(doc["code"])
+                    }
+                    for goods_id, doc in docs.items()
+                ]
+            )
+
+    def _match(self, query: str) -> Optional[str]:
+        expr = ngram_query(query)
+        return f"{{name sku code}} : ({expr})" if expr else None
+
+    def filter_sql(self, query: str) -> Tuple[str, Dict[str, Any]]:
+        match = self._match(query)
+        if not match:
+            return super().filter_sql(query)
+        return f"g.\"ID\" IN (SELECT goods_id FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH :search_match)", {"search_match": match}
+
+    def search_ids(self, conn, query: str, limit: int) -> List[str]:
+        match = self._match(query)
+        if not match:
+            return super().search_ids(conn, query, limit)
+        rows = conn.execute(
+            text(f"SELECT goods_id FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH :match ORDER BY bm25({SEARCH_TABLE}, 0, 0, 10.0, 2.0, 5.0) LIMIT :limit"),
+            {"match": match, "limit": limit}
+        ).fetchall()
+        return [str(row[0]) for row in rows]
+
+
+class TrigramSearchBackend(LikeSearchBackend):
+    """Postgres pg_trgm: a GIN trigram index serves LIKE '%x%' over one lower-cased document per goods."""
+    name = "trigram"
+
+    def create(self, conn):
+        conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+        conn.execute(text(f"""
+            CREATE TABLE IF NOT EXISTS {SEARCH_TABLE} (
+                goods_id TEXT PRIMARY KEY REFERENCES goods ("ID") ON DELETE CASCADE,
+                doc TEXT NOT NULL
+            )
+        """))
+        conn.execute(text(f"CREATE INDEX IF NOT EXISTS idx_{SEARCH_TABLE}_doc_trgm ON {SEARCH_TABLE} USING gin (doc gin_trgm_ops)"))
+
+    def is_empty(self, conn) -> bool:
+        return conn.execute(text(f"SELECT 1 FROM {SEARCH_TABLE} LIMIT 1")).fetchone() is None
+
+    def remove(self, conn, ids: List[str]):
+        for start in range(0, len(ids), CHUNK_SIZE):
+            placeholders, params = _in_clause(ids[start:start + CHUNK_SIZE])
+            conn.execute(text(f"DELETE FROM {SEARCH_TABLE} WHERE goods_id IN ({placeholders})"), params)
+
+    def sync(self, conn, ids: List[str]):
+        for start in range(0, len(ids), CHUNK_SIZE):
+            chunk = ids[start:start + CHUNK_SIZE]
+            self.remove(conn, chunk)
+            docs = load_documents(conn, chunk)
+            if not docs:
+                continue
+            conn.execute(
+                text(f"INSERT INTO {SEARCH_TABLE} (goods_id, doc) VALUES (:goods_id, :doc)"),
+                [
+                    {"goods_id": goods_id, "doc": "\n".join([doc["name"], doc["sku"], doc["code"]]).lower()}
+                    for goods_id, doc in docs.items()
+                ]
+            )
+
+    def filter_sql(self, query: str) -> Tuple[str, Dict[str, Any]]:
+        return f"g.\"ID\" IN (SELECT goods_id FROM {SEARCH_TABLE} WHERE doc LIKE :search_like)", {"search_like": _like_pattern(query.lower())}
+
+    def search_ids(self, conn, query: str, limit: int) -> List[str]:
+        rows = conn.execute(
+            text(f"SELECT goods_id FROM {SEARCH_TABLE} WHERE doc LIKE :search_like ORDER BY word_similarity(:search_raw, doc) DESC, goods_id LIMIT :limit"),
+            {"search_like": _like_pattern(query.lower()), "search_raw": query.lower(), "limit": limit}
+        ).fetchall()
+        return [str(row[0]) for row in rows]
+
+
+BACKENDS = {
+    "like": LikeSearchBackend,
+    "fts5": Fts5SearchBackend,
+    "trigram": TrigramSearchBackend,
+}
+
+# LIKE until init_search_index has picked and verified a backend
+backend = LikeSearchBackend()
+
+def _candidates() -> List[str]:
+    if SEARCH_BACKEND in BACKENDS:
+        return [SEARCH_BACKEND, "like"]
+    return ["trigram", "like"] if db.is_postgres() else ["fts5", "like"]
+
+def init_search_index():
+    """Create the search index for the configured backend and backfill it when empty."""
+    global backend
+    for name in _candidates():
+        candidate = BACKENDS[name]()
+        try:
+            with db.get_connection() as conn:
+                candidate.create(conn)
+                conn.commit()
+            db.schema.invalidate()
+        except Exception as e:
+            logging.warning(f"Search backend {name} unavailable: {e}")
+            continue
+        backend = candidate
+        break
+    logging.info(f"Search backend: {backend.name}")
+
+    with db.get_connection() as conn:
+        if not backend.is_empty(conn):
+            return
+        ids = [str(row[0]) for row in conn.execute(text("SELECT \"ID\" FROM goods")).fetchall()]
+        if ids:
+            logging.info(f"Building search index for {len(ids)} goods...")
+            backend.sync(conn, ids)
+            conn.commit()
+
+def sync_goods(conn, ids: List[str]):
+    # Re-index the given goods IDs inside the caller's transaction
+    backend.sync(conn, ids)
+
+def remove_goods(conn, ids: List[str]):
+    backend.remove(conn, ids)
+
+def filter_sql(query: str) -> Tuple[str, Dict[str, Any]]:
+    return backend.filter_sql(query)
+
+def search_ids(conn, query: str, limit: int = 50) -> List[str]:
+    return backend.search_ids(conn, query, limit)
@@ -0,0 +1,33 @@
+import json
+import decimal
+from typing import Any
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _default(value: Any):
+    # NUMERIC columns come back as Decimal on Postgres
+    if isinstance(value, decimal.Decimal):
+        return float(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+def dumps(content: Any) -> bytes:
+    """Compact UTF-8 JSON (non-ASCII kept as-is), via orjson when it is installed."""
+    if orjson is not None:
+        return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":"), default=_default).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    JSONResponse rendered with dumps. Set as the app's default response class;
+    the large endpoints also return it directly so FastAPI's jsonable_encoder
+    pass over the payload is skipped.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
@@ -0,0 +1,188 @@
+"""
+SKU 表格 (#options table) 的解析，scrape_goods.py、scrape_http.py 与 update_goods.py 共用。
+
+整张表在页面内通过一次 evaluate 提取：rowspan/colspan 网格展开、
+数据列/规格列的区分都在浏览器里完成，只返回一个紧凑的 JSON 结构，
+避免逐个单元格调用 get_attribute / query_selector / input_value 产生的大量 IPC 往返。
+HTTP 模式下由 extract_sku_table_html 对静态 HTML 生成同样的结构。
+"""
+
+# 列名包含这些关键字即视为数据列 (其他列若单元格内有 input/select 也算数据列)
+DATA_COLUMN_KEYWORDS = ["库存", "编号", "租金", "价格", "重量", "编码", "id"]
+
+# 数据单元格里可编辑的控件，顺序与 CONTROL_SELECTOR 的 query_selector_all 结果一致
+CONTROL_SELECTOR = "tbody input:not([type='hidden']), tbody select"
+
+# 返回结构:
+#   headers:   表头文本 (没有 thead 时为 null)
+#   data_cols / spec_cols: 数据列 / 规格列的列号
+#   rows:      每个 tr 一行，按列号展开后的单元格 [值, 控件序号] (控件序号 -1 表示纯文本)，空位为 null
+SKU_TABLE_JS = """
+(table, args) => {
+    const [keywords, controlSelector] = args;
+    const thead = table.querySelector("thead");
+    const headers = thead ? Array.from(thead.querySelectorAll("th"), th => th.innerText.trim()) : null;
+    const tbody = table.querySelector("tbody");
+    if (!tbody) return {headers, data_cols: [], spec_cols: [], rows: []};
+
+    const controlIndex = new Map();
+    Array.from(table.querySelectorAll(controlSelector)).forEach((el, i) => controlIndex.set(el, i));
+    const span = (td, name) => {
+        const n = parseInt(td.getAttribute(name), 10);
+        return Number.isNaN(n) ? 1 : n;
+    };
+
+    const trs = Array.from(tbody.querySelectorAll("tr"));
+    const grid = trs.map(() => []);
+    trs.forEach((tr, r) => {
+        let c = 0;
+        for (const td of tr.querySelectorAll("td")) {
+            while (grid[r][c] !== undefined) c++;
+            const rowspan = span(td, "rowspan");
+            const colspan = span(td, "colspan");
+            const control = td.querySelector("input:not([type='hidden'])") || td.querySelector("select");
+            const cell = control
+                ? [control.value, controlIndex.has(control) ? controlIndex.get(control) : -1, true]
+                : [td.innerText.trim(), -1, false];
+            for (let dr = 0; dr < rowspan && r + dr < grid.length; dr++) {
+                for (let dc = 0; dc < colspan; dc++) grid[r + dr][c + dc] = cell;
+            }
+            c += colspan;
+        }
+    });
+
+    const dataCols = [];
+    const specCols = [];
+    (headers || []).forEach((h, idx) => {
+        const lower = h.toLowerCase();
+        const isData = keywords.some(k => lower.includes(k)) || grid.some(row => row[idx] && row[idx][2]);
+        (isData ? dataCols : specCols).push(idx);
+    });
+    const rows = grid.map(row => Array.from(row, cell => cell ? [cell[0], cell[1]] : null));
+    return {headers, data_cols: dataCols, spec_cols: specCols, rows};
+}
+"""
+
+
+def update_master_headers(master_headers, current_headers):
+    """
+    合并新表头到主表头列表，保持相对顺序。
+    """
+    last_index = -1
+    for header in current_headers:
+        if header in master_headers:
+            last_index = master_headers.index(header)
+        else:
+            # 插入到上一个已知列的后面
+            insert_pos = last_index + 1
+            master_headers.insert(insert_pos, header)
+            last_index = insert_pos
+
+
+def extract_sku_table(sku_table):
+    """一次 evaluate 取回整张 SKU 表 (结构见 SKU_TABLE_JS)"""
+    return sku_table.evaluate(SKU_TABLE_JS, [DATA_COLUMN_KEYWORDS, CONTROL_SELECTOR])
+
+
+def iter_sku_table_rows(table):
+    """
+    按行生成 (SKU 字符串, {数据列名: [值, 控件序号]})。
+    SKU 格式: "表头：值|表头：值"，只取有值的规格列。
+    """
+    headers = table["headers"] or []
+    for row in table["rows"]:
+        specs = []
+        for c in table["spec_cols"]:
+            cell = row[c] if c < len(row) else None
+            if cell and cell[0]:
+                header_name = headers[c] if c < len(headers) else ""
+                specs.append(f"{header_name}：{cell[0]}" if header_name else cell[0])
+
+        data = {}
+        for c in table["data_cols"]:
+            cell = row[c] if c < len(row) else None
+            if cell:
+                header_name = headers[c] if c < len(headers) else f"Col_{c}"
+                data[header_name] = cell
+        yield "|".join(specs), data
+
+
+def inner_text(node):
+    """静态 HTML 节点的文本，空白折叠为单个空格 (近似浏览器的 innerText)"""
+    return " ".join(node.text(deep=True, separator=" ").split())
+
+
+def control_value(control):
+    """input/select 的当前值 (select 取选中项，没有选中项时取第一项，同浏览器)"""
+    if control.tag != "select":
+        return control.attributes.get("value") or ""
+    option = control.css_first("option[selected]") or control.css_first("option")
+    if option is None:
+        return ""
+    value = option.attributes.get("value")
+    return value if value is not None else inner_text(option)
+
+
+def extract_sku_table_html(table):
+    """
+    与 SKU_TABLE_JS 相同的结构，输入为 selectolax 的 table 节点。
+    静态 HTML 没有可编辑的句柄，控件序号仅用于区分数据单元格。
+    """
+    thead = table.css_first("thead")
+    headers = [inner_text(th) for th in thead.css("th")] if thead is not None else None
+    tbody = table.css_first("tbody")
+    if tbody is None:
+        return {"headers": headers, "data_cols": [], "spec_cols": [], "rows": []}
+
+    def span(td, name):
+        try:
+            return int(td.attributes.get(name) or 1)
+        except ValueError:
+            return 1
+
+    trs = tbody.css("tr")
+    grid = [{} for _ in trs]
+    control_count = 0
+    for r, tr in enumerate(trs):
+        c = 0
+        for td in tr.css("td"):
+            while c in grid[r]:
+                c += 1
+            rowspan = span(td, "rowspan")
+            colspan = span(td, "colspan")
+            control = td.css_first("input:not([type='hidden'])") or td.css_first("select")
+            if control is not None:
+                cell = [control_value(control), control_count, True]
+                control_count += 1
+            else:
+                cell = [inner_text(td), -1, False]
+            for dr in range(rowspan):
+                if r + dr >= len(grid):
+                    break
+                for dc in range(colspan):
+                    grid[r + dr][c + dc] = cell
+            c += colspan
+
+    data_cols = []
+    spec_cols = []
+    for idx, h in enumerate(headers or []):
+        h_lower = h.lower()
+        is_data = any(k in h_lower for k in DATA_COLUMN_KEYWORDS) or any(idx in row and row[idx][2] for row in grid)
+        (data_cols if is_data else spec_cols).append(idx)
+    width = [max(row) + 1 if row else 0 for row in grid]
+    rows = [[row[c][:2] if c in row else None for c in range(w)] for row, w in zip(grid, width)]
+    return {"headers": headers, "data_cols": data_cols, "spec_cols": spec_cols, "rows": rows}
+
+
+def sku_table_rows(table, master_headers):
+    """由 extract_sku_table / extract_sku_table_html 的结构生成 SKU 行，并更新主表头"""
+    if not table or table["headers"] is None:
+        return []
+    update_master_headers(master_headers, table["headers"])
+    rows = []
+    for sku, data in iter_sku_table_rows(table):
+        row_data = {"SKU": sku}
+        for header_name, (value, _) in data.items():
+            row_data[header_name] = value
+        rows.append(row_data)
+    return rows
@@ -0,0 +1,27 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# db reads DATABASE_URL at import: point it at a scratch SQLite file before any test imports it
+_DB_DIR = tempfile.mkdtemp(prefix="goods-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_DB_DIR, 'goods.db')}"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def catalog_db():
+    """An empty catalog schema; yields the db module."""
+    from sqlalchemy import text
+    import db
+    import search_index
+
+    with db.get_connection() as conn:
+        for table in db.schema.table_names(conn):
+            conn.execute(text(f'DROP TABLE IF EXISTS "{table}"'))
+        conn.commit()
+    db.schema.invalidate()
+    db.init_tables()
+    search_index.init_search_index()
+    yield db
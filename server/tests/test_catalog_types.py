@@ -0,0 +1,62 @@
+import logging
+
+from sqlalchemy import text
+
+import catalog
+
+
+def merge(db, rows):
+    with db.get_connection() as conn:
+        stats = catalog.merge_goods_rows(conn, rows)
+        conn.commit()
+    return stats
+
+
+def sku_row(goods_id, code, **extra):
+    return {"ID": goods_id, "商品名称": "测试商品", "SKU": "颜色：红", "编号": code, "库存": "1", "1天租金": "5", **extra}
+
+
+def stored(db, column, code):
+    with db.get_connection() as conn:
+        return conn.execute(text(f'SELECT "{column}" FROM skus WHERE "编号" = :code'), {"code": code}).scalar()
+
+
+def test_money_column_is_inferred_numeric(catalog_db):
+    merge(catalog_db, [sku_row("1", "A1", 运费="10")])
+    assert catalog_db.column_affinity(catalog_db.schema.column_types("skus")["运费"]) == "NUMERIC"
+    assert float(stored(catalog_db, "运费", "A1")) == 10
+
+
+def test_unparseable_value_widens_numeric_column_to_text(catalog_db):
+    merge(catalog_db, [sku_row("1", "A1", 运费="10")])
+    merge(catalog_db, [sku_row("1", "A1", 运费="10"), sku_row("2", "B1", 运费="包邮")])
+
+    assert stored(catalog_db, "运费", "B1") == "包邮"
+    # Values stored before the widening keep their money rendering
+    assert stored(catalog_db, "运费", "A1") in ("10", "10.00")
+    assert catalog_db.schema.column_types("skus")["运费"] == "TEXT"
+    with catalog_db.get_connection() as conn:
+        versions = conn.execute(text('SELECT "columns" FROM schema_versions WHERE table_name = \'skus\' ORDER BY version')).scalars().all()
+        flat = {row["编号"]: row for row in catalog.fetch_flat_rows(conn)}
+    assert versions[-1] == "运费 TEXT"
+    assert flat["B1"]["运费"] == "包邮"
+    assert flat["A1"]["运费"] in ("10", "10.00")
+
+
+def test_widening_within_one_merge_keeps_earlier_batches(catalog_db):
+    with catalog_db.get_connection() as conn:
+        catalog.create_staging_tables(conn)
+        catalog.stage_goods_rows(conn, [sku_row("1", "A1", 运费="12.5")], seq=0)
+        catalog.stage_goods_rows(conn, [sku_row("2", "B1", 运费="包邮")], seq=1)
+        catalog.publish_staging(conn)
+        catalog.drop_staging_tables(conn)
+        conn.commit()
+    assert stored(catalog_db, "运费", "A1") == "12.50"
+    assert stored(catalog_db, "运费", "B1") == "包邮"
+
+
+def test_unparseable_fixed_price_is_logged(catalog_db, caplog):
+    with caplog.at_level(logging.WARNING):
+        merge(catalog_db, [sku_row("1", "A1", 市场价="面议")])
+    assert stored(catalog_db, "市场价", "A1") is None
+    assert "市场价" in caplog.text
@@ -0,0 +1,60 @@
+from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse, Response
+from fastapi.testclient import TestClient
+
+from compression import CompressionMiddleware
+
+app = FastAPI()
+app.add_middleware(CompressionMiddleware, minimum_size=100)
+
+
+@app.get("/small")
+def small():
+    return {"ok": True}
+
+
+@app.get("/large")
+def large():
+    return Response(b"x" * 1000, media_type="application/json", headers={"Vary": "Origin"})
+
+
+@app.get("/binary")
+def binary():
+    return Response(b"\0" * 1000, media_type="application/octet-stream")
+
+
+@app.get("/text")
+def plain():
+    return PlainTextResponse("y" * 1000, headers={"Vary": "accept-encoding"})
+
+
+client = TestClient(app)
+
+
+def test_compressed_response_varies_on_accept_encoding():
+    res = client.get("/large", headers={"Accept-Encoding": "gzip"})
+    assert res.headers["content-encoding"] == "gzip"
+    assert res.headers["vary"] == "Origin, Accept-Encoding"
+
+
+def test_uncompressed_responses_still_vary_on_accept_encoding():
+    # Small body, and no Accept-Encoding at all: sent as-is but still a per-coding variant
+    small = client.get("/small", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in small.headers
+    assert small.headers["vary"] == "Accept-Encoding"
+
+    identity = client.get("/large", headers={"Accept-Encoding": ""})
+    assert "content-encoding" not in identity.headers
+    assert identity.headers["vary"] == "Origin, Accept-Encoding"
+
+
+def test_vary_is_not_duplicated():
+    res = client.get("/text", headers={"Accept-Encoding": "gzip"})
+    assert res.headers["content-encoding"] == "gzip"
+    assert res.headers["vary"] == "accept-encoding"
+
+
+def test_incompressible_types_do_not_vary():
+    res = client.get("/binary", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in res.headers
+    assert "vary" not in res.headers
@@ -0,0 +1,38 @@
+from fastapi.testclient import TestClient
+
+import cache
+import catalog
+
+
+def test_write_outside_the_app_changes_the_catalog_etag(catalog_db):
+    import main
+
+    with catalog_db.get_connection() as conn:
+        catalog.merge_goods_rows(conn, [{"ID": "1", "商品名称": "旧名称", "SKU": "颜色：红", "编号": "A1", "1天租金": "5"}])
+        conn.commit()
+
+    with TestClient(main.app) as client:
+        first = client.get("/goods")
+        tag = first.headers["etag"]
+        assert client.get("/goods", headers={"If-None-Match": tag}).status_code == 304
+
+        # Another worker / process writing the catalog: nothing in this process's memory changes
+        with catalog_db.get_connection() as conn:
+            catalog.update_goods_fields(conn, "1", {"商品名称": "新名称"})
+            conn.commit()
+
+        second = client.get("/goods", headers={"If-None-Match": tag})
+        assert second.status_code == 200
+        assert second.headers["etag"] != tag
+        assert second.json()["data"][0]["商品名称"] == "新名称"
+
+
+def test_rolled_back_write_keeps_the_version(catalog_db):
+    with catalog_db.get_connection() as conn:
+        before = cache.read_version(conn, cache.CATALOG_VERSION)
+        cache.bump_version(conn, cache.CATALOG_VERSION)
+        conn.rollback()
+        assert cache.read_version(conn, cache.CATALOG_VERSION) == before
+        cache.bump_version(conn, cache.CATALOG_VERSION)
+        conn.commit()
+        assert cache.read_version(conn, cache.CATALOG_VERSION) != before
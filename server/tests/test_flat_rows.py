@@ -0,0 +1,36 @@
+import catalog
+
+
+def _seed(catalog_db):
+    rows = []
+    for i in range(1, 6):
+        rows.append({"ID": str(i), "商品名称": f"商品{i}", "SKU": "颜色：红", "编号": f"A{i}", "1天租金": str(i)})
+        rows.append({"ID": str(i), "商品名称": f"商品{i}", "SKU": "颜色：蓝", "编号": f"B{i}", "1天租金": str(10 + i)})
+    # Only the last goods has a 30-day rent; its column must still be on every row
+    rows[-1]["30天租金"] = "99"
+    with catalog_db.get_connection() as conn:
+        catalog.merge_goods_rows(conn, rows)
+        conn.commit()
+
+
+def test_batches_keep_order_and_rents(catalog_db):
+    _seed(catalog_db)
+    with catalog_db.get_connection() as conn:
+        whole = list(catalog.iter_flat_rows(conn))
+        batched = list(catalog.iter_flat_rows(conn, batch_size=2))
+        newest_first = list(catalog.iter_flat_rows(conn, desc=True, batch_size=2))
+
+    assert batched == whole
+    assert [r["编号"] for r in batched] == ["A1", "B1", "A2", "B2", "A3", "B3", "A4", "B4", "A5", "B5"]
+    assert [r["1天租金"] for r in batched[:2]] == ["1.00", "11.00"]
+    assert all("30天租金" in r for r in batched)
+    assert batched[-1]["30天租金"] == "99.00"
+    assert batched[0]["30天租金"] == ""
+    assert [r["ID"] for r in newest_first[::2]] == ["5", "4", "3", "2", "1"]
+
+
+def test_filter_applies_to_every_batch(catalog_db):
+    _seed(catalog_db)
+    with catalog_db.get_connection() as conn:
+        rows = list(catalog.iter_flat_rows(conn, " WHERE g.\"ID\" <> :skip", {"skip": "3"}, batch_size=1))
+    assert [r["ID"] for r in rows[::2]] == ["1", "2", "4", "5"]
@@ -0,0 +1,34 @@
+import json
+
+from fastapi.testclient import TestClient
+
+import catalog
+
+
+def _stream(client, **params):
+    res = client.get("/goods/stream", params=params)
+    assert res.status_code == 200
+    return [json.loads(line) for line in res.text.splitlines() if line.strip()]
+
+
+def test_stream_only_the_requested_ids(catalog_db):
+    import main
+
+    rows = [
+        {"ID": str(i), "商品名称": f"商品{i}", "SKU": "颜色：红", "编号": f"A{i}", "1天租金": "5"}
+        for i in range(1, 6)
+    ]
+    with catalog_db.get_connection() as conn:
+        catalog.merge_goods_rows(conn, rows)
+        conn.commit()
+
+    with TestClient(main.app) as client:
+        groups = _stream(client, ids="4,2,4,missing")
+        assert [g["ID"] for g in groups] == ["2", "4"]
+        assert [sku["编号"] for g in groups for sku in g["skus"]] == ["A2", "A4"]
+
+        assert _stream(client, ids="") == []
+        assert len(_stream(client)) == 5
+
+        too_many = ",".join(str(i) for i in range(main.MAX_STREAM_IDS + 1))
+        assert client.get("/goods/stream", params={"ids": too_many}).status_code == 400
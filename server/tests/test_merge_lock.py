@@ -0,0 +1,23 @@
+import threading
+
+import pytest
+from fastapi import HTTPException
+
+import catalog
+
+
+def test_merge_waits_for_the_running_merge(catalog_db):
+    import main
+
+    rows = [{"ID": "1", "商品名称": "商品", "SKU": "颜色：红", "编号": "A1", "1天租金": "5"}]
+    done = threading.Event()
+    with catalog.MERGE_LOCK:
+        worker = threading.Thread(target=lambda: (main.merge_scraped_rows(iter(rows)), done.set()))
+        worker.start()
+        # Held by "another merge": the post-scrape merge queues instead of dropping its staging tables
+        assert not done.wait(0.3)
+        with pytest.raises(HTTPException) as refused:
+            main.merge_scraped_rows(iter(rows), wait=False)
+        assert refused.value.status_code == 409
+    worker.join(5)
+    assert done.is_set()
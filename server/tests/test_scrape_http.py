@@ -0,0 +1,145 @@
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import parse_qs
+
+import pytest
+
+import scrape_http
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "http")
+LIST_URL = "https://shop.example.com/web/index.php?c=site&a=entry&m=ewei_shopv2&do=web&r=goods"
+
+
+def read_fixture(name):
+    with open(os.path.join(FIXTURES, name), "r", encoding="utf-8") as f:
+        return f.read()
+
+
+def test_parse_list_page():
+    list_info = ({}, {}, {})
+    ids, next_url = scrape_http.parse_list_page(read_fixture("list_1.html"), LIST_URL, 1, list_info)
+    assert ids == ["101", "102"]
+    assert next_url == "https://shop.example.com/web/index.php?c=site&a=entry&m=ewei_shopv2&do=web&r=goods&page=2"
+    sync_status, submit_time, image_url = list_info
+    assert sync_status == {"101": "已同步", "102": "未同步"}
+    assert submit_time == {"101": "2026-01-01 10:00", "102": "2026-01-02 11:30"}
+    assert image_url["101"] == "https://img.example.com/goods/101.jpg"
+
+
+def test_parse_list_page_last_page():
+    ids, next_url = scrape_http.parse_list_page(read_fixture("list_2.html"), LIST_URL + "&page=2", 2, ({}, {}, {}))
+    assert ids == ["103"]
+    assert next_url is None
+
+
+def test_scan_list_pages_follows_pagination():
+    client = scrape_http.HttpSession(fixtures_dir=FIXTURES)
+    ids, scan_complete = scrape_http.scan_list_pages(client, LIST_URL, ({}, {}, {}))
+    assert ids == ["101", "102", "103"]
+    assert scan_complete
+
+
+def test_scan_list_pages_stops_when_page_param_is_ignored():
+    # Script-driven pagination and a site that serves page 1 for every page=N:
+    # the scan stops at the first page without new IDs instead of running to MAX_PAGES
+    client = scrape_http.HttpSession(fixtures_dir=os.path.join(FIXTURES, "ignores_page"))
+    ids, scan_complete = scrape_http.scan_list_pages(client, LIST_URL, ({}, {}, {}))
+    assert ids == ["101"]
+    assert not scan_complete
+
+
+def test_parse_detail_page():
+    list_info = ({"101": "已同步"}, {"101": "2026-01-01 10:00"}, {"101": "https://img.example.com/goods/101.jpg"})
+    header_lists, rows = scrape_http.parse_detail_page(read_fixture("edit_101.html"), "101", list_info)
+    assert header_lists[0] == ["颜色", "容量", "库存", "编号", "1天租金", "7天租金", "市场价"]
+    assert [row["SKU"] for row in rows] == ["颜色：黑色|容量：128G", "颜色：黑色|容量：256G", "颜色：白色|容量：128G"]
+    first = rows[0]
+    assert first["编号"] == "SKU-101-1"
+    assert first["库存"] == "5"
+    assert first["1天租金"] == "12.50"
+    assert first["7天租金"] == "70"
+    assert first["商品名称"] == "示例手机 15 128G"
+    assert first["短标题"] == "示例手机"
+    assert (first["1级分类"], first["2级分类"], first["3级分类"]) == ("数码", "手机", "苹果手机")
+    assert first["是否同步支付宝"] == "已同步"
+    assert first["商品图片"] == "https://img.example.com/goods/101.jpg"
+
+
+def test_parse_detail_page_without_sku_table():
+    header_lists, rows = scrape_http.parse_detail_page(read_fixture("edit_102.html"), "102", ({}, {}, {}))
+    assert header_lists == []
+    assert len(rows) == 1
+    assert rows[0]["商品名称"] == "示例平板 11"
+    assert (rows[0]["1级分类"], rows[0]["2级分类"], rows[0]["3级分类"]) == ("数码", "平板", "平板电脑")
+    assert rows[0]["是否同步支付宝"] == "未知"
+
+
+def test_parse_detail_page_script_loaded_categories():
+    # 2/3 级分类只有“请选择”：选项要等页面脚本加载，交给浏览器模式
+    with pytest.raises(scrape_http.CategoriesNotRendered):
+        scrape_http.parse_detail_page(read_fixture("edit_103.html"), "103", ({}, {}, {}))
+
+
+def test_parse_detail_page_requires_login():
+    with pytest.raises(ValueError):
+        scrape_http.parse_detail_page(read_fixture("list_1.html"), "101", ({}, {}, {}))
+
+
+LOGIN_FORM = """<html><body><form action="/login?r=submit" method="post">
+<input type="hidden" name="token" value="t0k">
+<input type="text" name="username"><input type="password" name="pwd">
+<input type="checkbox" name="remember" value="1">
+<input type="submit" name="submit" value="登录">
+</form></body></html>"""
+
+
+class LoginHandler(BaseHTTPRequestHandler):
+    def _send(self, body, cookie=None):
+        data = body.encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        if cookie:
+            self.send_header("Set-Cookie", cookie)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        logged_in = "session=ok" in (self.headers.get("Cookie") or "")
+        self._send("<html><body>商品管理</body></html>" if logged_in else LOGIN_FORM)
+
+    def do_POST(self):
+        fields = parse_qs(self.rfile.read(int(self.headers["Content-Length"])).decode("utf-8"))
+        valid = (fields.get("username") == ["user"] and fields.get("pwd") == ["secret"]
+                 and fields.get("token") == ["t0k"] and "submit" in fields and "remember" not in fields)
+        self._send("ok", "session=ok; Path=/" if valid else None)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def login_server():
+    server = HTTPServer(("127.0.0.1", 0), LoginHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}/login"
+    server.shutdown()
+    server.server_close()
+
+
+def test_login_submits_the_password_form(login_server):
+    client = scrape_http.HttpSession()
+    try:
+        assert client.login(login_server, "user", "secret")
+    finally:
+        client.close()
+
+
+def test_login_with_wrong_password(login_server):
+    client = scrape_http.HttpSession()
+    try:
+        assert not client.login(login_server, "user", "wrong")
+    finally:
+        client.close()
@@ -3,6 +3,8 @@ import time
 import pandas as pd
 from playwright.sync_api import sync_playwright, TimeoutError
 import datetime
+from resource_filter import ResourceFilter, UPDATER_BLOCKED_TYPES
+from sku_table import CONTROL_SELECTOR, extract_sku_table, iter_sku_table_rows
 
 import sys
 
@@ -11,6 +13,8 @@ PASSWORD = os.getenv("GOODS_PASSWORD", "Test0528.")
 LOGIN_URL = os.getenv("GOODS_LOGIN_URL", "https://szguokuai.zlj.xyzulin.top/web/index.php?c=site&a=entry&m=ewei_shopv2&do=web&r=goods")
 DATA_FILE = sys.argv[1] if len(sys.argv) > 1 else os.getenv("GOODS_UPDATE_DATA_FILE", "update_goods_data.json")
 HEADLESS = os.getenv("GOODS_HEADLESS", "true").lower() == "true"
+# 需要点击与 is_visible 判断，保留样式表与第三方脚本，只拦截图片/字体与统计域名
+RESOURCE_FILTER = ResourceFilter(LOGIN_URL, UPDATER_BLOCKED_TYPES)
 
 def log_update(message):
     """记录更新日志"""
@@ -447,9 +451,11 @@ def get_page_sku_map(page):
     解析当前页面的 SKU 表格，返回一个映射字典：
     Key: SKU 字符串 (格式: "表头：值|表头：值")
     Value: { 
-        "element_row_index": int, 
+        "row_idx": int, 
         "data_inputs": { "列名": InputElementHandle, ... } 
     }
+    表格结构由 sku_table.extract_sku_table 一次 evaluate 取回，
+    输入框句柄再通过一次 query_selector_all 按序号对应。
     """
     sku_map = {}
     
@@ -458,128 +464,21 @@ def get_page_sku_map(page):
         return sku_map
         
     try:
-        # 1. 获取表头
-        headers = []
-        thead = sku_table.query_selector("thead")
-        if thead:
-            ths = thead.query_selector_all("th")
-            for th in ths:
-                headers.append(th.inner_text().strip())
-        
-        # 2. 构建网格 (处理 rowspan/colspan)
-        # 这里我们需要复用 scrape_goods.py 中的逻辑，但这次我们需要保存 ElementHandle 而不仅仅是值
-        tbody = sku_table.query_selector("tbody")
-        if not tbody: return sku_map
-        
-        tr_elements = tbody.query_selector_all("tr")
-        
-        grid = {} # row_idx -> col_idx -> { "value": str, "element": handle, "is_data": bool }
-        
-        current_row_idx = 0
-        for tr in tr_elements:
-            tds = tr.query_selector_all("td")
-            current_col_idx = 0
-            
-            if current_row_idx not in grid: grid[current_row_idx] = {}
-                
-            for td in tds:
-                # 跳过占用
-                while current_col_idx in grid[current_row_idx]:
-                    current_col_idx += 1
-                
-                # 获取 rowspan/colspan
-                rowspan = 1
-                colspan = 1
-                try:
-                    rs = td.get_attribute("rowspan")
-                    if rs: rowspan = int(rs)
-                except: pass
-                try:
-                    cs = td.get_attribute("colspan")
-                    if cs: colspan = int(cs)
-                except: pass
-                
-                # 提取值和输入框元素
-                val = ""
-                input_el = td.query_selector("input:not([type='hidden'])")
-                is_data = False
-                
-                if input_el:
-                    val = input_el.input_value() # 初始值用于调试，实际修改用 element
-                    is_data = True
-                else:
-                    select_el = td.query_selector("select")
-                    if select_el:
-                        val = select_el.input_value()
-                        is_data = True
-                        input_el = select_el # Treat select as input
-                    else:
-                        val = td.inner_text().strip()
-                
-                cell_info = {
-                    "value": val,
-                    "element": input_el, # 只有数据列才有 element
-                    "is_data": is_data
-                }
-                
-                # 填充网格
-                for r in range(rowspan):
-                    for c in range(colspan):
-                        target_row = current_row_idx + r
-                        target_col = current_col_idx + c
-                        if target_row not in grid: grid[target_row] = {}
-                        grid[target_row][target_col] = cell_info
-                
-                current_col_idx += colspan
-            current_row_idx += 1
-            
-        # 3. 区分规格列和数据列 (逻辑同 scrape_goods.py)
-        spec_col_indices = []
-        data_col_indices = []
-        
-        for idx, h in enumerate(headers):
-            h_lower = h.lower()
-            if any(k in h_lower for k in ["库存", "编号", "租金", "价格", "重量", "编码", "id"]):
-                data_col_indices.append(idx)
-            else:
-                has_input = False
-                for r in range(current_row_idx):
-                    if r in grid and idx in grid[r] and grid[r][idx]["is_data"]:
-                        has_input = True
-                        break
-                if has_input:
-                    data_col_indices.append(idx)
-                else:
-                    spec_col_indices.append(idx)
+        table = extract_sku_table(sku_table)
+        if not table:
+            return sku_map
 
-        # 4. 生成 SKU Map
-        for r in range(current_row_idx):
-            if r not in grid: continue
-            
-            # 生成 SKU Key
-            specs = []
-            for c in spec_col_indices:
-                if c in grid[r]:
-                    val = grid[r][c]["value"]
-                    if val:
-                        header_name = headers[c] if c < len(headers) else ""
-                        if header_name:
-                            specs.append(f"{header_name}：{val}")
-                        else:
-                            specs.append(val)
-            
-            sku_key = "|".join(specs)
+        controls = sku_table.query_selector_all(CONTROL_SELECTOR)
+
+        for r, (sku_key, data) in enumerate(iter_sku_table_rows(table)):
             sku_key = normalize_sku_key(sku_key)
-            
-            # 收集数据列的 Input 元素
+
+            # 收集数据列的 Input 元素 (select 也当作 input)
             data_inputs = {}
-            for c in data_col_indices:
-                if c in grid[r]:
-                    header_name = headers[c] if c < len(headers) else f"Col_{c}"
-                    el = grid[r][c]["element"]
-                    if el:
-                        data_inputs[header_name] = el
-            
+            for header_name, (_, control_idx) in data.items():
+                if 0 <= control_idx < len(controls):
+                    data_inputs[header_name] = controls[control_idx]
+
             sku_map[sku_key] = {
                 "row_idx": r,
                 "data_inputs": data_inputs
@@ -688,7 +587,7 @@ def run_update():
     try:
         p = sync_playwright().start()
         browser = p.chromium.launch(headless=HEADLESS)
-        context = browser.new_context()
+        context = RESOURCE_FILTER.attach(browser.new_context())
         page = context.new_page()
 
         # 登录
@@ -703,8 +602,7 @@ def run_update():
             # 访问编辑页
             edit_url = f"https://szguokuai.zlj.xyzulin.top/web/index.php?c=site&a=entry&m=ewei_shopv2&do=web&r=goods.edit&id={goods_id}&goodsfrom=sale&page=1"
             try:
-                page.goto(edit_url)
-                page.wait_for_load_state('domcontentloaded')
+                RESOURCE_FILTER.timed_load(page.goto, edit_url, wait_until='domcontentloaded')
                 
                 # 检查是否进入了正确的编辑页
                 if "r=goods.edit" not in page.url:
@@ -893,6 +791,7 @@ def run_update():
     except Exception as e:
         log_update(f"更新任务异常: {e}")
     finally:
+        log_update(RESOURCE_FILTER.summary())
         if browser:
             try: browser.close()
             except: pass
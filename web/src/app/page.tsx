@@ -1,7 +1,7 @@
 "use client";
 
 import { useCallback, useEffect, useState, Fragment, useRef, useMemo } from "react";
-import { GoodsGroup, GoodsItem, fetchGoods, runScrape, runPartialScrape, fetchTaskStatus, EXPORT_URL, updateMerchant, fetchConfig, updateConfig, saveRentCurve, deleteGoods, stopTask, updateAlipayCode } from "@/lib/api";
+import { GoodsGroup, GoodsItem, fetchGoods, fetchGoodsSkus, runScrape, runPartialScrape, fetchTaskStatus, EXPORT_URL, updateMerchant, fetchConfig, updateConfig, saveRentCurve, deleteGoods, stopTask, updateAlipayCode } from "@/lib/api";
 import { Button } from "@/components/ui/button";
 import { Table, TableBody, TableCell, TableHead, TableHeader, TableRow } from "@/components/ui/table";
 import { Checkbox } from "@/components/ui/checkbox";
@@ -163,6 +163,8 @@ export default function Home() {
   const [goods, setGoods] = useState<GoodsGroup[]>([]);
   const [selectedIds, setSelectedIds] = useState<Set<string>>(new Set());
   const [expandedIds, setExpandedIds] = useState<Set<string>>(new Set());
+  // SKU rows are loaded on first expand, keyed by goods ID
+  const [skusById, setSkusById] = useState<Record<string, GoodsItem[]>>({});
   const [loading, setLoading] = useState(false);
   
   // 提取曲线状态
@@ -216,6 +218,7 @@ export default function Home() {
       const res = await fetchGoods(page, pageSize, false, merchantParam, syncStatusFilter, sortBy, sortDesc);
       setGoods(Array.isArray(res.data) ? res.data : []);
       setTotal(typeof res.total === "number" ? res.total : 0);
+      setSkusById({});
     } catch (e) {
       if (!suppressToast) toast.error("加载数据失败: " + String(e));
       setGoods([]);
@@ -271,6 +274,11 @@ export default function Home() {
       newSet.delete(id);
     } else {
       newSet.add(id);
+      if (!skusById[id]) {
+        fetchGoodsSkus(id)
+          .then(skus => setSkusById(prev => ({ ...prev, [id]: skus })))
+          .catch(e => toast.error("加载SKU失败: " + String(e)));
+      }
     }
     setExpandedIds(newSet);
   };
@@ -860,7 +868,12 @@ export default function Home() {
                                             </TableRow>
                                         </TableHeader>
                                         <TableBody>
-                                            {group.skus.map((sku, idx) => {
+                                            {!skusById[group.ID] && (
+                                                <TableRow>
+                                                    <TableCell colSpan={RENT_DAYS.length + PRICE_COLS.length + 4} className="text-center text-muted-foreground">加载中...</TableCell>
+                                                </TableRow>
+                                            )}
+                                            {(skusById[group.ID] ?? []).map((sku, idx) => {
                                                 const { anomalyDays } = getRentInfo(sku);
                                                 return (
                                                 <TableRow key={idx} className="hover:bg-muted/30">
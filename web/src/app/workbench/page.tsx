@@ -2,7 +2,7 @@
 
 import { useEffect, useState, Suspense, useMemo, useCallback, useRef } from "react";
 import { useRouter, useSearchParams } from "next/navigation";
-import { GoodsItem, fetchGoods, prepareUpdate, triggerUpdate, fetchLogs, fetchTaskStatus, updateAlipayCode, RentCurve, fetchRentCurves, startAutomation, getAutomationStatus, submitCaptcha, stopTask, AutomationStatus } from "@/lib/api";
+import { GoodsItem, streamGoods, MAX_STREAM_IDS, prepareUpdate, triggerUpdate, fetchLogs, fetchTaskStatus, updateAlipayCode, RentCurve, fetchRentCurves, startAutomation, getAutomationStatus, submitCaptcha, stopTask, AutomationStatus } from "@/lib/api";
 import { Button } from "@/components/ui/button";
 import { Input } from "@/components/ui/input";
 import { Table, TableBody, TableCell, TableHead, TableHeader, TableRow } from "@/components/ui/table";
@@ -259,19 +259,25 @@ function WorkbenchContent() {
       return;
     }
 
+    let cancelled = false;
     const loadSelectedGoods = async () => {
       try {
-        // Fetch all data for editing to ensure we find the IDs
-        const response = await fetchGoods(1, 10000, true);
-        const allGroups = response.data;
-        const selectedGroups = allGroups.filter(g => ids.includes(g.ID));
-        const allSkus = selectedGroups.flatMap(g => g.skus);
-        setItems(allSkus);
+        // Stream only the selected IDs, appending their SKUs as each batch arrives
+        setItems([]);
+        for (let start = 0; start < ids.length && !cancelled; start += MAX_STREAM_IDS) {
+          await streamGoods({ withSkus: true, ids: ids.slice(start, start + MAX_STREAM_IDS) }, groups => {
+            const skus = groups.flatMap(g => g.skus ?? []);
+            if (!cancelled && skus.length > 0) setItems(prev => [...prev, ...skus]);
+          });
+        }
       } catch {
         toast.error("加载商品数据失败");
       }
     };
     loadSelectedGoods();
+    return () => {
+      cancelled = true;
+    };
   }, [searchParams, router]);
 
   // 日志轮询
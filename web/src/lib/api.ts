@@ -25,7 +25,10 @@ export interface GoodsGroup {
   "2级分类"?: string;
   "3级分类"?: string;
   库存: number;
-  skus: GoodsItem[];
+  "1天租金"?: string;
+  sku_count?: number;
+  // Only present when requested with withSkus; otherwise load per item with fetchGoodsSkus
+  skus?: GoodsItem[];
   merchant?: string;
   是否同步支付宝?: string;
   最近提交时间?: string;
@@ -183,7 +186,7 @@ async function fetchApi<T>(endpoint: string, options: RequestInit = {}, errorMes
 }
 
 export async function fetchRentCurves(): Promise<RentCurve[]> {
-  return fetchApi<RentCurve[]>("/rent-curves", { cache: 'no-store' }, "Failed to fetch rent curves");
+  return fetchApi<RentCurve[]>("/rent-curves", { cache: 'no-cache' }, "Failed to fetch rent curves");
 }
 
 export async function saveRentCurve(curve: RentCurve) {
@@ -208,7 +211,7 @@ export interface FetchGoodsResponse {
   total_pages: number;
 }
 
-export async function fetchGoods(page: number, limit: number, allData = false, merchant?: string, syncStatus?: string, sortBy?: string, sortDesc?: boolean): Promise<FetchGoodsResponse> {
+export async function fetchGoods(page: number, limit: number, allData = false, merchant?: string, syncStatus?: string, sortBy?: string, sortDesc?: boolean, withSkus = false): Promise<FetchGoodsResponse> {
   const params = new URLSearchParams({
     page: page.toString(),
     limit: limit.toString(),
@@ -218,8 +221,79 @@ export async function fetchGoods(page: number, limit: number, allData = false, m
   if (syncStatus) params.append("sync_status", syncStatus);
   if (sortBy) params.append("sort_by", sortBy);
   if (sortDesc !== undefined) params.append("sort_desc", sortDesc ? "true" : "false");
+  if (withSkus) params.append("with_skus", "true");
 
-  return fetchApi<FetchGoodsResponse>(`/goods?${params.toString()}`, { cache: "no-store" }, "Failed to fetch goods");
+  return fetchApi<FetchGoodsResponse>(`/goods?${params.toString()}`, { cache: "no-cache" }, "Failed to fetch goods");
+}
+
+export interface StreamGoodsOptions {
+  merchant?: string;
+  syncStatus?: string;
+  sortBy?: string;
+  sortDesc?: boolean;
+  withSkus?: boolean;
+  ids?: string[];
+}
+
+// Server-side cap on ids per /goods/stream request
+export const MAX_STREAM_IDS = 500;
+
+// Reads /goods/stream (NDJSON, one GoodsGroup per line) and hands over each batch of groups as it arrives
+export async function streamGoods(options: StreamGoodsOptions, onGroups: (groups: GoodsGroup[]) => void): Promise<number> {
+  const params = new URLSearchParams();
+  if (options.merchant) params.append("merchant", options.merchant);
+  if (options.syncStatus) params.append("sync_status", options.syncStatus);
+  if (options.sortBy) params.append("sort_by", options.sortBy);
+  if (options.sortDesc !== undefined) params.append("sort_desc", options.sortDesc ? "true" : "false");
+  if (options.withSkus === false) params.append("with_skus", "false");
+  if (options.ids) params.append("ids", options.ids.join(","));
+  const endpoint = `/goods/stream?${params.toString()}`;
+
+  let res: Response;
+  try {
+    res = await fetch(`${API_BASE}${endpoint}`, { cache: "no-store" });
+  } catch (e) {
+    if (isServer || API_BASE === "/api") throw e;
+    res = await fetch(`/api${endpoint}`, { cache: "no-store" });
+  }
+  if (!res.ok || !res.body) {
+    throw new Error(`Failed to stream goods: ${res.status}`);
+  }
+
+  const reader = res.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = "";
+  let count = 0;
+  const flush = (lines: string[]) => {
+    const groups: GoodsGroup[] = [];
+    for (const line of lines) {
+      if (!line.trim()) continue;
+      const data = JSON.parse(line);
+      if (hasErrorStatus(data)) {
+        throw new Error(getErrorMessage(data) || "Failed to stream goods");
+      }
+      groups.push(data as GoodsGroup);
+    }
+    if (groups.length > 0) {
+      count += groups.length;
+      onGroups(groups);
+    }
+  };
+  while (true) {
+    const { done, value } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+    const lines = buffer.split("\n");
+    buffer = lines.pop() ?? "";
+    flush(lines);
+  }
+  flush([buffer + decoder.decode()]);
+  return count;
+}
+
+export async function fetchGoodsSkus(id: string): Promise<GoodsItem[]> {
+  const res = await fetchApi<{ ID: string; skus: GoodsItem[] }>(`/goods/${id}/skus`, { cache: "no-cache" }, "Failed to fetch SKUs");
+  return Array.isArray(res.skus) ? res.skus : [];
 }
 
 export const runScrape = async (): Promise<Record<string, unknown>> => {
@@ -280,7 +354,7 @@ export async function deleteGoods(id: string) {
 
 export async function fetchConfig(): Promise<Record<string, string>> {
   try {
-    return await fetchApi<Record<string, string>>("/config", {}, "Failed to fetch config");
+    return await fetchApi<Record<string, string>>("/config", { cache: "no-cache" }, "Failed to fetch config");
   } catch (e) {
     console.error(e);
     return {};